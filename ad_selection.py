@@ -0,0 +1,167 @@
+import itertools
+import random
+import sqlite3
+import threading
+import time
+
+HISTORY_WINDOW = 30 * 24 * 3600
+
+
+class RoundRobinPolicy:
+    """Try the availability domains in turn, regardless of their past outcomes.
+
+    Args:
+        ad_names (list): The availability domains to launch in.
+    """
+
+    def __init__(self, ad_names):
+        self.ad_names = itertools.cycle(ad_names)
+
+    def choose(self):
+        """Pick the availability domain of the next launch attempt.
+
+        Returns:
+            str: The availability domain name.
+        """
+        return next(self.ad_names)
+
+    def record(self, ad_name, success):
+        """Register the outcome of a launch attempt.
+
+        Args:
+            ad_name (str): The availability domain the attempt was made in.
+            success (bool): True if the instance was launched, False if it was out of capacity.
+        """
+
+
+class AttemptHistory:
+    """Small SQLite store of launch attempts, one row per attempt.
+
+    Rows older than HISTORY_WINDOW are pruned when the store is opened.
+
+    Args:
+        path (str): The SQLite database file.
+    """
+
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.execute("CREATE TABLE IF NOT EXISTS attempts "
+                                    "(ad TEXT NOT NULL, time REAL NOT NULL, success INTEGER NOT NULL)")
+            self.connection.execute("DELETE FROM attempts WHERE time < ?", (time.time() - HISTORY_WINDOW,))
+
+    def add(self, ad_name, timestamp, success):
+        with self.lock, self.connection:
+            self.connection.execute("INSERT INTO attempts VALUES (?, ?, ?)", (ad_name, timestamp, int(success)))
+
+    def rows(self):
+        with self.lock:
+            return self.connection.execute("SELECT ad, time, success FROM attempts").fetchall()
+
+    def close(self):
+        """Close the database."""
+        with self.lock:
+            self.connection.close()
+
+
+class BanditPolicy:
+    """Thompson sampling over the availability domains, learning from past launch outcomes.
+
+    Every attempt is weighted by its age (halving every ``half_life`` seconds) and
+    counts double when it was made within an hour of the current time of day, so
+    recent capacity and the hours it tends to show up in pull attempts towards an AD.
+
+    Args:
+        ad_names (list): The availability domains to launch in.
+        history (AttemptHistory): The store of past attempts.
+        half_life (float): Seconds after which an attempt counts half as much.
+        seed (int, optional): Seed of the random generator. Defaults to None.
+    """
+
+    def __init__(self, ad_names, history, half_life, seed=None):
+        self.ad_names = list(ad_names)
+        self.history = history
+        self.half_life = half_life
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        # Per AD and hour of day: [successes, failures] decayed to self.updated_at
+        self.stats = {ad_name: [[0.0, 0.0] for _ in range(24)] for ad_name in self.ad_names}
+        self.updated_at = time.time()
+        for ad_name, timestamp, success in history.rows():
+            if ad_name in self.stats:
+                self._add(ad_name, timestamp, success)
+
+    def _decay(self, now):
+        factor = 0.5 ** ((now - self.updated_at) / self.half_life)
+        if factor < 1:
+            for hours in self.stats.values():
+                for counts in hours:
+                    counts[0] *= factor
+                    counts[1] *= factor
+        self.updated_at = max(self.updated_at, now)
+
+    def _add(self, ad_name, timestamp, success):
+        weight = 0.5 ** (max(0.0, self.updated_at - timestamp) / self.half_life)
+        self.stats[ad_name][time.localtime(timestamp).tm_hour][0 if success else 1] += weight
+
+    def _posterior(self, ad_name, hour):
+        successes = failures = 0.0
+        for offset, (hour_successes, hour_failures) in enumerate(self.stats[ad_name]):
+            distance = min((offset - hour) % 24, (hour - offset) % 24)
+            weight = 2.0 if distance <= 1 else 1.0
+            successes += weight * hour_successes
+            failures += weight * hour_failures
+        return 1 + successes, 1 + failures
+
+    def choose(self):
+        """Pick the availability domain of the next launch attempt.
+
+        Returns:
+            str: The availability domain name.
+        """
+        now = time.time()
+        hour = time.localtime(now).tm_hour
+        with self.lock:
+            self._decay(now)
+            samples = {ad_name: self.random.betavariate(*self._posterior(ad_name, hour))
+                       for ad_name in self.ad_names}
+        return max(samples, key=samples.get)
+
+    def record(self, ad_name, success):
+        """Register the outcome of a launch attempt.
+
+        Args:
+            ad_name (str): The availability domain the attempt was made in.
+            success (bool): True if the instance was launched, False if it was out of capacity.
+        """
+        if ad_name not in self.stats:
+            return
+        now = time.time()
+        with self.lock:
+            self._decay(now)
+            self._add(ad_name, now, success)
+        self.history.add(ad_name, now, success)
+
+
+def create_ad_policy(name, ad_names, history, half_life):
+    """Build the availability domain selection policy configured in AD_SELECTION_POLICY.
+
+    Args:
+        name (str): "round_robin" or "bandit".
+        ad_names (list): The availability domains to launch in.
+        history (AttemptHistory): The store of past attempts, used by "bandit". Policies
+            built again, e.g. when the ADs are split differently, share the same one.
+        half_life (float): Seconds after which an attempt counts half as much, used by "bandit".
+
+    Returns:
+        RoundRobinPolicy or BanditPolicy: The policy.
+
+    Raises:
+        ValueError: If the policy name is unknown.
+    """
+    if name == "round_robin":
+        return RoundRobinPolicy(ad_names)
+    if name == "bandit":
+        return BanditPolicy(ad_names, history, half_life)
+    raise ValueError(f"{name} is not an acceptable AD selection policy")
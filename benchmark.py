@@ -0,0 +1,289 @@
+"""Offline time-to-capacity benchmark for main.py.
+
+Runs launch_instance() repeatedly against the fake clients in fake_oci.py on a
+simulated clock and reports attempts per minute, p50/p99 time to the first
+instance and the API calls wasted on throttling, server errors and duplicates.
+With --memory it also traces the memory the launch loop keeps over the run, and
+with --startup it instead times importing main.py and ``main.py --check``.
+
+Example:
+    python benchmark.py --capacity AD-1=0.01,AD-2=0.02,AD-3=0.005 --trials 50 \\
+        --env CONCURRENT_AD_LAUNCH=True --env CAPACITY_RETRY_SECS=15
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import fake_oci
+from jobs import DEFAULT_JOB
+from settings import Settings
+
+REPO_DIR = Path(__file__).resolve().parent
+FAKE_USER_ID = "ocid1.user.oc1..fake"
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile.
+
+    Args:
+        values (list): The values.
+        pct (float): The percentile, between 0 and 100.
+
+    Returns:
+        float: The percentile, or None if there are no values.
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * pct // 100))
+    return ordered[int(rank) - 1]
+
+
+def prepare_workdir(workdir, env):
+    """Write the files main.py expects into the trial directory.
+
+    Args:
+        workdir (Path): The directory the trial runs in.
+        env (dict): Extra environment variables for main.py.
+
+    Returns:
+        dict: The environment variables main.py should run with.
+    """
+    key_file = workdir / "oci_api_key.pem"
+    key_file.write_text("fake key", encoding="utf-8")
+    oci_config = workdir / "oci_config"
+    oci_config.write_text(f"[DEFAULT]\nuser={FAKE_USER_ID}\nfingerprint=00:00\ntenancy={FAKE_USER_ID}\n"
+                          f"region=fake-region-1\nkey_file={key_file}\n", encoding="utf-8")
+    ssh_key = workdir / "id_rsa.pub"
+    ssh_key.write_text("ssh-rsa AAAAfake benchmark", encoding="utf-8")
+    shutil.copy(REPO_DIR / "email_content.html", workdir / "email_content.html")
+    trial_env = {
+        "OCI_CONFIG": str(oci_config),
+        "SSH_AUTHORIZED_KEYS_FILE": str(ssh_key),
+        "DISPLAY_NAME": "benchmark",
+        "REQUEST_WAIT_TIME_SECS": "60",
+        "OPERATING_SYSTEM": "Canonical Ubuntu",
+        "OS_VERSION": "22.04",
+        "NOTIFY_EMAIL": "False",
+    }
+    trial_env.update(env)
+    return trial_env
+
+
+def run_trial(model, env, memory=False):
+    """Run launch_instance() once against a fake tenancy.
+
+    Args:
+        model (fake_oci.CapacityModel): The capacity model.
+        env (dict): Extra environment variables for main.py.
+        memory (bool, optional): Whether to sample the traced memory every simulated
+            hour. Defaults to False.
+
+    Returns:
+        dict: Time to first instance, elapsed time, launch attempts and API call counts,
+        and with memory the traced memory after the first simulated day and at the end.
+    """
+    import main
+
+    clock = fake_oci.SimulatedClock()
+    tenancy = fake_oci.FakeTenancy(model, clock)
+    samples = {}
+    if memory:
+        # Traced memory at the first call of each simulated hour
+        tenancy.probe = lambda now: samples.setdefault(int(now // 3600), tracemalloc.get_traced_memory()[0])
+        tracemalloc.start()
+    cwd = os.getcwd()
+    workdir = Path(tempfile.mkdtemp(prefix="oci_benchmark"))
+    settings = Settings(prepare_workdir(workdir, env))
+    os.chdir(workdir)
+    log_pipeline = main.setup_logging(settings)
+    try:
+        main.metrics = main.Metrics()
+        main.init_runtime(settings)
+        job, = main.create_jobs([(DEFAULT_JOB, settings)], fake_oci.FakeClients(tenancy))
+        clock.install()
+        try:
+            if settings.fleet:
+                main.launch_fleet(job)
+            else:
+                main.launch_instance(job)
+        except fake_oci.SimulationTimeout:
+            pass
+    finally:
+        if memory:
+            samples["end"] = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+        fake_oci.SimulatedClock.uninstall()
+        main.notifier.close()
+        log_pipeline.stop()
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    hours = sorted(hour for hour in samples if hour != "end")
+    return {
+        "memory_after_day_one": samples[min(24, hours[-1])] if hours else None,
+        "memory_at_end": samples.get("end"),
+        "time_to_first_instance": tenancy.first_instance_at,
+        "elapsed": clock.elapsed,
+        "launch_attempts": tenancy.launch_attempts,
+        "api_calls": tenancy.total_calls,
+        "wasted_calls": tenancy.wasted_calls,
+        "duplicates": tenancy.duplicates,
+        "errors": dict(tenancy.errors),
+    }
+
+
+def time_startup(runs):
+    """Time a cold ``import main`` and ``main.py --check`` in fresh interpreters.
+
+    Args:
+        runs (int): Number of runs of each command.
+
+    Returns:
+        dict: Median wall time of each command, in milliseconds.
+    """
+    workdir = Path(tempfile.mkdtemp(prefix="oci_benchmark"))
+    try:
+        env = prepare_workdir(workdir, {"OCT_FREE_AD": "AD-1"})
+        (workdir / "oci.env").write_text("".join(f"{key}={value}\n" for key, value in env.items()),
+                                         encoding="utf-8")
+        process_env = dict(os.environ, PYTHONPATH=str(REPO_DIR))
+        commands = {
+            "import_main_ms": [sys.executable, "-c", "import main"],
+            "check_config_ms": [sys.executable, str(REPO_DIR / "main.py"), "--check"],
+        }
+        report = {}
+        for name, command in commands.items():
+            durations = []
+            for _ in range(runs):
+                start = time.perf_counter()
+                subprocess.run(command, cwd=workdir, env=process_env, check=True, stdout=subprocess.DEVNULL)
+                durations.append((time.perf_counter() - start) * 1000)
+            report[name] = statistics.median(durations)
+        return report
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def summarize(results):
+    """Aggregate the trials into the benchmark report.
+
+    Args:
+        results (list): The dicts returned by run_trial.
+
+    Returns:
+        dict: The report.
+    """
+    ttfi = [result["time_to_first_instance"] for result in results
+            if result["time_to_first_instance"] is not None]
+    minutes = sum(result["elapsed"] for result in results) / 60
+    errors = {}
+    for result in results:
+        for code, count in result["errors"].items():
+            errors[code] = errors.get(code, 0) + count
+    return {
+        "trials": len(results),
+        "instances_created": len(ttfi),
+        "attempts_per_minute": sum(result["launch_attempts"] for result in results) / minutes if minutes else 0,
+        "p50_time_to_first_instance": percentile(ttfi, 50),
+        "p99_time_to_first_instance": percentile(ttfi, 99),
+        "p50_run_time": percentile([result["elapsed"] for result in results], 50),
+        "api_calls": sum(result["api_calls"] for result in results),
+        "api_calls_wasted": sum(result["wasted_calls"] for result in results),
+        "duplicate_instances": sum(result["duplicates"] for result in results),
+        "errors": errors,
+        "memory_after_day_one": max((result["memory_after_day_one"] for result in results
+                                     if result["memory_after_day_one"] is not None), default=None),
+        "memory_at_end": max((result["memory_at_end"] for result in results
+                              if result["memory_at_end"] is not None), default=None),
+    }
+
+
+def parse_capacity(value):
+    capacity = {}
+    for item in value.split(","):
+        ad_suffix, probability = item.split("=")
+        capacity[ad_suffix.strip()] = float(probability)
+    return capacity
+
+
+def parse_outage(value):
+    start, duration = value.split("=")
+    return float(start) * 60, float(duration) * 60
+
+
+def parse_env(values):
+    return dict(value.split("=", 1) for value in values or [])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark time to capacity against a fake OCI tenancy.")
+    parser.add_argument("--capacity", type=parse_capacity, default=parse_capacity("AD-1=0.01"),
+                        help="Comma separated AD=probability of capacity per launch attempt")
+    parser.add_argument("--trials", type=int, default=20, help="Number of runs to aggregate")
+    parser.add_argument("--latency-median", type=float, default=0.3, help="Median API latency in seconds")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="Sigma of the log-normal latency")
+    parser.add_argument("--rate-limit", type=float, default=20, help="API calls per minute before 429s, 0 disables")
+    parser.add_argument("--server-error-rate", type=float, default=0.01, help="Probability of a 502/InternalError")
+    parser.add_argument("--ambiguous-success-rate", type=float, default=0.0,
+                        help="Probability a successful launch answers 504 GatewayTimeout")
+    parser.add_argument("--horizon", type=float, default=7 * 24 * 3600, help="Simulated seconds per trial")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the first trial")
+    parser.add_argument("--outage", type=parse_outage, action="append", default=[], metavar="START=DURATION",
+                        help="Minutes into the trial and minutes of an incident answering 503, can be repeated")
+    parser.add_argument("--env", action="append", metavar="KEY=VALUE",
+                        help="oci.env setting for main.py, can be repeated")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    parser.add_argument("--memory", action="store_true",
+                        help="Trace the memory kept by the launch loop, e.g. over a week of --capacity AD-1=0")
+    parser.add_argument("--startup", action="store_true",
+                        help="Time starting main.py instead, --trials is the number of runs")
+    args = parser.parse_args()
+
+    if args.startup:
+        report = time_startup(args.trials)
+        if args.json:
+            print(json.dumps(report, indent=2))
+            return
+        print(f"import main:             {report['import_main_ms']:.0f} ms")
+        print(f"main.py --check:         {report['check_config_ms']:.0f} ms")
+        return
+
+    env = {"OCT_FREE_AD": ",".join(args.capacity)}
+    env.update(parse_env(args.env))
+    results = []
+    for trial in range(args.trials):
+        model = fake_oci.CapacityModel(args.capacity, args.latency_median, args.latency_sigma, args.rate_limit,
+                                       args.server_error_rate, args.ambiguous_success_rate, args.horizon,
+                                       seed=args.seed + trial, outages=args.outage)
+        results.append(run_trial(model, env, args.memory))
+    report = summarize(results)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(f"Trials:                  {report['trials']} ({report['instances_created']} got an instance)")
+    print(f"Attempts per minute:     {report['attempts_per_minute']:.2f}")
+    for pct in ("p50", "p99"):
+        value = report[f"{pct}_time_to_first_instance"]
+        print(f"{pct} time to instance:    " + (f"{value / 60:.1f} min" if value is not None else "n/a"))
+    print(f"p50 run time:            {report['p50_run_time'] / 60:.1f} min")
+    print(f"API calls:               {report['api_calls']}")
+    print(f"API calls wasted:        {report['api_calls_wasted']}")
+    print(f"Duplicate instances:     {report['duplicate_instances']}")
+    print(f"Errors:                  {report['errors']}")
+    if report["memory_at_end"] is not None:
+        print(f"Traced memory day 1/end: {report['memory_after_day_one'] / 1024:.0f} KB / "
+              f"{report['memory_at_end'] / 1024:.0f} KB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,505 @@
+"""Coordination of several runners launching in the same tenancy.
+
+Runners sharing a COORDINATION_URL register with a heartbeat, split the
+availability domains and the API rate limit between them, and take a lease
+before each launch so two of them never launch the same instance at once.
+
+The URL is either a SQLite file, for runners on one host or a shared filesystem
+with working locks, or the address of the lease server started with
+``python3 coordination.py --port 8470``. Clients send the server's
+COORDINATION_TOKEN as a bearer token.
+"""
+import argparse
+import hmac
+import ipaddress
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+# Seconds a runner is counted after its last heartbeat
+RUNNER_TTL = 60
+# Seconds to wait before trying again for a lease held by another runner
+LEASE_POLL_SECS = 2
+# Heartbeats per RUNNER_TTL, so one missed heartbeat doesn't drop a runner
+HEARTBEATS_PER_TTL = 3
+
+
+class CoordinationError(Exception):
+    """Raised when the coordination backend can't be reached."""
+
+
+def default_runner_id():
+    """str: An id for this runner, unique across hosts."""
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+class LeaseTable:
+    """Runners, leases and marks in one SQLite database shared by every runner.
+
+    Every operation is a single statement, so SQLite's file lock keeps them atomic
+    across processes.
+
+    Args:
+        path (str): The SQLite database file.
+        runner_ttl (float, optional): Seconds a runner is counted after its last
+            heartbeat. Defaults to RUNNER_TTL.
+    """
+
+    def __init__(self, path, runner_ttl=RUNNER_TTL):
+        self.runner_ttl = runner_ttl
+        self.lock = threading.Lock()
+        try:
+            self.connection = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+            with self.lock:
+                self.connection.execute("CREATE TABLE IF NOT EXISTS runners "
+                                        "(id TEXT PRIMARY KEY, seen_at REAL NOT NULL)")
+                self.connection.execute("CREATE TABLE IF NOT EXISTS leases "
+                                        "(name TEXT PRIMARY KEY, holder TEXT NOT NULL, expires_at REAL NOT NULL)")
+                self.connection.execute("CREATE TABLE IF NOT EXISTS marks "
+                                        "(name TEXT PRIMARY KEY, value TEXT NOT NULL, marked_at REAL NOT NULL)")
+        except sqlite3.Error as err:
+            raise CoordinationError(f"Can't open {path}: {err}") from err
+
+    def _execute(self, statement, parameters=()):
+        try:
+            with self.lock:
+                cursor = self.connection.execute(statement, parameters)
+                return cursor.rowcount, cursor.fetchall()
+        except sqlite3.Error as err:
+            raise CoordinationError(str(err)) from err
+
+    def heartbeat(self, runner_id):
+        """Register a runner as alive.
+
+        Args:
+            runner_id (str): The runner.
+
+        Returns:
+            list: The ids of every live runner, sorted.
+        """
+        now = time.time()
+        self._execute("INSERT OR REPLACE INTO runners VALUES (?, ?)", (runner_id, now))
+        self._execute("DELETE FROM runners WHERE seen_at < ?", (now - self.runner_ttl,))
+        return [row[0] for row in self._execute("SELECT id FROM runners ORDER BY id")[1]]
+
+    def leave(self, runner_id):
+        """Unregister a runner and drop its leases.
+
+        Args:
+            runner_id (str): The runner.
+        """
+        self._execute("DELETE FROM runners WHERE id = ?", (runner_id,))
+        self._execute("DELETE FROM leases WHERE holder = ?", (runner_id,))
+
+    def acquire(self, name, holder, ttl):
+        """Take or extend a lease, unless another runner holds it.
+
+        Args:
+            name (str): The lease.
+            holder (str): The runner taking it.
+            ttl (float): Seconds until the lease expires if it isn't released.
+
+        Returns:
+            bool: True if holder now holds the lease.
+        """
+        now = time.time()
+        changed, _ = self._execute(
+            "INSERT INTO leases VALUES (?, ?, ?) ON CONFLICT(name) DO UPDATE SET "
+            "holder = excluded.holder, expires_at = excluded.expires_at "
+            "WHERE leases.holder = excluded.holder OR leases.expires_at <= ?",
+            (name, holder, now + ttl, now))
+        return changed > 0
+
+    def release(self, name, holder):
+        """Release a lease held by holder.
+
+        Args:
+            name (str): The lease.
+            holder (str): The runner holding it.
+        """
+        self._execute("DELETE FROM leases WHERE name = ? AND holder = ?", (name, holder))
+
+    def mark(self, name, value):
+        """Record a value every runner can read, e.g. the instance a launch created.
+
+        Args:
+            name (str): The mark.
+            value (str): Its value, None removes the mark.
+        """
+        if value is None:
+            self._execute("DELETE FROM marks WHERE name = ?", (name,))
+        else:
+            self._execute("INSERT OR REPLACE INTO marks VALUES (?, ?, ?)", (name, value, time.time()))
+
+    def marked(self, name, max_age):
+        """Read a mark.
+
+        Args:
+            name (str): The mark.
+            max_age (float): Seconds after which the mark is ignored.
+
+        Returns:
+            str: Its value, or None.
+        """
+        rows = self._execute("SELECT value FROM marks WHERE name = ? AND marked_at >= ?",
+                             (name, time.time() - max_age))[1]
+        return rows[0][0] if rows else None
+
+
+class LocalCoordinator:
+    """Coordinator of a runner that runs alone: every lease is granted."""
+
+    def __init__(self):
+        self.marks = {}
+
+    def heartbeat(self, runner_id):
+        return [runner_id]
+
+    def leave(self, runner_id):
+        pass
+
+    def acquire(self, name, holder, ttl):
+        return True
+
+    def release(self, name, holder):
+        pass
+
+    def mark(self, name, value):
+        if value is None:
+            self.marks.pop(name, None)
+        else:
+            self.marks[name] = (value, time.time())
+
+    def marked(self, name, max_age):
+        value, marked_at = self.marks.get(name, (None, 0))
+        return value if marked_at >= time.time() - max_age else None
+
+
+class HttpCoordinator:
+    """Client of the lease server, with the same methods as LeaseTable.
+
+    Args:
+        url (str): Base URL of the lease server, e.g. http://10.0.0.2:8470.
+        session (requests.Session): The HTTP session to send requests with.
+        timeout (float or tuple): Timeout in seconds, or (connect, read) timeouts.
+        token (str, optional): The server's token. Defaults to none.
+    """
+
+    def __init__(self, url, session, timeout, token=""):
+        self.url = url.rstrip("/")
+        self.session = session
+        self.timeout = timeout
+        self.headers = {"Authorization": f"Bearer {token}"} if token else {}
+
+    def _call(self, operation, **payload):
+        import requests
+
+        try:
+            response = self.session.post(f"{self.url}/{operation}", json=payload, headers=self.headers,
+                                         timeout=self.timeout)
+            response.raise_for_status()
+            return response.json().get("result")
+        except (requests.RequestException, ValueError) as err:
+            raise CoordinationError(f"Lease server {self.url}: {err}") from err
+
+    def heartbeat(self, runner_id):
+        return self._call("heartbeat", runner_id=runner_id)
+
+    def leave(self, runner_id):
+        self._call("leave", runner_id=runner_id)
+
+    def acquire(self, name, holder, ttl):
+        return self._call("acquire", name=name, holder=holder, ttl=ttl)
+
+    def release(self, name, holder):
+        self._call("release", name=name, holder=holder)
+
+    def mark(self, name, value):
+        self._call("mark", name=name, value=value)
+
+    def marked(self, name, max_age):
+        return self._call("marked", name=name, max_age=max_age)
+
+
+def create_coordinator(url, session=None, timeout=None, token=""):
+    """Build the coordinator for COORDINATION_URL.
+
+    Args:
+        url (str): Empty to run alone, an http(s):// lease server, or a SQLite file
+            path, optionally prefixed with sqlite://.
+        session (requests.Session, optional): HTTP session for the lease server.
+        timeout (float or tuple, optional): Timeout of lease server requests.
+        token (str, optional): COORDINATION_TOKEN of the lease server. Defaults to none.
+
+    Returns:
+        LocalCoordinator, LeaseTable or HttpCoordinator: The coordinator.
+
+    Raises:
+        CoordinationError: If the SQLite database can't be opened.
+    """
+    if not url:
+        return LocalCoordinator()
+    if url.startswith(("http://", "https://")):
+        if session is None:
+            import requests
+            session = requests.Session()
+        return HttpCoordinator(url, session, timeout, token)
+    if url.startswith("sqlite://"):
+        url = url[len("sqlite://"):]
+    return LeaseTable(os.path.expanduser(url))
+
+
+class RunnerGroup:
+    """This runner's view of the runners sharing a coordinator.
+
+    Membership is refreshed with a heartbeat HEARTBEATS_PER_TTL times per
+    RUNNER_TTL, from a background thread once start() is called so that a runner
+    sleeping through a long backoff stays counted, and otherwise when it's read.
+    If the coordinator can't be reached, the runner carries on alone rather than
+    stopping, and tries again at the next heartbeat.
+
+    Args:
+        coordinator: LocalCoordinator, LeaseTable or HttpCoordinator.
+        runner_id (str, optional): This runner's id. Defaults to default_runner_id().
+        heartbeat_interval (float, optional): Seconds between heartbeats. Defaults to
+            RUNNER_TTL / HEARTBEATS_PER_TTL.
+    """
+
+    def __init__(self, coordinator, runner_id=None, heartbeat_interval=RUNNER_TTL / HEARTBEATS_PER_TTL):
+        self.coordinator = coordinator
+        self.runner_id = runner_id or default_runner_id()
+        self.heartbeat_interval = heartbeat_interval
+        self.lock = threading.Lock()
+        self.runners = [self.runner_id]
+        self.refreshed_at = None
+        self.reachable = True
+        self.stopped = threading.Event()
+        self.heartbeat_thread = None
+
+    def _call(self, method, *args, fallback=None):
+        try:
+            result = getattr(self.coordinator, method)(*args)
+        except CoordinationError as err:
+            if self.reachable:
+                logging.warning("Coordination unavailable, running alone: %s", err)
+            self.reachable = False
+            return fallback
+        if not self.reachable:
+            logging.info("Coordination available again")
+        self.reachable = True
+        return result
+
+    def _heartbeat(self, force=False):
+        # Called with self.lock held
+        now = time.monotonic()
+        if force or self.refreshed_at is None or now - self.refreshed_at >= self.heartbeat_interval:
+            self.refreshed_at = now
+            runners = self._call("heartbeat", self.runner_id, fallback=[self.runner_id])
+            if runners != self.runners:
+                logging.info("Runners sharing the tenancy: %s", ", ".join(runners))
+            self.runners = runners
+
+    def start(self):
+        """Heartbeat from a background thread until leave(), a runner running alone doesn't need it."""
+        if isinstance(self.coordinator, LocalCoordinator) or self.heartbeat_thread is not None:
+            return
+
+        def beat():
+            while not self.stopped.wait(self.heartbeat_interval):
+                with self.lock:
+                    self._heartbeat(force=True)
+
+        with self.lock:
+            self._heartbeat(force=True)
+        self.heartbeat_thread = threading.Thread(target=beat, name="runner-heartbeat", daemon=True)
+        self.heartbeat_thread.start()
+
+    def membership(self):
+        """Heartbeat if due and return this runner's position.
+
+        Returns:
+            tuple: (index, count) of this runner among the live runners.
+        """
+        with self.lock:
+            self._heartbeat()
+            if self.runner_id not in self.runners:
+                return 0, 1
+            return self.runners.index(self.runner_id), len(self.runners)
+
+    def share(self):
+        """float: This runner's share of the tenancy-wide API rate limit."""
+        return 1 / self.membership()[1]
+
+    def shard(self, ad_names):
+        """Pick this runner's availability domains.
+
+        The ADs are split evenly between runners. With more runners than ADs,
+        several runners share each AD.
+
+        Args:
+            ad_names (list): The availability domains to launch in, in the same order on every runner.
+
+        Returns:
+            list: The availability domains of this runner.
+        """
+        index, count = self.membership()
+        if count <= 1 or not ad_names:
+            return list(ad_names)
+        if count <= len(ad_names):
+            return list(ad_names[index::count])
+        return [ad_names[index % len(ad_names)]]
+
+    def acquire(self, name, ttl):
+        """Take the lease of a launch, or extend it if this runner already holds it.
+
+        Args:
+            name (str): The lease, the same on every runner launching the instance.
+            ttl (float): Seconds until it expires if this runner goes away.
+
+        Returns:
+            bool: True if this runner holds the lease.
+        """
+        return self._call("acquire", name, self.runner_id, ttl, fallback=True)
+
+    def release(self, name):
+        """Release a lease held by this runner.
+
+        Args:
+            name (str): The lease.
+        """
+        self._call("release", name, self.runner_id)
+
+    def mark(self, name, value):
+        """Share a value with the other runners, e.g. the instance a launch created.
+
+        Args:
+            name (str): The mark.
+            value (str): Its value, None removes the mark.
+        """
+        self._call("mark", name, value)
+
+    def marked(self, name, max_age):
+        """Read a value shared by a runner.
+
+        Args:
+            name (str): The mark.
+            max_age (float): Seconds after which the mark is ignored, e.g. once a
+                launched instance should have shown up.
+
+        Returns:
+            str: Its value, or None.
+        """
+        return self._call("marked", name, max_age)
+
+    def leave(self):
+        """Stop the heartbeat, unregister this runner and release its leases, so the others pick
+        up its ADs and budget."""
+        self.stopped.set()
+        if self.heartbeat_thread is not None:
+            self.heartbeat_thread.join()
+            self.heartbeat_thread = None
+        self._call("leave", self.runner_id)
+
+
+def is_loopback(host):
+    """Whether an address to bind only accepts connections from this host.
+
+    Args:
+        host (str): The address or host name.
+
+    Returns:
+        bool: True for localhost and loopback addresses.
+    """
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def serve(table, port, host="127.0.0.1", token=""):
+    """Serve a lease table to HttpCoordinator clients until interrupted.
+
+    Args:
+        table (LeaseTable): The lease table.
+        port (int): The port to listen on.
+        host (str, optional): The address to bind. Defaults to localhost only.
+        token (str, optional): Bearer token every request must carry. Defaults to none,
+            which is only accepted on a loopback address.
+
+    Raises:
+        ValueError: If host isn't a loopback address and there is no token.
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    if not token and not is_loopback(host):
+        raise ValueError(f"Refusing to serve leases on {host} without a COORDINATION_TOKEN")
+    expected = f"Bearer {token}".encode("utf-8")
+
+    operations = {
+        "heartbeat": lambda body: table.heartbeat(body["runner_id"]),
+        "leave": lambda body: table.leave(body["runner_id"]),
+        "acquire": lambda body: table.acquire(body["name"], body["holder"], float(body["ttl"])),
+        "release": lambda body: table.release(body["name"], body["holder"]),
+        "mark": lambda body: table.mark(body["name"], body["value"]),
+        "marked": lambda body: table.marked(body["name"], float(body["max_age"])),
+    }
+
+
+    class LeaseHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            if token and not hmac.compare_digest(self.headers.get("Authorization", "").encode("utf-8"), expected):
+                self.send_error(401)
+                return
+            operation = operations.get(self.path.strip("/"))
+            if operation is None:
+                self.send_error(404)
+                return
+            try:
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                result = json.dumps({"result": operation(body)}).encode("utf-8")
+            except (ValueError, KeyError, TypeError) as err:
+                self.send_error(400, str(err))
+                return
+            except CoordinationError as err:
+                self.send_error(503, str(err))
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(result)))
+            self.end_headers()
+            self.wfile.write(result)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), LeaseHandler)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Lease server coordinating runners that share a tenancy.")
+    parser.add_argument("--port", type=int, default=8470, help="Port to listen on")
+    parser.add_argument("--host", default="127.0.0.1", help="Address to bind, 0.0.0.0 for every interface")
+    parser.add_argument("--db", default="coordination.db", help="SQLite file keeping the leases across restarts")
+    args = parser.parse_args()
+    # Read from the environment rather than an option, so it doesn't show in the process list
+    token = os.environ.get("COORDINATION_TOKEN", "").strip()
+    if not token and not is_loopback(args.host):
+        parser.error(f"set COORDINATION_TOKEN to serve on {args.host}")
+    print(f"Lease server listening on http://{args.host}:{args.port}")
+    serve(LeaseTable(args.db), args.port, args.host, token)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,432 @@
+"""Daemon mode: launch jobs that keep running, managed through a local control API.
+
+The API listens on http://127.0.0.1:CONTROL_PORT and answers JSON. Every request
+must carry ``Authorization: Bearer <CONTROL_TOKEN>``, and a body must be sent as
+``application/json``. Requests with an ``Origin`` header, i.e. made by a web page,
+are refused.
+
+- ``GET /status``: every job and its state.
+- ``POST /pause`` and ``POST /resume``: every job, or one with ``{"job": "<name>"}``.
+- ``POST /jobs``: add a job, ``{"name": "<name>", "settings": {"<VARIABLE>": "<value>"}}``.
+- ``DELETE /jobs/<name>``: cancel a job.
+- ``POST /reload``: read oci.env and JOBS_FILE again.
+"""
+import hmac
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+
+from jobs import SHARED_VARIABLES, job_settings
+from settings import ENV_VARIABLES
+
+# Job states
+RUNNING = "running"
+STOPPING = "stopping"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+# Where a job comes from
+CONFIG = "config"
+API = "api"
+
+
+class ManagedJob:
+    """A launch job run by the daemon in its own thread.
+
+    Args:
+        job (jobs.LaunchJob): The job.
+        source (str): CONFIG for the jobs of oci.env and JOBS_FILE, API for those added
+            through the control API.
+    """
+
+    def __init__(self, job, source):
+        self.job = job
+        self.source = source
+        self.state = RUNNING
+        self.started_at = time.time()
+        self.finished_at = None
+        self.thread = None
+        # The job taking over once this one has stopped, after a reload
+        self.replacement = None
+
+    def status(self):
+        """dict: The job's state and what it launches."""
+        job_config = self.job.settings
+        return {
+            "state": self.state,
+            "paused": not self.job.resumed.is_set(),
+            "source": self.source,
+            "shape": job_config.oci_compute_shape,
+            "display_name": job_config.display_name,
+            "availability_domains": job_config.oct_free_ad,
+            "fleet": job_config.env.get("FLEET") or None,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+def job_variables(job_config):
+    """dict: The oci.env variables of a job's own settings, to tell whether they changed."""
+    return {name: job_config.env.get(name) for name in ENV_VARIABLES if name not in SHARED_VARIABLES}
+
+
+class Daemon:
+    """Runs launch jobs until stopped and changes them while they run.
+
+    Every job runs in its own thread with the OCI clients, connection pool and
+    discovery cache of the process, so adding or restarting a job doesn't pay the
+    startup cost again. A reload restarts only the jobs whose settings changed.
+    The SHARED_VARIABLES are read at startup only.
+
+    Args:
+        load_settings (callable): Reads oci.env and JOBS_FILE again and returns the
+            Settings of oci.env and the (name, Settings) of every job.
+        create_jobs (callable): Builds LaunchJob objects from (name, Settings) tuples.
+        run_job (callable): Runs a LaunchJob to the end and returns True if it succeeded.
+        base_settings (settings.Settings): The configuration of oci.env at startup.
+        close (callable, optional): Called by stop() once the jobs have stopped, to
+            close what they shared, e.g. the connection pool. Defaults to None.
+    """
+
+    def __init__(self, load_settings, create_jobs, run_job, base_settings, close=None):
+        self.load_settings = load_settings
+        self.create_jobs = create_jobs
+        self.run_job = run_job
+        self.base_settings = base_settings
+        self.close = close
+        # The oci.env variables jobs added through the API start from, as of the last reload
+        self.env = base_settings.env
+        self.lock = threading.Lock()
+        self.jobs = {}
+        self.paused = False
+        self.stopping = False
+
+    def _start(self, job, source):
+        # Called with self.lock held
+        managed = ManagedJob(job, source)
+        if self.paused:
+            job.resumed.clear()
+        managed.thread = threading.Thread(target=self._run, args=(managed,), name=f"job-{job.name}",
+                                          daemon=True)
+        self.jobs[job.name] = managed
+        managed.thread.start()
+        return managed
+
+    def _run(self, managed):
+        succeeded = self.run_job(managed.job)
+        with self.lock:
+            managed.finished_at = time.time()
+            if managed.job.cancelled.is_set():
+                managed.state = CANCELLED
+            else:
+                managed.state = SUCCEEDED if succeeded else FAILED
+            replacement = managed.replacement
+            if replacement is not None and not self.stopping and self.jobs.get(managed.job.name) is managed:
+                self._start(replacement, CONFIG)
+                logging.info("Restarted launch job %s with its new settings", managed.job.name)
+
+    def _get(self, name):
+        if name not in self.jobs:
+            raise KeyError(f"No launch job named {name}")
+        return self.jobs[name]
+
+    def _cancel(self, managed):
+        # Called with self.lock held
+        if managed.state == RUNNING:
+            managed.state = STOPPING
+        managed.job.cancelled.set()
+
+    def start(self, jobs):
+        """Start jobs read from oci.env and JOBS_FILE.
+
+        Args:
+            jobs (list): The LaunchJob objects.
+        """
+        with self.lock:
+            for job in jobs:
+                self._start(job, CONFIG)
+
+    def status(self):
+        """Report every job.
+
+        Returns:
+            dict: Whether the daemon is paused, and the status of each job by name.
+        """
+        with self.lock:
+            return {"paused": self.paused, "jobs": {name: managed.status() for name, managed in self.jobs.items()}}
+
+    def pause(self, name=None):
+        """Pause one job or every job, including the jobs started later.
+
+        A paused job finishes the OCI call in flight and waits before the next one.
+
+        Args:
+            name (str, optional): The job. Defaults to every job.
+
+        Returns:
+            dict: The status, see status().
+
+        Raises:
+            KeyError: If there is no such job.
+        """
+        with self.lock:
+            managed_jobs = [self._get(name)] if name else list(self.jobs.values())
+            if not name:
+                self.paused = True
+            for managed in managed_jobs:
+                managed.job.resumed.clear()
+        logging.info("Paused %s", f"launch job {name}" if name else "every launch job")
+        return self.status()
+
+    def resume(self, name=None):
+        """Resume one job or every job.
+
+        Args:
+            name (str, optional): The job. Defaults to every job.
+
+        Returns:
+            dict: The status, see status().
+
+        Raises:
+            KeyError: If there is no such job.
+        """
+        with self.lock:
+            managed_jobs = [self._get(name)] if name else list(self.jobs.values())
+            if not name:
+                self.paused = False
+            for managed in managed_jobs:
+                managed.job.resumed.set()
+        logging.info("Resumed %s", f"launch job {name}" if name else "every launch job")
+        return self.status()
+
+    def add(self, name, overrides):
+        """Start a new job.
+
+        Args:
+            name (str): Name of the job.
+            overrides (dict): oci.env variables of the job, like a section of JOBS_FILE.
+
+        Returns:
+            dict: The status, see status().
+
+        Raises:
+            ConfigError: If the settings can't be used.
+            ValueError: If a job with that name is still running.
+        """
+        if not name or "/" in name:
+            raise ValueError("A job needs a name without /")
+        new_settings = job_settings(name, self.env, {str(key): str(value) for key, value in overrides.items()})
+        with self.lock:
+            if name in self.jobs and self.jobs[name].state in (RUNNING, STOPPING):
+                raise ValueError(f"Launch job {name} is already running")
+            job, = self.create_jobs([(name, new_settings)])
+            self._start(job, API)
+        logging.info("Added launch job %s", name)
+        return self.status()
+
+    def cancel(self, name):
+        """Stop a job at its next OCI call or sleep.
+
+        Args:
+            name (str): The job.
+
+        Returns:
+            dict: The status, see status().
+
+        Raises:
+            KeyError: If there is no such job.
+        """
+        with self.lock:
+            managed = self._get(name)
+            managed.replacement = None
+            self._cancel(managed)
+        logging.info("Cancelling launch job %s", name)
+        return self.status()
+
+    def reload(self):
+        """Read oci.env and JOBS_FILE again and apply them to the jobs.
+
+        New jobs are started, jobs whose settings changed are restarted once they've
+        stopped, and jobs no longer configured are cancelled. Jobs added through the
+        API are left alone. Retry schedulers take the new waits and rate limits.
+
+        Returns:
+            dict: The names of the jobs added, restarted, cancelled and unchanged, and
+            the SHARED_VARIABLES that changed but need a restart of the daemon.
+
+        Raises:
+            ConfigError: If the new configuration can't be used, nothing is changed then.
+        """
+        base_settings, job_settings_list = self.load_settings()
+        jobs = self.create_jobs(job_settings_list, reconfigure=True)
+        result = {"added": [], "restarted": [], "cancelled": [], "unchanged": [],
+                  "restart_required": sorted(name for name in SHARED_VARIABLES
+                                             if base_settings.env.get(name) != self.base_settings.env.get(name))}
+        names = {job.name for job in jobs}
+        with self.lock:
+            self.env = base_settings.env
+            for name, managed in self.jobs.items():
+                if managed.source == CONFIG and name not in names and managed.state in (RUNNING, STOPPING):
+                    managed.replacement = None
+                    self._cancel(managed)
+                    result["cancelled"].append(name)
+            for job in jobs:
+                managed = self.jobs.get(job.name)
+                if managed is None:
+                    self._start(job, CONFIG)
+                    result["added"].append(job.name)
+                elif job_variables(managed.job.settings) == job_variables(job.settings):
+                    managed.replacement = None
+                    result["unchanged"].append(job.name)
+                elif managed.state in (RUNNING, STOPPING):
+                    # Started once the old job has stopped, so the two never launch at once
+                    managed.replacement = job
+                    self._cancel(managed)
+                    result["restarted"].append(job.name)
+                else:
+                    self._start(job, CONFIG)
+                    result["restarted"].append(job.name)
+        logging.info("Reloaded the configuration: %s", result)
+        return result
+
+    def stop(self, timeout=None):
+        """Cancel every job, wait for them to stop and close what they shared.
+
+        Args:
+            timeout (float, optional): Seconds to wait for each job. Defaults to no limit.
+        """
+        with self.lock:
+            self.stopping = True
+            managed_jobs = list(self.jobs.values())
+            for managed in managed_jobs:
+                managed.replacement = None
+                self._cancel(managed)
+        for managed in managed_jobs:
+            managed.thread.join(timeout)
+        if self.close is not None:
+            self.close()
+
+
+def create_control_token(path):
+    """Generate a control API token and write it to a file only the user can read.
+
+    Args:
+        path (str): The file to write the token to.
+
+    Returns:
+        str: The token.
+    """
+    token = secrets.token_urlsafe(32)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    # os.open only applies the mode to a new file
+    os.fchmod(fd, 0o600)
+    with os.fdopen(fd, "w", encoding="utf-8") as token_file:
+        token_file.write(f"{token}\n")
+    return token
+
+
+def start_control_server(daemon, port, token, host="127.0.0.1"):
+    """Serve the control API of a daemon from a background thread.
+
+    Listening on localhost alone doesn't keep other local users or the web pages
+    open in a browser out, so every request must carry the token, and requests from
+    a web page or with a body that isn't JSON are refused.
+
+    Args:
+        daemon (Daemon): The daemon to control.
+        port (int): The port to listen on.
+        token (str): Bearer token every request must carry.
+        host (str, optional): The address to bind. Defaults to localhost only.
+
+    Returns:
+        ThreadingHTTPServer: The running server.
+
+    Raises:
+        ValueError: If there is no token.
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    if not token:
+        raise ValueError("The control API needs a token")
+    expected = f"Bearer {token}".encode("utf-8")
+
+    routes = {
+        ("GET", "status"): lambda body: daemon.status(),
+        ("POST", "pause"): lambda body: daemon.pause(body.get("job")),
+        ("POST", "resume"): lambda body: daemon.resume(body.get("job")),
+        ("POST", "jobs"): lambda body: daemon.add(body.get("name"), body.get("settings") or {}),
+        ("POST", "reload"): lambda body: daemon.reload(),
+    }
+
+
+    class ControlHandler(BaseHTTPRequestHandler):
+        def _refusal(self, length):
+            # Browsers send Origin with cross-site POSTs, which need no preflight with a text/plain body
+            if self.headers.get("Origin") is not None:
+                return 403, "Requests from web pages are not accepted"
+            if not hmac.compare_digest(self.headers.get("Authorization", "").encode("utf-8"), expected):
+                return 401, "Missing or wrong control token"
+            content_type = self.headers.get("Content-Type", "").split(";")[0].strip().lower()
+            if length and content_type != "application/json":
+                return 415, "The body must be sent as application/json"
+            return None
+
+        def _handle(self, method):
+            try:
+                length = int(self.headers.get("Content-Length") or 0)
+            except ValueError:
+                self._reply(400, {"error": "Invalid Content-Length"})
+                return
+            refusal = self._refusal(length)
+            if refusal is not None:
+                self._reply(refusal[0], {"error": refusal[1]})
+                return
+            path = self.path.split("?")[0].strip("/")
+            if method == "DELETE" and path.startswith("jobs/"):
+                name = path[len("jobs/"):]
+                route = lambda body: daemon.cancel(name)
+            else:
+                route = routes.get((method, path))
+            if route is None:
+                self._reply(404, {"error": f"No route {method} /{path}"})
+                return
+            try:
+                body = json.loads(self.rfile.read(length)) if length else {}
+                if not isinstance(body, dict):
+                    raise ValueError("The body must be a JSON object")
+                result = route(body)
+            except KeyError as err:
+                self._reply(404, {"error": err.args[0]})
+                return
+            except ValueError as err:
+                # ConfigError and malformed JSON are ValueErrors too
+                self._reply(400, {"error": str(err)})
+                return
+            self._reply(200, result)
+
+        def _reply(self, status, payload):
+            body = json.dumps(payload, indent=2).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            self._handle("GET")
+
+        def do_POST(self):
+            self._handle("POST")
+
+        def do_DELETE(self):
+            self._handle("DELETE")
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), ControlHandler)
+    threading.Thread(target=server.serve_forever, name="control-http", daemon=True).start()
+    return server
@@ -0,0 +1,69 @@
+import os
+import threading
+import time
+
+from json_file import read_json, write_json
+
+
+class DiscoveryCache:
+    """On-disk cache for tenancy, availability domain, subnet and image lookups.
+
+    Entries are stored in a single JSON file, keyed by whatever identifies the
+    lookup (config profile, shape, OS and version) and expire after ``ttl`` seconds.
+    The file is rewritten atomically so a crash never leaves it half written.
+
+    Args:
+        path (str): The file the cache is persisted to.
+        ttl (int): Seconds an entry stays valid. 0 disables the cache.
+    """
+
+    def __init__(self, path, ttl):
+        self.path = path
+        self.ttl = ttl
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """Return the cached values for a key.
+
+        Args:
+            key (str): The cache key.
+
+        Returns:
+            dict: The cached values, or None if missing, expired or the cache is disabled.
+        """
+        if self.ttl <= 0:
+            return None
+        with self.lock:
+            entry = read_json(self.path).get(key)
+        if not entry or time.time() - entry.get("saved_at", 0) > self.ttl:
+            return None
+        return entry.get("values")
+
+    def set(self, key, values):
+        """Store values for a key.
+
+        Args:
+            key (str): The cache key.
+            values (dict): JSON serializable values to cache.
+        """
+        if self.ttl <= 0:
+            return
+        with self.lock:
+            entries = read_json(self.path)
+            entries[key] = {"saved_at": time.time(), "values": values}
+            write_json(self.path, entries)
+
+    def invalidate(self, key=None):
+        """Drop a single entry, or every entry when no key is given.
+
+        Args:
+            key (str, optional): The cache key to drop. Defaults to None.
+        """
+        with self.lock:
+            if key is None:
+                if os.path.exists(self.path):
+                    os.remove(self.path)
+                return
+            entries = read_json(self.path)
+            if entries.pop(key, None) is not None:
+                write_json(self.path, entries)
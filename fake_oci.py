@@ -0,0 +1,383 @@
+"""Local stand-in for the OCI Identity, VirtualNetwork and Compute clients.
+
+The fake clients answer the calls main.py makes from a configurable capacity
+model instead of a real tenancy, and run on a simulated clock so a day of
+retries takes seconds. They are used by benchmark.py to compare scheduling
+changes offline against a repeatable model.
+"""
+import datetime
+import math
+import random
+import threading
+import time
+
+import oci
+
+REAL_SLEEP = time.sleep
+REAL_TIME = time.time
+REAL_MONOTONIC = time.monotonic
+CAPACITY_ERROR = "Out of host capacity."
+
+
+class SimulationTimeout(BaseException):
+    """Raised by the fake clients once the simulated time horizon has passed.
+
+    Derives from BaseException so the script's own ``except Exception`` handlers
+    don't swallow it.
+    """
+
+
+class SimulatedClock:
+    """Virtual clock that replaces time.sleep, time.time and time.monotonic.
+
+    The thread that installs the clock advances it directly. Other threads (the
+    concurrent launch workers) keep their own position starting from the shared
+    time, so their sleeps overlap the way parallel requests do, and the shared
+    time moves to the furthest of them.
+
+    Args:
+        start (float, optional): Epoch seconds the simulation starts at.
+    """
+
+    def __init__(self, start=1_700_000_000.0):
+        self.start = start
+        self.elapsed = 0.0
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.owner = None
+
+    def monotonic(self):
+        if threading.current_thread() is self.owner:
+            return self.elapsed
+        local = getattr(self.local, "elapsed", None)
+        return self.elapsed if local is None else local
+
+    def time(self):
+        return self.start + self.monotonic()
+
+    def sleep(self, seconds):
+        seconds = max(0.0, seconds)
+        with self.lock:
+            if threading.current_thread() is self.owner:
+                self.elapsed += seconds
+                return
+            local = getattr(self.local, "elapsed", None)
+            local = (self.elapsed if local is None else local) + seconds
+            self.local.elapsed = local
+            self.elapsed = max(self.elapsed, local)
+
+    def install(self):
+        """Patch the time module so every caller uses this clock."""
+        self.owner = threading.current_thread()
+        time.sleep = self.sleep
+        time.time = self.time
+        time.monotonic = self.monotonic
+
+    @staticmethod
+    def uninstall():
+        """Restore the real time functions."""
+        time.sleep = REAL_SLEEP
+        time.time = REAL_TIME
+        time.monotonic = REAL_MONOTONIC
+
+
+class CapacityModel:
+    """Behaviour of the fake tenancy.
+
+    Args:
+        ad_capacity (dict): Availability domain suffix (e.g. "AD-1") to the probability
+            that a 4 OCPU launch attempt there finds capacity. Smaller shapes are placed
+            as if they were that many independent chances, e.g. 1 OCPU gets four.
+        latency_median (float, optional): Median API latency in seconds. Defaults to 0.3.
+        latency_sigma (float, optional): Sigma of the log-normal latency. Defaults to 0.5.
+        rate_limit_per_min (float, optional): API calls per minute before the tenancy
+            answers TooManyRequests. 0 disables throttling. Defaults to 20.
+        server_error_rate (float, optional): Probability of a 502/InternalError on any call.
+            Defaults to 0.01.
+        ambiguous_success_rate (float, optional): Probability that a successful launch
+            answers 504 GatewayTimeout even though the instance was created. Defaults to 0.
+        horizon (float, optional): Simulated seconds before giving up. Defaults to one week.
+        seed (int, optional): Seed of the random generator. Defaults to None.
+        outages (list, optional): (start, duration) in simulated seconds of incidents
+            during which every call answers 503. Defaults to none.
+    """
+
+    def __init__(self, ad_capacity, latency_median=0.3, latency_sigma=0.5, rate_limit_per_min=20,
+                 server_error_rate=0.01, ambiguous_success_rate=0.0, horizon=7 * 24 * 3600, seed=None,
+                 outages=()):
+        self.ad_capacity = ad_capacity
+        self.latency_median = latency_median
+        self.latency_sigma = latency_sigma
+        self.rate_limit_per_min = rate_limit_per_min
+        self.server_error_rate = server_error_rate
+        self.ambiguous_success_rate = ambiguous_success_rate
+        self.horizon = horizon
+        self.seed = seed
+        self.outages = list(outages)
+
+
+class FakeTenancy:
+    """State shared by the fake clients of one tenancy, plus call statistics.
+
+    Args:
+        model (CapacityModel): The capacity model.
+        clock (SimulatedClock): The clock the fake runs on.
+        region (str, optional): Region prefix of the availability domain names.
+    """
+
+    def __init__(self, model, clock, region="Uocm:FAKE-1"):
+        self.model = model
+        self.clock = clock
+        self.random = random.Random(model.seed)
+        self.lock = threading.Lock()
+        self.tenancy_id = "ocid1.tenancy.oc1..fake"
+        self.ad_names = [f"{region}-{suffix}" for suffix in model.ad_capacity]
+        self.instances = {}
+        self.boot_volumes = {}
+        self.retry_tokens = {}
+        self.tokens = max(1.0, model.rate_limit_per_min / 6)
+        self.tokens_at = 0.0
+        self.calls = {}
+        self.errors = {}
+        self.launch_attempts = 0
+        self.first_instance_at = None
+        # Called with the simulated time on every API call, e.g. to sample memory
+        self.probe = None
+
+    def _draw(self, probability):
+        with self.lock:
+            return self.random.random() < probability
+
+    def _latency(self):
+        with self.lock:
+            return self.random.lognormvariate(math.log(self.model.latency_median), self.model.latency_sigma)
+
+    def _throttled(self, now):
+        if self.model.rate_limit_per_min <= 0:
+            return False
+        with self.lock:
+            burst = max(1.0, self.model.rate_limit_per_min / 6)
+            refill = max(0.0, now - self.tokens_at) * self.model.rate_limit_per_min / 60
+            self.tokens = min(burst, self.tokens + refill)
+            self.tokens_at = max(self.tokens_at, now)
+            if self.tokens < 1:
+                return True
+            self.tokens -= 1
+            return False
+
+    def _fail(self, status, code, message):
+        key = CAPACITY_ERROR if message == CAPACITY_ERROR else code
+        with self.lock:
+            self.errors[key] = self.errors.get(key, 0) + 1
+        raise oci.exceptions.ServiceError(status, code, {}, message)
+
+    def call(self, method):
+        """Account for an API call: latency, horizon, throttling and injected errors.
+
+        Args:
+            method (str): The client method being called.
+
+        Raises:
+            SimulationTimeout: If the time horizon has passed.
+            oci.exceptions.ServiceError: For throttled calls and injected server errors.
+        """
+        if self.clock.monotonic() > self.model.horizon:
+            raise SimulationTimeout()
+        if self.probe is not None:
+            self.probe(self.clock.monotonic())
+        with self.lock:
+            self.calls[method] = self.calls.get(method, 0) + 1
+        self.clock.sleep(self._latency())
+        now = self.clock.monotonic()
+        if any(start <= now < start + duration for start, duration in self.model.outages):
+            self._fail(503, "ServiceUnavailable", "Service unavailable")
+        if self._throttled(now):
+            self._fail(429, "TooManyRequests", "Too many requests for the tenancy")
+        if self._draw(self.model.server_error_rate):
+            if self._draw(0.5):
+                self._fail(502, "Bad Gateway", "Bad Gateway")
+            self._fail(500, "InternalError", "Internal error occurred")
+
+    def over_limit(self, shape, ocpus, boot_volume_gbs=50):
+        """Whether a launch would exceed the Always Free limits: 4 A1 OCPUs, 2 E2.1.Micro
+        instances and 200 GB of boot volumes."""
+        with self.lock:
+            alive = [instance for instance in self.instances.values()
+                     if instance.lifecycle_state not in ("TERMINATING", "TERMINATED")]
+            boot_volumes = sum(self.boot_volumes[instance.id] for instance in alive)
+        live = [instance for instance in alive if instance.shape == shape]
+        if boot_volumes + boot_volume_gbs > 200:
+            return True
+        if shape == "VM.Standard.E2.1.Micro":
+            return len(live) >= 2
+        used = sum(instance.shape_config.ocpus if instance.shape_config else 4 for instance in live)
+        return used + ocpus > 4
+
+    def has_capacity(self, ad_name, ocpus=4):
+        suffix = next(suffix for suffix in self.model.ad_capacity if ad_name.endswith(suffix))
+        chances = 4 / ocpus if ocpus else 1
+        return self._draw(1 - (1 - self.model.ad_capacity[suffix]) ** chances)
+
+    def create_instance(self, details):
+        with self.lock:
+            instance_id = f"ocid1.instance.oc1..fake{len(self.instances) + 1}"
+            instance = oci.core.models.Instance(
+                id=instance_id,
+                availability_domain=details.availability_domain,
+                compartment_id=details.compartment_id,
+                display_name=details.display_name,
+                shape=details.shape,
+                shape_config=details.shape_config,
+                image_id=details.source_details.image_id,
+                lifecycle_state="PROVISIONING",
+                time_created=datetime.datetime.fromtimestamp(self.clock.time(), datetime.timezone.utc),
+            )
+            self.instances[instance_id] = instance
+            self.boot_volumes[instance_id] = details.source_details.boot_volume_size_in_gbs or 50
+            if self.first_instance_at is None:
+                self.first_instance_at = self.clock.monotonic()
+        return instance
+
+    @property
+    def total_calls(self):
+        return sum(self.calls.values())
+
+    @property
+    def duplicates(self):
+        """Instances created after the first one with the same display name, terminated or not."""
+        return len(self.instances) - len({instance.display_name for instance in self.instances.values()})
+
+    @property
+    def wasted_calls(self):
+        """Calls lost to throttling, server errors and duplicate launches, capacity misses excluded."""
+        return sum(count for key, count in self.errors.items() if key != CAPACITY_ERROR) + self.duplicates
+
+
+def response(data, headers=None):
+    return oci.response.Response(200, headers or {}, data, None)
+
+
+class FakeIdentityClient:
+    def __init__(self, tenancy):
+        self.tenancy = tenancy
+
+    def get_user(self, user_id, **kwargs):
+        self.tenancy.call("get_user")
+        return response(oci.identity.models.User(id=user_id, compartment_id=self.tenancy.tenancy_id))
+
+    def list_availability_domains(self, compartment_id, **kwargs):
+        self.tenancy.call("list_availability_domains")
+        return response([oci.identity.models.AvailabilityDomain(name=name, compartment_id=compartment_id)
+                         for name in self.tenancy.ad_names])
+
+
+class FakeVirtualNetworkClient:
+    def __init__(self, tenancy):
+        self.tenancy = tenancy
+
+    def list_subnets(self, compartment_id, **kwargs):
+        self.tenancy.call("list_subnets")
+        return response([oci.core.models.Subnet(id="ocid1.subnet.oc1..fake", compartment_id=compartment_id)])
+
+
+class FakeComputeClient:
+    """Fake compute client, with two pages of images per shape."""
+
+    IMAGES = [("Canonical Ubuntu", "22.04"), ("Canonical Ubuntu", "24.04"), ("Oracle Linux", "9")]
+
+    def __init__(self, tenancy):
+        self.tenancy = tenancy
+
+    def list_images(self, compartment_id, shape=None, page=None, **kwargs):
+        self.tenancy.call("list_images")
+        build = 1 if page else 2
+        images = [oci.core.models.Image(
+            id=f"ocid1.image.oc1..{os_name.split()[-1].lower()}{version}-{build}",
+            display_name=f"{os_name}-{version}-build{build}",
+            operating_system=os_name,
+            operating_system_version=version,
+            lifecycle_state="AVAILABLE",
+            size_in_mbs=47694,
+            time_created=datetime.datetime(2024, build, 1, tzinfo=datetime.timezone.utc),
+        ) for os_name, version in self.IMAGES]
+        return response(images, {} if page else {"opc-next-page": "2"})
+
+    def launch_instance(self, launch_instance_details, opc_retry_token=None, **kwargs):
+        with self.tenancy.lock:
+            self.tenancy.launch_attempts += 1
+        self.tenancy.call("launch_instance")
+        if opc_retry_token in self.tenancy.retry_tokens:
+            # Same token, same answer: the launch that already went through
+            instance_id, work_request_id = self.tenancy.retry_tokens[opc_retry_token]
+            return response(self.tenancy.instances[instance_id], {"opc-work-request-id": work_request_id})
+        details = launch_instance_details
+        ocpus = details.shape_config.ocpus if details.shape_config else 4
+        if self.tenancy.over_limit(details.shape, ocpus, details.source_details.boot_volume_size_in_gbs or 50):
+            self.tenancy._fail(400, "LimitExceeded", "The following service limits were exceeded")
+        if not self.tenancy.has_capacity(details.availability_domain, ocpus):
+            self.tenancy._fail(500, "InternalError", CAPACITY_ERROR)
+        instance = self.tenancy.create_instance(details)
+        work_request_id = instance.id.replace("instance", "workrequest")
+        if opc_retry_token:
+            self.tenancy.retry_tokens[opc_retry_token] = (instance.id, work_request_id)
+        if self.tenancy._draw(self.tenancy.model.ambiguous_success_rate):
+            self.tenancy._fail(504, "GatewayTimeout", "Gateway Timeout")
+        return response(instance, {"opc-work-request-id": work_request_id})
+
+    def get_instance(self, instance_id, **kwargs):
+        self.tenancy.call("get_instance")
+        instance = self.tenancy.instances.get(instance_id)
+        if instance is None:
+            self.tenancy._fail(404, "NotAuthorizedOrNotFound", "Authorization failed or requested resource not found.")
+        return response(instance)
+
+    def list_instances(self, compartment_id, lifecycle_state=None, page=None, **kwargs):
+        self.tenancy.call("list_instances")
+        instances = [instance for instance in self.tenancy.instances.values()
+                     if lifecycle_state is None or instance.lifecycle_state == lifecycle_state]
+        return response(sorted(instances, key=lambda instance: instance.time_created, reverse=True))
+
+    def update_instance(self, instance_id, update_instance_details, **kwargs):
+        self.tenancy.call("update_instance")
+        instance = self.tenancy.instances.get(instance_id)
+        if instance is None:
+            self.tenancy._fail(404, "NotAuthorizedOrNotFound", "Authorization failed or requested resource not found.")
+        if update_instance_details.shape_config is not None:
+            if not self.tenancy.has_capacity(instance.availability_domain, update_instance_details.shape_config.ocpus):
+                self.tenancy._fail(500, "InternalError", CAPACITY_ERROR)
+            instance.shape_config = update_instance_details.shape_config
+        return response(instance)
+
+    def terminate_instance(self, instance_id, **kwargs):
+        self.tenancy.call("terminate_instance")
+        instance = self.tenancy.instances.get(instance_id)
+        if instance is not None:
+            instance.lifecycle_state = "TERMINATED"
+        return response(None)
+
+
+class FakeBlockstorageClient:
+    def __init__(self, tenancy):
+        self.tenancy = tenancy
+
+    def list_boot_volumes(self, compartment_id=None, availability_domain=None, page=None, **kwargs):
+        self.tenancy.call("list_boot_volumes")
+        with self.tenancy.lock:
+            volumes = [oci.core.models.BootVolume(
+                id=instance_id.replace("instance", "bootvolume"),
+                availability_domain=self.tenancy.instances[instance_id].availability_domain,
+                size_in_gbs=size,
+                lifecycle_state="TERMINATED" if self.tenancy.instances[instance_id].lifecycle_state == "TERMINATED"
+                else "AVAILABLE",
+            ) for instance_id, size in self.tenancy.boot_volumes.items()]
+        return response(volumes)
+
+
+class FakeClients:
+    """Drop-in for oci_clients.OciClients backed by a fake tenancy."""
+
+    def __init__(self, tenancy):
+        self.identity = FakeIdentityClient(tenancy)
+        self.network = FakeVirtualNetworkClient(tenancy)
+        self.compute = FakeComputeClient(tenancy)
+        self.blockstorage = FakeBlockstorageClient(tenancy)
@@ -0,0 +1,118 @@
+import threading
+
+from settings import ARM_SHAPE, E2_MICRO_SHAPE
+
+# Always Free allowance of a tenancy
+FREE_TIER_ALLOWANCE = {"a1_ocpus": 4, "a1_memory_gbs": 24, "micro_instances": 2, "boot_volume_gbs": 200}
+GONE_STATES = ("TERMINATING", "TERMINATED")
+
+
+def slot_usage(shape, ocpus, memory_in_gbs, boot_volume_gbs):
+    """The part of the allowance an instance takes.
+
+    Args:
+        shape (str): The compute shape.
+        ocpus (float): OCPUs of an A1.Flex instance.
+        memory_in_gbs (float): Memory of an A1.Flex instance.
+        boot_volume_gbs (float): Size of its boot volume.
+
+    Returns:
+        dict: The usage, with the keys of FREE_TIER_ALLOWANCE.
+    """
+    usage = dict.fromkeys(FREE_TIER_ALLOWANCE, 0)
+    if shape == ARM_SHAPE:
+        usage["a1_ocpus"] = ocpus
+        usage["a1_memory_gbs"] = memory_in_gbs
+    elif shape == E2_MICRO_SHAPE:
+        usage["micro_instances"] = 1
+    usage["boot_volume_gbs"] = boot_volume_gbs
+    return usage
+
+
+class Quota:
+    """The allowance left in a tenancy, read once and then tracked locally as slots are launched.
+
+    Args:
+        instances (list): The tenancy's instances.
+        boot_volumes (list): The tenancy's boot volumes.
+        allowance (dict, optional): The limits. Defaults to FREE_TIER_ALLOWANCE.
+    """
+
+    def __init__(self, instances, boot_volumes, allowance=None):
+        self.allowance = dict(allowance or FREE_TIER_ALLOWANCE)
+        self.used = dict.fromkeys(self.allowance, 0)
+        for instance in instances:
+            if instance.lifecycle_state in GONE_STATES:
+                continue
+            config = instance.shape_config
+            usage = slot_usage(instance.shape, config.ocpus if config else 0,
+                               config.memory_in_gbs if config else 0, 0)
+            self._add(usage, 1)
+        self.used["boot_volume_gbs"] = sum(volume.size_in_gbs or 0 for volume in boot_volumes
+                                           if volume.lifecycle_state not in GONE_STATES)
+        self.lock = threading.Lock()
+
+    def _add(self, usage, sign):
+        for key, value in usage.items():
+            self.used[key] += sign * value
+
+    @property
+    def remaining(self):
+        """dict: The allowance left, by key of FREE_TIER_ALLOWANCE."""
+        with self.lock:
+            return {key: self.allowance[key] - self.used[key] for key in self.allowance}
+
+    def reserve(self, usage):
+        """Take the usage of a slot from the allowance, if it fits.
+
+        Args:
+            usage (dict): As returned by slot_usage().
+
+        Returns:
+            bool: True if it was reserved, False if it doesn't fit.
+        """
+        with self.lock:
+            if any(self.used[key] + value > self.allowance[key] for key, value in usage.items() if value):
+                return False
+            self._add(usage, 1)
+            return True
+
+    def release(self, usage):
+        """Give back the usage of a slot that wasn't launched.
+
+        Args:
+            usage (dict): As reserved with reserve().
+        """
+        with self.lock:
+            self._add(usage, -1)
+
+
+def missing_slots(fleet, instances):
+    """List the instances of a fleet that don't exist yet.
+
+    An existing instance fills the first slot of the same shape and size, and each
+    instance fills one slot only.
+
+    Args:
+        fleet (list): (count, shape, ocpus, memory_in_gbs) pieces, see settings.parse_fleet.
+        instances (list): The tenancy's instances.
+
+    Returns:
+        list: (index, shape, ocpus, memory_in_gbs) of the missing slots. The index
+        is the slot's position in the fleet, so a slot keeps its name across runs.
+    """
+    available = [instance for instance in instances if instance.lifecycle_state not in GONE_STATES]
+    missing = []
+    index = 0
+    for count, shape, ocpus, memory in fleet:
+        for _ in range(count):
+            index += 1
+            match = next((instance for instance in available if instance.shape == shape and (
+                shape != ARM_SHAPE or (instance.shape_config is not None
+                                       and (instance.shape_config.ocpus,
+                                            instance.shape_config.memory_in_gbs) == (ocpus, memory)))), None)
+            if match is None:
+                missing.append((index, shape, ocpus, memory))
+            else:
+                available.remove(match)
+    return missing
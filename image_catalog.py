@@ -0,0 +1,135 @@
+import threading
+import time
+
+from json_file import read_json, write_json
+
+IMAGE_LIST_KEYS = [
+    "lifecycle_state",
+    "display_name",
+    "id",
+    "operating_system",
+    "operating_system_version",
+    "size_in_mbs",
+    "time_created",
+]
+
+
+def iter_images(fetch_page):
+    """Lazily yield images across every page of list_images.
+
+    Args:
+        fetch_page (callable): Takes a page token (None for the first page) and
+            returns the list_images response for that page.
+
+    Yields:
+        oci.core.models.Image: One image at a time.
+    """
+    page = None
+    while True:
+        response = fetch_page(page)
+        yield from response.data
+        page = response.next_page
+        if not page:
+            return
+
+
+def image_record(image):
+    """Reduce an image to the fields kept in the catalog.
+
+    Args:
+        image (oci.core.models.Image): The image returned from the OCI service.
+
+    Returns:
+        dict: The IMAGE_LIST_KEYS of the image, with time_created as an ISO string.
+    """
+    record = {key: getattr(image, key) for key in IMAGE_LIST_KEYS}
+    if record["time_created"] is not None:
+        record["time_created"] = record["time_created"].isoformat()
+    return record
+
+
+def index_key(operating_system, os_version):
+    """Key of an OS and version in the index of a shape.
+
+    Args:
+        operating_system (str): Exact name of the operating system.
+        os_version (str): Exact version of the operating system.
+
+    Returns:
+        str: The key.
+    """
+    return f"{operating_system}|{os_version}"
+
+
+class ImageCatalog:
+    """Index of the newest image for every operating system and version, per shape.
+
+    The index is persisted as a single JSON file that is rewritten atomically,
+    so it stays the size of the distinct OS/version pairs instead of growing
+    on every run. Jobs of several threads can share it.
+
+    Args:
+        path (str): The file the index is persisted to.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        # Files written before the catalog existed are a plain list of images, read as empty
+        self.shapes = read_json(path)
+
+    def is_fresh(self, shape, max_age):
+        """Check whether the index for a shape was built less than max_age seconds ago.
+
+        Args:
+            shape (str): The compute shape.
+            max_age (int): Maximum age of the index in seconds.
+
+        Returns:
+            bool: True if the index can be used without listing images again.
+        """
+        with self.lock:
+            built_at = self.shapes.get(shape, {}).get("built_at", 0)
+        return time.time() - built_at <= max_age
+
+    def rebuild(self, shape, images):
+        """Stream images into the index for a shape and persist it.
+
+        Only the newest available image of every OS/version pair is kept, so
+        memory use does not depend on the number of images listed. The images are
+        listed before taking the lock, so other shapes can be looked up meanwhile.
+
+        Args:
+            shape (str): The compute shape the images were listed for.
+            images (iterable): The images returned from the OCI service.
+        """
+        newest = {}
+        for image in images:
+            if image.lifecycle_state not in (None, "AVAILABLE"):
+                continue
+            key = index_key(image.operating_system, image.operating_system_version)
+            current = newest.get(key)
+            if current is None or current.time_created is None or \
+                    (image.time_created and image.time_created > current.time_created):
+                newest[key] = image
+        entry = {
+            "built_at": time.time(),
+            "images": {key: image_record(image) for key, image in newest.items()},
+        }
+        with self.lock:
+            self.shapes[shape] = entry
+            write_json(self.path, self.shapes, sort_keys=True)
+
+    def lookup(self, shape, operating_system, os_version):
+        """Find the newest image for an OS and version.
+
+        Args:
+            shape (str): The compute shape.
+            operating_system (str): Exact name of the operating system.
+            os_version (str): Exact version of the operating system.
+
+        Returns:
+            dict: The catalog record of the image, or None if there is no match.
+        """
+        with self.lock:
+            return self.shapes.get(shape, {}).get("images", {}).get(index_key(operating_system, os_version))
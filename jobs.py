@@ -0,0 +1,160 @@
+import configparser
+import logging
+import os
+import threading
+import time
+
+from coordination import LocalCoordinator, RunnerGroup
+from settings import ENV_VARIABLES, ConfigError, Settings
+
+DEFAULT_JOB = "default"
+# Settings of what every job shares: notifications, logs, metrics, the connection pool and coordination
+SHARED_VARIABLES = (
+    "JOBS_FILE", "NOTIFY_EMAIL", "EMAIL", "EMAIL_PASSWORD", "DISCORD_WEBHOOK", "TELEGRAM_TOKEN",
+    "TELEGRAM_USER_ID", "NOTIFY_TIMEOUT_SECS", "METRICS_PORT", "METRICS_FILE", "METRICS_INTERVAL_SECS",
+    "LOG_MAX_MB", "LOG_BACKUP_COUNT", "LOG_SUMMARY_INTERVAL_SECS", "HTTP_CONNECT_TIMEOUT_SECS",
+    "HTTP_READ_TIMEOUT_SECS", "DNS_CACHE_TTL_SECS", "COORDINATION_URL", "COORDINATION_TOKEN", "RUNNER_ID", "LAUNCH_LEASE_SECS",
+    "CONTROL_PORT", "CONTROL_TOKEN", "PROFILE_DIR", "RSS_LIMIT_MB",
+)
+# Longest a cancelled job keeps sleeping before it notices
+CANCEL_POLL_SECS = 1
+
+
+class JobCancelled(Exception):
+    """Raised in a job's thread once the job has been cancelled."""
+
+
+def job_settings(name, env, overrides):
+    """Read the settings of one job from oci.env variables overriding env.
+
+    Args:
+        name (str): Name of the job.
+        env (dict): The environment variables of oci.env.
+        overrides (dict): The job's own variables.
+
+    Returns:
+        settings.Settings: The job's configuration.
+
+    Raises:
+        ConfigError: Listing every problem, each line prefixed with [name].
+    """
+    errors = []
+    unknown = sorted(key for key in overrides if key not in ENV_VARIABLES)
+    shared = sorted(key for key in overrides if key in SHARED_VARIABLES)
+    if unknown:
+        errors.append(f"[{name}] unknown variables {', '.join(unknown)}")
+    if shared:
+        errors.append(f"[{name}] {', '.join(shared)} can only be set in oci.env")
+    if not errors:
+        try:
+            return Settings({**env, **overrides})
+        except ConfigError as err:
+            errors.extend(f"[{name}] {line}" for line in str(err).splitlines())
+    raise ConfigError("\n".join(errors))
+
+
+def read_job_settings(env):
+    """Read the settings of every launch job.
+
+    Without JOBS_FILE there is a single job configured by oci.env. Otherwise each
+    section of JOBS_FILE is a job: its keys are oci.env variables, e.g. OCI_PROFILE,
+    OCI_COMPUTE_SHAPE or OCT_FREE_AD, and override oci.env for that job only. The
+    SHARED_VARIABLES can only be set in oci.env.
+
+    Args:
+        env (dict): The environment variables, usually os.environ after loading oci.env.
+
+    Returns:
+        list: (name, Settings) tuples, one per job.
+
+    Raises:
+        ConfigError: Listing every problem found in the jobs file and the jobs' settings.
+    """
+    jobs_file = (env.get("JOBS_FILE") or "").strip()
+    if not jobs_file:
+        # A copy, so the job's settings don't change with os.environ
+        return [(DEFAULT_JOB, Settings(dict(env)))]
+
+    parser = configparser.ConfigParser(interpolation=None)
+    parser.optionxform = str
+    try:
+        if not parser.read(os.path.expanduser(jobs_file)):
+            raise ConfigError(f"JOBS_FILE {jobs_file} can't be read")
+    except configparser.Error as err:
+        raise ConfigError(f"Error reading JOBS_FILE {jobs_file}: {err}") from err
+    if not parser.sections():
+        raise ConfigError(f"JOBS_FILE {jobs_file} has no jobs")
+
+    jobs, errors = [], []
+    for name in parser.sections():
+        try:
+            jobs.append((name, job_settings(name, env, dict(parser.items(name)))))
+        except ConfigError as err:
+            errors.append(str(err))
+    if errors:
+        raise ConfigError("\n".join(errors))
+    return jobs
+
+
+class LaunchJob:
+    """One instance to launch: a profile, a shape, its ADs and image, and the state of its attempts.
+
+    Jobs of the same tenancy share one retry scheduler, so they draw from the same
+    rate limit budget and back off together. A job can be paused and cancelled from
+    another thread, it stops at its next OCI call or sleep.
+
+    Args:
+        name (str): Name of the job, used in logs, metrics and notifications.
+        settings (settings.Settings): The job's configuration.
+        clients (oci_clients.OciClients): OCI clients of the job's profile.
+        retry_scheduler (scheduler.RetryScheduler): Backoff and rate limit of the job's tenancy.
+        count_existing (bool, optional): Whether an existing instance of the shape counts as
+            the job's instance. Defaults to True. Slots of a FLEET are counted by the fleet instead.
+        runners (coordination.RunnerGroup, optional): The runners sharing the tenancy.
+            Defaults to running alone.
+    """
+
+    def __init__(self, name, settings, clients, retry_scheduler, count_existing=True, runners=None):
+        self.name = name
+        self.settings = settings
+        self.clients = clients
+        self.retry_scheduler = retry_scheduler
+        self.count_existing = count_existing
+        self.runners = runners or RunnerGroup(LocalCoordinator())
+        self.log = logging.getLogger(f"launch_instance.{name}")
+        self.setup_log = logging.getLogger(f"setup.{name}")
+        self.resumed = threading.Event()
+        self.resumed.set()
+        self.cancelled = threading.Event()
+
+    def checkpoint(self):
+        """Wait while the job is paused, and stop it once it's cancelled.
+
+        Returns:
+            float: The number of seconds spent paused.
+
+        Raises:
+            JobCancelled: If the job has been cancelled.
+        """
+        waited = 0.0
+        if not self.resumed.is_set():
+            started = time.monotonic()
+            while not self.resumed.wait(CANCEL_POLL_SECS) and not self.cancelled.is_set():
+                pass
+            waited = time.monotonic() - started
+        if self.cancelled.is_set():
+            raise JobCancelled(f"Launch job {self.name} was cancelled")
+        return waited
+
+    def sleep(self, seconds):
+        """Sleep, waking up early if the job is cancelled.
+
+        Args:
+            seconds (float): The time to sleep.
+        """
+        deadline = time.monotonic() + seconds
+        while not self.cancelled.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            time.sleep(min(remaining, CANCEL_POLL_SECS))
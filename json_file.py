@@ -0,0 +1,45 @@
+import json
+import os
+import tempfile
+
+
+def read_json(path):
+    """Read a JSON object written by write_json().
+
+    Args:
+        path (str): The file to read.
+
+    Returns:
+        dict: The object, or an empty dict if the file is missing, corrupt or doesn't hold an object.
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as json_file:
+            data = json.load(json_file)
+    except (OSError, ValueError):
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def write_json(path, data, sort_keys=False):
+    """Write an object as JSON atomically, so a crash never leaves the file half written.
+
+    The object is written to a temporary file of the same directory, which then replaces path.
+
+    Args:
+        path (str): The file to write.
+        data (dict): JSON serializable object.
+        sort_keys (bool, optional): Whether to sort the keys. Defaults to False.
+
+    Raises:
+        OSError: If the file can't be written, path is then left as it was.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as tmp_file:
+            json.dump(data, tmp_file, indent=2, sort_keys=sort_keys)
+        os.replace(tmp_path, path)
+    except OSError:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
@@ -0,0 +1,200 @@
+import copy
+import gzip
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import shutil
+import threading
+
+# Attributes every LogRecord has, anything else was passed with extra=
+RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """Format records as one JSON object per line, with the fields passed in ``extra``."""
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class ExceptionQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that keeps the traceback of a record apart from its message.
+
+    QueueHandler.prepare() folds the traceback into the message, so JsonFormatter
+    would never write it as its own "exception" field. Here the message is merged
+    with its arguments and the traceback formatted into exc_text instead, so no
+    frame is kept alive while the record waits in the queue.
+    """
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.msg = record.getMessage()
+        record.message = record.msg
+        record.args = None
+        record.exc_info = None
+        return record
+
+
+def compress_rotated(source, dest):
+    """Rotator for RotatingFileHandler that gzips the rotated file."""
+    with open(source, "rb") as source_file, gzip.open(dest, "wb") as dest_file:
+        shutil.copyfileobj(source_file, dest_file)
+    os.remove(source)
+
+
+def rotating_file_handler(path, max_bytes, backup_count, formatter=None):
+    """Build a handler writing JSON lines to path, rotated by size into gzipped backups.
+
+    Args:
+        path (str): The log file.
+        max_bytes (int): Size at which the file is rotated. 0 never rotates.
+        backup_count (int): Number of compressed backups kept, e.g. path.1.gz.
+        formatter (logging.Formatter, optional): Formats the lines. Defaults to JsonFormatter.
+
+    Returns:
+        logging.handlers.RotatingFileHandler: The handler.
+    """
+    handler = logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count,
+                                                   encoding="utf-8")
+    handler.namer = lambda name: name + ".gz"
+    handler.rotator = compress_rotated
+    handler.setFormatter(formatter or JsonFormatter())
+    return handler
+
+
+class CollapsingHandler(logging.Handler):
+    """Forward records to other handlers, collapsing runs of repeated records.
+
+    Records logged with ``extra={"collapse_key": ...}`` are collapsed: the first
+    one of a run is forwarded, the next ones with the same key are only counted
+    and forwarded as one summary record every ``interval`` seconds, and when the
+    run ends. Each logger has its own run, so jobs logging at the same time through
+    their own loggers are collapsed separately.
+
+    Args:
+        handlers (list): The handlers records are forwarded to.
+        interval (float): Seconds between summary records of a run.
+    """
+
+    def __init__(self, handlers, interval):
+        super().__init__()
+        self.handlers = handlers
+        self.interval = interval
+        # Logger name -> [collapse key, count, start of the summarized period, last record]
+        self.runs = {}
+
+    def _forward(self, record):
+        for handler in self.handlers:
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+    def _summarize(self, run):
+        key, count, since, last = run
+        if count:
+            summary = logging.makeLogRecord(vars(last))
+            summary.msg = "%s repeated %s times over %.0f seconds"
+            summary.args = (key, count, last.created - since)
+            summary.collapsed = count
+            self._forward(summary)
+            run[2] = last.created
+        run[1] = 0
+
+    def emit(self, record):
+        key = getattr(record, "collapse_key", None)
+        run = self.runs.get(record.name)
+        if run is not None and key is not None and key == run[0]:
+            run[1] += 1
+            run[3] = record
+            if record.created - run[2] >= self.interval:
+                self._summarize(run)
+            return
+        if run is not None:
+            self._summarize(run)
+        self.runs[record.name] = [key, 0, record.created, None]
+        self._forward(record)
+
+    def flush(self):
+        self.acquire()
+        try:
+            for run in self.runs.values():
+                self._summarize(run)
+            self.runs = {}
+        finally:
+            self.release()
+        for handler in self.handlers:
+            handler.flush()
+
+    def close(self):
+        self.flush()
+        for handler in self.handlers:
+            handler.close()
+        super().close()
+
+
+class LogPipeline:
+    """Writes log records from a background thread so the launch loop never waits on disk.
+
+    Every record goes to ``info_path``; records of ``launch_logger`` and its children
+    also go to ``launch_path``. Both are JSON lines rotated by size.
+
+    Args:
+        info_path (str): The general log file.
+        launch_path (str): The launch attempts log file.
+        launch_logger (str): Name of the logger of launch attempts.
+        max_bytes (int): Size at which a file is rotated.
+        backup_count (int): Number of compressed backups kept per file.
+        summary_interval (float): Seconds between summaries of collapsed records.
+    """
+
+    def __init__(self, info_path, launch_path, launch_logger, max_bytes, backup_count, summary_interval):
+        launch_handler = rotating_file_handler(launch_path, max_bytes, backup_count)
+        launch_handler.addFilter(logging.Filter(launch_logger))
+        self.collapser = CollapsingHandler([rotating_file_handler(info_path, max_bytes, backup_count),
+                                            launch_handler], summary_interval)
+        self.queue = queue.SimpleQueue()
+        self.handler = ExceptionQueueHandler(self.queue)
+        self.listener = logging.handlers.QueueListener(self.queue, self.collapser)
+        self.lock = threading.Lock()
+        self.started = False
+
+    def start(self, level=logging.INFO):
+        """Attach the pipeline to the root logger and start the writer thread.
+
+        Args:
+            level (int, optional): Level of the root logger. Defaults to logging.INFO.
+        """
+        with self.lock:
+            if self.started:
+                return
+            root = logging.getLogger()
+            root.setLevel(level)
+            root.addHandler(self.handler)
+            self.listener.start()
+            self.started = True
+
+    def stop(self):
+        """Write every queued record and the pending summaries, then close the files."""
+        with self.lock:
+            if not self.started:
+                return
+            logging.getLogger().removeHandler(self.handler)
+            self.listener.stop()
+            self.collapser.close()
+            self.started = False
@@ -1,162 +1,347 @@
-import configparser
-import itertools
-import json
+import argparse
+import functools
 import logging
 import os
-import smtplib
+import signal
 import sys
+import threading
 import time
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 from typing import Union
 
-import oci
-import paramiko
-from dotenv import load_dotenv
-import requests
-
-# Load environment variables from .env file
-load_dotenv('oci.env')
-
-ARM_SHAPE = "VM.Standard.A1.Flex"
-E2_MICRO_SHAPE = "VM.Standard.E2.1.Micro"
-
-# Access loaded environment variables and strip white spaces
-OCI_CONFIG = os.getenv("OCI_CONFIG", "").strip()
-OCT_FREE_AD = os.getenv("OCT_FREE_AD", "").strip()
-DISPLAY_NAME = os.getenv("DISPLAY_NAME", "").strip()
-WAIT_TIME = int(os.getenv("REQUEST_WAIT_TIME_SECS", "0").strip())
-SSH_AUTHORIZED_KEYS_FILE = os.getenv("SSH_AUTHORIZED_KEYS_FILE", "").strip()
-OCI_IMAGE_ID = os.getenv("OCI_IMAGE_ID", None).strip() if os.getenv("OCI_IMAGE_ID") else None
-OCI_COMPUTE_SHAPE = os.getenv("OCI_COMPUTE_SHAPE", ARM_SHAPE).strip()
-SECOND_MICRO_INSTANCE = os.getenv("SECOND_MICRO_INSTANCE", 'False').strip().lower() == 'true'
-OCI_SUBNET_ID = os.getenv("OCI_SUBNET_ID", None).strip() if os.getenv("OCI_SUBNET_ID") else None
-OPERATING_SYSTEM = os.getenv("OPERATING_SYSTEM", "").strip()
-OS_VERSION = os.getenv("OS_VERSION", "").strip()
-ASSIGN_PUBLIC_IP = os.getenv("ASSIGN_PUBLIC_IP", "false").strip()
-BOOT_VOLUME_SIZE = os.getenv("BOOT_VOLUME_SIZE", "50").strip()
-NOTIFY_EMAIL = os.getenv("NOTIFY_EMAIL", 'False').strip().lower() == 'true'
-EMAIL = os.getenv("EMAIL", "").strip()
-EMAIL_PASSWORD = os.getenv("EMAIL_PASSWORD", "").strip()
-DISCORD_WEBHOOK = os.getenv("DISCORD_WEBHOOK", "").strip()
-
-# Read the configuration from oci_config file
-config = configparser.ConfigParser()
-try:
-    config.read(OCI_CONFIG)
-    OCI_USER_ID = config.get('DEFAULT', 'user')
-    if OCI_COMPUTE_SHAPE not in (ARM_SHAPE, E2_MICRO_SHAPE):
-        raise ValueError(f"{OCI_COMPUTE_SHAPE} is not an acceptable shape")
-    env_has_spaces = any(isinstance(confg_var, str) and " " in confg_var
-                        for confg_var in [OCI_CONFIG, OCT_FREE_AD,WAIT_TIME,
-                                SSH_AUTHORIZED_KEYS_FILE, OCI_IMAGE_ID, 
-                                OCI_COMPUTE_SHAPE, SECOND_MICRO_INSTANCE, 
-                                OCI_SUBNET_ID, OS_VERSION, NOTIFY_EMAIL,EMAIL,
-                                EMAIL_PASSWORD, DISCORD_WEBHOOK]
-                        )
-    config_has_spaces = any(' ' in value for section in config.sections() 
-                            for _, value in config.items(section))
-    if env_has_spaces:
-        raise ValueError("oci.env has spaces in values which is not acceptable")
-    if config_has_spaces:
-        raise ValueError("oci_config has spaces in values which is not acceptable")        
-
-except configparser.Error as e:
-    with open("ERROR_IN_CONFIG.log", "w", encoding='utf-8') as file:
-        file.write(str(e))
-
-    print(f"Error reading the configuration file: {e}")
-
-# Set up logging
-logging.basicConfig(
-    filename="setup_and_info.log",
-    level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - %(message)s",
-)
+from ad_selection import AttemptHistory, create_ad_policy
+from coordination import LEASE_POLL_SECS, CoordinationError, LocalCoordinator, RunnerGroup, create_coordinator
+from daemon import Daemon, create_control_token, start_control_server
+from discovery_cache import DiscoveryCache
+from fleet import Quota, missing_slots, slot_usage
+from image_catalog import ImageCatalog, iter_images
+from jobs import DEFAULT_JOB, JobCancelled, LaunchJob, read_job_settings
+from log_pipeline import LogPipeline
+from metrics import Metrics, start_http_server, start_snapshot_writer
+from notifications import DiscordBackend, EmailBackend, NotificationDispatcher, TelegramBackend
+from oci_clients import OciClients
+from profiling import Profiler, start_memory_monitor
+from retry_tokens import RetryTokenStore
+from settings import ARM_SHAPE, ConfigError, Settings
+from shape_ladder import ShapeLadder
+from scheduler import OUT_OF_CAPACITY, SERVER_ERROR, THROTTLED, RetryScheduler
+from transport import Transport, install_dns_cache
+
 logging_step5 = logging.getLogger("launch_instance")
-logging_step5.setLevel(logging.INFO)
-fh = logging.FileHandler("launch_instance.log")
-fh.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(message)s"))
-logging_step5.addHandler(fh)
-
-# Set up OCI Config and Clients
-oci_config_path = OCI_CONFIG if OCI_CONFIG else "~/.oci/config"
-config = oci.config.from_file(oci_config_path)
-iam_client = oci.identity.IdentityClient(config)
-network_client = oci.core.VirtualNetworkClient(config)
-compute_client = oci.core.ComputeClient(config)
-
-IMAGE_LIST_KEYS = [
-    "lifecycle_state",
-    "display_name",
-    "id",
-    "operating_system",
-    "operating_system_version",
-    "size_in_mbs",
-    "time_created",
-]
+metrics = Metrics()
+profiler = Profiler("")
+
+# Set up by init_runtime() once the configuration has been loaded, shared by every job
+settings = None
+transport = None
+discovery_cache = None
+image_catalog = None
+retry_tokens = None
+notifier = None
+runner_group = None
+# OCI clients per (config file, profile) and retry schedulers per tenancy, kept for the jobs added later
+clients_by_profile = {}
+schedulers_by_tenancy = {}
+# Launch attempts of every job for the bandit AD selection policy, opened on first use
+attempt_history = None
+attempt_history_lock = threading.Lock()
+# (thread, LaunchJob) growing launched instances to SHAPE_LADDER's first size, waited for before exiting
+grow_threads = []
+# Seconds a cancelled resize gets to finish the OCI call in flight
+GROW_STOP_SECS = 30
+# The process environment before oci.env was loaded, what a reload starts from
+startup_environ = {}
+
+
+def load_settings(env_file='oci.env', reload=False):
+    """Load environment variables from the .env file and read the configuration.
 
+    Args:
+        env_file (str, optional): The .env file to load. Defaults to 'oci.env'.
+        reload (bool, optional): Whether the file is read again, e.g. by the daemon. Its
+            values then replace those of the process environment, which is left as it is,
+            and variables removed from the file fall back to the environment at startup.
+            Defaults to False.
 
-def write_into_file(file_path, data):
-    """Write data into a file.
+    Returns:
+        tuple: The Settings of oci.env and the (name, Settings) of every launch job.
+
+    Raises:
+        ConfigError: If the configuration can't be used.
+    """
+    from dotenv import dotenv_values, load_dotenv
+
+    global startup_environ
+    if reload:
+        file_values = {name: value for name, value in dotenv_values(env_file).items() if value is not None}
+        env = {**startup_environ, **file_values}
+    else:
+        startup_environ = dict(os.environ)
+        load_dotenv(env_file)
+        env = os.environ
+    job_settings = read_job_settings(env)
+    # Jobs can't override the shared settings, so any job's are those of oci.env
+    return job_settings[0][1], job_settings
+
+
+def setup_logging(loaded_settings):
+    """Start writing setup_and_info.log and launch_instance.log from a background thread.
 
     Args:
-        file_path (str): The path of the file.
-        data (str): The data to be written into the file.
+        loaded_settings (Settings): The configuration.
+
+    Returns:
+        LogPipeline: The running pipeline, stop it to flush the files.
     """
-    with open(file_path, mode="a", encoding="utf-8") as file_writer:
-        file_writer.write(data)
+    pipeline = LogPipeline("setup_and_info.log", "launch_instance.log", logging_step5.name,
+                           loaded_settings.log_max_bytes, loaded_settings.log_backup_count,
+                           loaded_settings.log_summary_interval)
+    pipeline.start()
+    return pipeline
+
+
+def init_runtime(loaded_settings):
+    """Build the connection pool, caches, notifier and runner group shared by every job.
+
+    Nothing here talks to the network, except opening a COORDINATION_URL SQLite file.
+
+    Args:
+        loaded_settings (Settings): The configuration of oci.env.
+    """
+    global settings, transport, discovery_cache, image_catalog, retry_tokens, notifier, runner_group
+    global clients_by_profile, schedulers_by_tenancy, profiler, attempt_history
+    settings = loaded_settings
+    if settings.profile_dir and not profiler.directory:
+        import importlib
+
+        # Modules loaded once tracing has started would fill every snapshot, load the OCI services first
+        for module in ("oci.core", "oci.identity"):
+            importlib.import_module(module)
+        profiler = Profiler(settings.profile_dir)
+    clients_by_profile = {}
+    schedulers_by_tenancy = {}
+    with attempt_history_lock:
+        if attempt_history is not None:
+            attempt_history.close()
+        attempt_history = None
+    install_dns_cache(settings.dns_cache_ttl)
+    transport = Transport(settings.http_connect_timeout, settings.http_read_timeout)
+    discovery_cache = DiscoveryCache("discovery_cache.json", settings.discovery_cache_ttl)
+    image_catalog = ImageCatalog("images_list.json")
+    retry_tokens = RetryTokenStore("launch_tokens.json")
+
+    notification_backends = []
+    if settings.notify_email:
+        notification_backends.append(EmailBackend(settings.email, settings.email_password,
+                                                  settings.notify_timeout))
+    notify_timeout = (settings.http_connect_timeout, settings.notify_timeout)
+    if settings.discord_webhook:
+        notification_backends.append(DiscordBackend(settings.discord_webhook, transport.http_session,
+                                                    notify_timeout))
+    if settings.telegram_token and settings.telegram_user_id:
+        notification_backends.append(TelegramBackend(settings.telegram_token, settings.telegram_user_id,
+                                                     transport.http_session, notify_timeout))
+    notifier = NotificationDispatcher(notification_backends)
+
+    try:
+        coordinator = create_coordinator(settings.coordination_url, transport.http_session,
+                                         (settings.http_connect_timeout, settings.http_read_timeout),
+                                         settings.coordination_token)
+    except CoordinationError as err:
+        logging.warning("Coordination unavailable, running alone: %s", err)
+        coordinator = LocalCoordinator()
+    runner_group = RunnerGroup(coordinator, settings.runner_id or None)
+    runner_group.start()
+
+
+def create_jobs(job_settings, oci_clients=None, reconfigure=False):
+    """Build the launch jobs, sharing clients per OCI profile and the retry scheduler per tenancy.
+
+    Must be called after init_runtime(). The OCI clients are only built on first use,
+    and are reused by every later call.
+
+    Args:
+        job_settings (list): (name, Settings) tuples, as returned by load_settings().
+        oci_clients (optional): Object with identity, network and compute clients used
+         by every job. Defaults to OciClients reading each job's OCI config profile.
+        reconfigure (bool, optional): Whether the retry schedulers of earlier jobs take
+            the settings of the first of job_settings in their tenancy, e.g. after a
+            reload. Defaults to False.
+
+    Returns:
+        list: The LaunchJob objects.
+    """
+    jobs = []
+    reconfigured = set()
+    for name, job_config in job_settings:
+        profile_key = (os.path.expanduser(job_config.oci_config_path), job_config.oci_profile)
+        if profile_key not in clients_by_profile:
+            clients_by_profile[profile_key] = oci_clients or OciClients(job_config.oci_config_path, transport,
+                                                                        job_config.oci_profile)
+        scheduler_settings = (job_config.wait_time, job_config.capacity_wait_time, job_config.max_wait_time,
+                              job_config.api_rate_limit, job_config.circuit_breaker_threshold,
+                              job_config.circuit_breaker_cooldown)
+        if job_config.oci_tenancy_id not in schedulers_by_tenancy:
+            # The first job of a tenancy sets its rate limit and backoff
+            schedulers_by_tenancy[job_config.oci_tenancy_id] = RetryScheduler(*scheduler_settings)
+        elif reconfigure and job_config.oci_tenancy_id not in reconfigured:
+            schedulers_by_tenancy[job_config.oci_tenancy_id].reconfigure(*scheduler_settings)
+        reconfigured.add(job_config.oci_tenancy_id)
+        jobs.append(LaunchJob(name, job_config, clients_by_profile[profile_key],
+                              schedulers_by_tenancy[job_config.oci_tenancy_id], runners=runner_group))
+    return jobs
+
+
+def ad_history():
+    """Open ad_history.db on first use, every job and AD selection policy then shares it.
+
+    Returns:
+        AttemptHistory: The launch attempts of the bandit AD selection policy.
+    """
+    global attempt_history
+    with attempt_history_lock:
+        if attempt_history is None:
+            attempt_history = AttemptHistory("ad_history.db")
+        return attempt_history
+
+
+def profiled(phase):
+    """Decorate a function so it's profiled as part of a phase of the launch loop when PROFILE_DIR is set.
+
+    Args:
+        phase (str): The phase, e.g. "launch".
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with profiler.phase(phase):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def pause(job, seconds, reason):
+    """Sleep and account the time in the sleep_seconds_total metric.
+
+    Args:
+        job (LaunchJob): The job waiting, the sleep ends early if it's cancelled.
+        seconds (float): The time to sleep.
+        reason (str): Why the loop is waiting, e.g. the error class or "instance_watch".
+    """
+    metrics.inc("sleep_seconds_total", seconds, reason=reason)
+    job.sleep(seconds)
 
 
-def send_email(subject, body, email, password):
-    """Send an HTML email using the SMTP protocol.
+def checkpoint(job):
+    """Wait while the job is paused and account the time in the sleep_seconds_total metric.
 
     Args:
-        subject (str): The subject of the email.
-        body (str): The HTML body/content of the email.
-        email (str): The sender's email address.
-        password (str): The sender's email password or app-specific password.
+        job (LaunchJob): The job.
 
     Raises:
-        smtplib.SMTPException: If an error occurs during the SMTP communication.
+        JobCancelled: If the job has been cancelled.
     """
-    # Set up the MIME
-    message = MIMEMultipart()
-    message["Subject"] = subject
-    message["From"] = email
-    message["To"] = email
+    waited = job.checkpoint()
+    if waited:
+        metrics.inc("sleep_seconds_total", waited, reason="paused")
 
-    # Attach HTML content to the email
-    html_body = MIMEText(body, "html")
-    message.attach(html_body)
 
-    # Connect to the SMTP server
-    with smtplib.SMTP("smtp.gmail.com", 587) as server:
-        try:
-            # Start TLS for security
-            server.starttls()
-            # Login to the server
-            server.login(email, password)
-            # Send the email
-            server.sendmail(email, email, message.as_string())
-        except smtplib.SMTPException as mail_err:
-            # Handle SMTP exceptions (e.g., authentication failure, connection issues)
-            logging.error("Error while sending email: %s", mail_err)
-            raise
+def acquire_rate_limit(job):
+    """Wait for the circuit breaker and the rate limit budget of the job's tenancy, and account the waits.
 
+    With several runners the budget is split evenly between the live ones. A paused
+    job waits here until it's resumed, and a job cancelled while waiting stops
+    without making the call.
 
-def list_all_instances(compartment_id):
-    """Retrieve a list of all instances in the specified compartment.
+    Args:
+        job (LaunchJob): The job making the call.
+
+    Raises:
+        JobCancelled: If the job has been cancelled.
+    """
+    def sleep(seconds):
+        job.sleep(seconds)
+        checkpoint(job)
+
+    checkpoint(job)
+    job.retry_scheduler.set_share(job.runners.share())
+    waited = job.retry_scheduler.breaker.wait(sleep)
+    if waited:
+        metrics.inc("sleep_seconds_total", waited, reason="circuit_open")
+    waited = job.retry_scheduler.acquire(sleep)
+    if waited:
+        metrics.inc("sleep_seconds_total", waited, reason="rate_limit")
+
+
+def write_into_file(file_path, data):
+    """Write data into a file.
 
     Args:
+        file_path (str): The path of the file.
+        data (str): The data to be written into the file.
+    """
+    with open(file_path, mode="a", encoding="utf-8") as file_writer:
+        file_writer.write(data)
+
+
+def list_all_instances(job, compartment_id, states=None):
+    """Retrieve a list of all instances in the specified compartment, following every page.
+
+    Args:
+        job (LaunchJob): The job making the calls.
         compartment_id (str): The compartment ID.
+        states (tuple, optional): Only return instances in these lifecycle states,
+         filtered by the OCI service. Defaults to None, which returns every instance.
 
     Returns:
-        list: The list of instances returned from the OCI service.
+        list: The list of instances returned from the OCI service, newest first.
     """
-    list_instances_response = compute_client.list_instances(compartment_id=compartment_id)
-    return list_instances_response.data
+    instances = []
+    for state in states or (None,):
+        filters = {"lifecycle_state": state} if state else {}
+        page = None
+        while True:
+            response = execute_oci_request(job, job.clients.compute, "list_instances",
+                                           compartment_id=compartment_id, page=page, **filters)
+            instances.extend(response.data)
+            page = response.next_page
+            if not page:
+                break
+    if states and len(states) > 1:
+        instances.sort(key=lambda instance: instance.time_created, reverse=True)
+    return instances
+
+
+@profiled("watch")
+def wait_for_instance(job, instance_id, states, timeout=None):
+    """Poll a single instance until it reaches one of the given states.
+
+    The wait between polls starts at INSTANCE_POLL_INTERVAL_SECS and doubles up to 30 seconds.
+
+    Args:
+        job (LaunchJob): The job that launched the instance.
+        instance_id (str): The OCID of the instance.
+        states (tuple): The lifecycle states to wait for.
+        timeout (int, optional): Give up after this many seconds. Defaults to INSTANCE_WATCH_TIMEOUT_SECS.
+
+    Returns:
+        oci.core.models.Instance: The instance, or None if it got terminated or the timeout passed.
+    """
+    deadline = time.monotonic() + (job.settings.instance_watch_timeout if timeout is None else timeout)
+    delay = job.settings.instance_poll_interval
+    while True:
+        instance = execute_oci_command(job, job.clients.compute, "get_instance", instance_id)
+        if instance.lifecycle_state in states:
+            return instance
+        if instance.lifecycle_state in ("TERMINATING", "TERMINATED"):
+            return None
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return None
+        pause(job, min(delay, remaining), "instance_watch")
+        delay = min(delay * 2, 30)
 
 
 def generate_html_body(instance):
@@ -202,8 +387,7 @@ def create_instance_details_file_and_notify(instance, shape=ARM_SHAPE):
     # Generate HTML body for email
     html_body = generate_html_body(instance)
 
-    if NOTIFY_EMAIL:
-        send_email('OCI INSTANCE CREATED', html_body, EMAIL, EMAIL_PASSWORD)
+    notifier.notify(body, subject='OCI INSTANCE CREATED', html=html_body, channels=("email",))
 
 
 def notify_on_failure(failure_msg):
@@ -223,53 +407,85 @@ def notify_on_failure(failure_msg):
         f"{failure_msg}"
     )
     write_into_file('UNHANDLED_ERROR.log', mail_body)
-    if NOTIFY_EMAIL:
-        send_email('OCI INSTANCE CREATION SCRIPT: FAILED DUE TO AN ERROR', mail_body, EMAIL, EMAIL_PASSWORD)
+    notifier.notify(mail_body, subject='OCI INSTANCE CREATION SCRIPT: FAILED DUE TO AN ERROR',
+                    channels=("email",))
 
 
-def check_instance_state_and_write(compartment_id, shape, states=('RUNNING', 'PROVISIONING'),
-                                   tries=3):
+@profiled("watch")
+def check_instance_state_and_write(job, compartment_id, shape, states=('RUNNING', 'PROVISIONING'),
+                                   tries=3, instance_id=None):
     """Check the state of instances in the specified compartment and take action when a matching instance is found.
 
     Args:
+        job (LaunchJob): The job looking for its instance.
         compartment_id (str): The compartment ID to check for instances.
         shape (str): The shape of the instance.
         states (tuple, optional): The lifecycle states to consider. Defaults to ('RUNNING', 'PROVISIONING').
         tries(int, optional): No of reties until an instance is found. Defaults to 3.
+        instance_id (str, optional): OCID of a just launched instance. When given, only that
+         instance is watched instead of scanning the compartment. Defaults to None.
 
     Returns:
         bool: True if a matching instance is found, False otherwise.
     """
-    for _ in range(tries):
-        instance_list = list_all_instances(compartment_id=compartment_id)
+    if instance_id:
+        instance = wait_for_instance(job, instance_id, states)
+        if instance:
+            create_instance_details_file_and_notify(instance, shape)
+            return True
+        return False
+
+    delay = job.settings.instance_poll_interval
+    for attempt in range(tries):
+        instance_list = [instance for instance in list_all_instances(job, compartment_id, states)
+                         if instance.shape == shape]
         if shape == ARM_SHAPE:
-            running_arm_instance = next((instance for instance in instance_list if
-                                         instance.shape == shape and instance.lifecycle_state in states), None)
-            if running_arm_instance:
-                create_instance_details_file_and_notify(running_arm_instance, shape)
+            if instance_list:
+                create_instance_details_file_and_notify(instance_list[0], shape)
                 return True
         else:
-            micro_instance_list = [instance for instance in instance_list if
-                                   instance.shape == shape and instance.lifecycle_state in states]
-            if len(micro_instance_list) > 1 and SECOND_MICRO_INSTANCE:
-                create_instance_details_file_and_notify(micro_instance_list[-1], shape)
+            if len(instance_list) > 1 and job.settings.second_micro_instance:
+                create_instance_details_file_and_notify(instance_list[-1], shape)
                 return True
-            if len(micro_instance_list) == 1 and not SECOND_MICRO_INSTANCE:
-                create_instance_details_file_and_notify(micro_instance_list[-1], shape)
-                return True       
-        if tries - 1 > 0:
-            time.sleep(60)
+            if len(instance_list) == 1 and not job.settings.second_micro_instance:
+                create_instance_details_file_and_notify(instance_list[-1], shape)
+                return True
+        if attempt < tries - 1:
+            pause(job, delay, "instance_watch")
+            delay = min(delay * 2, 30)
 
     return False
 
 
-def handle_errors(command, data, log):
+def classify_error(data):
+    """Classify a temporary error so the retry scheduler can pick a backoff.
+
+    Args:
+        data (dict): The error information returned from the OCI service.
+
+    Returns:
+        str: THROTTLED, OUT_OF_CAPACITY, SERVER_ERROR, or None if the error is not temporary.
+    """
+    code = data.get("code")
+    message = data.get("message")
+    if code == "TooManyRequests" or data.get("status") == 429:
+        return THROTTLED
+    if "Out of host capacity." in (code, message):
+        return OUT_OF_CAPACITY
+    if code in ("InternalError", "RequestException") or message == "Bad Gateway" \
+            or (data.get("status") or 0) >= 500:
+        return SERVER_ERROR
+    return None
+
+
+def handle_errors(job, command, data, wait=True):
     """Handles errors and logs messages.
 
     Args:
+        job (LaunchJob): The job whose call failed, its launch logger gets the message.
         command (arg): The OCI command being executed.
         data (dict): The data or error information returned from the OCI service.
-        log (logging.Logger): The logger instance for logging messages.
+        wait (bool, optional): Sleep before returning for temporary errors. Defaults to True.
 
     Returns:
         bool: True if the error is temporary and the operation should be retried after a delay.
@@ -277,16 +493,16 @@ def handle_errors(command, data, log):
     """
 
     # Check for temporary errors that can be retried
-    if "code" in data:
-        if (data["code"] in ("TooManyRequests", "Out of host capacity.", 'InternalError')) \
-                or (data["message"] in ("Out of host capacity.", "Bad Gateway")):
-            log.info("Command: %s--\nOutput: %s", command, data)
-            time.sleep(WAIT_TIME)
-            return True
-
-    if "status" in data and data["status"] == 502:
-        log.info("Command: %s~~\nOutput: %s", command, data)
-        time.sleep(WAIT_TIME)
+    error_class = classify_error(data)
+    if error_class:
+        extra = {"error": data}
+        if error_class == OUT_OF_CAPACITY:
+            # Identical capacity errors are written as periodic summaries
+            extra["collapse_key"] = data.get("message")
+        job.log.info("Command: %s--\nOutput: %s", command, data, extra=extra)
+        delay = job.retry_scheduler.record_error(error_class)
+        if wait:
+            pause(job, delay, error_class)
         return True
     failure_msg = '\n'.join([f'{key}: {value}' for key, value in data.items()])
     notify_on_failure(failure_msg)
@@ -294,10 +510,51 @@ def handle_errors(command, data, log):
     raise Exception("Error: %s" % data)
 
 
-def execute_oci_command(client, method, *args, **kwargs):
+@contextmanager
+def timed_oci_call(method, **labels):
+    """Record the latency and outcome of an OCI call.
+
+    Args:
+        method (str): The client method being called.
+        labels: Extra metric labels, e.g. the availability domain.
+    """
+    import oci
+    import requests
+
+    start = time.monotonic()
+    outcome = "success"
+    try:
+        yield
+    except oci.exceptions.ServiceError as srv_err:
+        outcome = error_label(srv_err)
+        raise
+    except requests.RequestException:
+        outcome = "RequestException"
+        raise
+    finally:
+        elapsed = time.monotonic() - start
+        metrics.observe("oci_call_duration_seconds", elapsed, method=method, **labels)
+        metrics.inc("network_seconds_total", elapsed)
+        metrics.inc("oci_calls_total", method=method, outcome=outcome, **labels)
+
+
+def error_label(srv_err):
+    """Metric label of a ServiceError, telling capacity errors apart from other InternalErrors.
+
+    Args:
+        srv_err (oci.exceptions.ServiceError): The error.
+
+    Returns:
+        str: The label.
+    """
+    return "OutOfHostCapacity" if srv_err.message == "Out of host capacity." else srv_err.code
+
+
+def execute_oci_command(job, client, method, *args, **kwargs):
     """Executes an OCI command using the specified OCI client.
 
     Args:
+        job (LaunchJob): The job making the call, for its rate limit, retries and logs.
         client: The OCI client instance.
         method (str): The method to call on the OCI client.
         args: Additional positional arguments to pass to the OCI client method.
@@ -309,16 +566,59 @@ def execute_oci_command(client, method, *args, **kwargs):
     Raises:
         Exception: Raises an exception if an unexpected error occurs.
     """
+    response = execute_oci_request(job, client, method, *args, **kwargs)
+    return response.data if hasattr(response, "data") else response
+
+
+def execute_oci_request(job, client, method, *args, **kwargs):
+    """Same as execute_oci_command but returns the whole response, e.g. for pagination headers.
+
+    Args:
+        job (LaunchJob): The job making the call, for its rate limit, retries and logs.
+        client: The OCI client instance.
+        method (str): The method to call on the OCI client.
+        args: Additional positional arguments to pass to the OCI client method.
+        kwargs: Additional keyword arguments to pass to the OCI client method.
+
+    Returns:
+        oci.response.Response: The response returned from the OCI service.
+
+    Raises:
+        Exception: Raises an exception if an unexpected error occurs.
+        oci.exceptions.ServiceError: If a temporary error other than out of capacity persists
+         after OCI_MAX_RETRIES retries.
+        requests.RequestException: If the OCI endpoint stays unreachable after OCI_MAX_RETRIES retries.
+    """
+    import oci
+    import requests
+
+    failures = 0
     while True:
         try:
-            response = getattr(client, method)(*args, **kwargs)
-            data = response.data if hasattr(response, "data") else response
-            return data
+            acquire_rate_limit(job)
+            with timed_oci_call(method):
+                response = getattr(client, method)(*args, **kwargs)
+            job.retry_scheduler.record_success()
+            return response
         except oci.exceptions.ServiceError as srv_err:
+            error = srv_err
             data = {"status": srv_err.status,
                     "code": srv_err.code,
                     "message": srv_err.message}
-            handle_errors(args, data, logging_step5)
+        except requests.RequestException as req_err:
+            error = req_err
+            data = {"status": None,
+                    "code": "RequestException",
+                    "message": str(req_err)}
+        error_class = classify_error(data)
+        if error_class != OUT_OF_CAPACITY:
+            # Capacity errors come from a healthy service, they're retried until capacity frees up
+            failures += 1
+        max_retries = job.settings.oci_max_retries
+        if max_retries and failures > max_retries and error_class:
+            job.log.error("Giving up on %s after %s retries: %s", method, max_retries, data)
+            raise error
+        handle_errors(job, args, data)
 
 
 def generate_ssh_key_pair(public_key_file: Union[str, Path], private_key_file: Union[str, Path]):
@@ -328,6 +628,8 @@ def generate_ssh_key_pair(public_key_file: Union[str, Path], private_key_file: U
         public_key_file :file to save the public key.
         private_key_file : The file to save the private key.
     """
+    import paramiko
+
     key = paramiko.RSAKey.generate(2048)
     key.write_private_key_file(private_key_file)
     # Save public key to file
@@ -358,137 +660,808 @@ def read_or_generate_ssh_public_key(public_key_file: Union[str, Path]):
     return ssh_public_key
 
 
-def send_discord_message(message):
-    """Send a message to Discord using the webhook URL if available."""
-    if DISCORD_WEBHOOK:
-        payload = {"content": message}
-        try:
-            response = requests.post(DISCORD_WEBHOOK, json=payload)
-            response.raise_for_status()
-        except requests.RequestException as e:
-            logging.error("Failed to send Discord message: %s", e)
+def send_notification(message):
+    """Send a message to every configured chat channel (Discord, Telegram) in the background."""
+    notifier.notify(message, channels=("discord", "telegram"))
 
 
-def launch_instance():
-    """Launches an OCI Compute instance using the specified parameters.
+def build_launch_instance_details(job, availability_domain, compartment_id, subnet_id, image_id,
+                                  shape_config, assign_public_ip, boot_volume_size, ssh_public_key):
+    """Build the launch request for a single availability domain.
+
+    Args:
+        job (LaunchJob): The job whose display name and shape are launched.
+        availability_domain (str): The availability domain to launch in.
+        compartment_id (str): The compartment ID.
+        subnet_id (str): The subnet ID for the primary VNIC.
+        image_id (str): The image ID to boot from.
+        shape_config (oci.core.models.LaunchInstanceShapeConfigDetails): OCPU and memory of the shape.
+        assign_public_ip (bool): Assign an ephemeral public IP to the VNIC.
+        boot_volume_size (int): Size of the boot volume in GB.
+        ssh_public_key (str): The SSH public key to authorize on the instance.
+
+    Returns:
+        oci.core.models.LaunchInstanceDetails: The launch request.
+    """
+    import oci
+
+    return oci.core.models.LaunchInstanceDetails(
+        availability_domain=availability_domain,
+        compartment_id=compartment_id,
+        create_vnic_details=oci.core.models.CreateVnicDetails(
+            assign_public_ip=assign_public_ip,
+            assign_private_dns_record=True,
+            display_name=job.settings.display_name,
+            subnet_id=subnet_id,
+        ),
+        display_name=job.settings.display_name,
+        shape=job.settings.oci_compute_shape,
+        availability_config=oci.core.models.LaunchInstanceAvailabilityConfigDetails(
+            recovery_action="RESTORE_INSTANCE"
+        ),
+        instance_options=oci.core.models.InstanceOptions(
+            are_legacy_imds_endpoints_disabled=False
+        ),
+        shape_config=shape_config,
+        source_details=oci.core.models.InstanceSourceViaImageDetails(
+            source_type="image",
+            image_id=image_id,
+            boot_volume_size_in_gbs=boot_volume_size,
+        ),
+        metadata={
+            "ssh_authorized_keys": ssh_public_key},
+    )
+
+
+def launch_key(job, ad_name, shape, shape_config):
+    """Identify a launch request for its retry token.
+
+    Args:
+        job (LaunchJob): The job sending the request.
+        ad_name (str): The availability domain.
+        shape (str): The compute shape.
+        shape_config (oci.core.models.LaunchInstanceShapeConfigDetails): OCPU and memory of the shape.
+
+    Returns:
+        str: The key.
+    """
+    if shape_config is None:
+        return f"{job.name}|{ad_name}|{shape}"
+    return f"{job.name}|{ad_name}|{shape}|{shape_config.ocpus}|{shape_config.memory_in_gbs}"
+
+
+@profiled("launch")
+def rate_limited_launch(job, launch_instance_details, ad_policy=None):
+    """Send a launch request once the rate limit budget allows it.
+
+    The request carries a retry token. If it fails without telling whether the
+    instance was created, the token is kept and the next request with the same
+    AD, shape and size replays it, so OCI answers with the original launch
+    instead of creating a second instance.
+
+    Args:
+        job (LaunchJob): The job sending the request.
+        launch_instance_details (oci.core.models.LaunchInstanceDetails): The launch request.
+        ad_policy (optional): AD selection policy to report capacity outcomes to. Defaults to None.
+
+    Returns:
+        oci.response.Response: The launch response.
 
     Raises:
-        Exception: Raises an exception if an unexpected error occurs.
+        oci.exceptions.ServiceError: If the launch failed. Timeouts and connection
+         errors are raised as a ServiceError with the "RequestException" code.
     """
+    import oci
+    import requests
+
+    ad_name = launch_instance_details.availability_domain
+    key = launch_key(job, ad_name, launch_instance_details.shape, launch_instance_details.shape_config)
+    token = retry_tokens.token_for(key)
+    acquire_rate_limit(job)
+    metrics.inc("launch_attempts_total", ad=ad_name, job=job.name)
+    try:
+        with timed_oci_call("launch_instance", ad=ad_name):
+            response = job.clients.compute.launch_instance(launch_instance_details=launch_instance_details,
+                                                           opc_retry_token=token)
+    except oci.exceptions.ServiceError as srv_err:
+        if classify_error({"status": srv_err.status, "code": srv_err.code,
+                           "message": srv_err.message}) == SERVER_ERROR:
+            # The launch may have gone through, replay the token next time
+            retry_tokens.keep(key, token)
+        else:
+            retry_tokens.resolve(key)
+        # Throttling and server errors say nothing about the AD's capacity
+        if ad_policy and srv_err.message == "Out of host capacity.":
+            ad_policy.record(ad_name, False)
+        raise
+    except requests.RequestException as req_err:
+        retry_tokens.keep(key, token)
+        raise oci.exceptions.ServiceError(None, "RequestException", {}, str(req_err)) from req_err
+    retry_tokens.resolve(key)
+    job.retry_scheduler.record_success()
+    if response.status == 200:
+        job.log.info("Launch work request %s for instance %s",
+                     response.headers.get("opc-work-request-id"), response.data.id)
+        if ad_policy:
+            ad_policy.record(ad_name, True)
+    return response
+
+
+def launch_in_all_availability_domains(job, ad_names, details_for_ad, ad_policy=None):
+    """Send a launch request to every availability domain at once.
+
+    Every availability domain gets its own worker, so every one of them is always
+    attempted. The first successful response is kept, and any other launch that also
+    succeeded is terminated so that a sweep never leaves more than one instance
+    behind. Failing to terminate such a duplicate is logged, the kept launch is
+    still returned.
+
+    Args:
+        job (LaunchJob): The job sending the requests.
+        ad_names (list): The availability domains to launch in.
+        details_for_ad (callable): Returns the launch request for an availability domain.
+        ad_policy (optional): AD selection policy to report capacity outcomes to. Defaults to None.
+
+    Returns:
+        tuple: The successful launch response (or None) and the list of
+        oci.exceptions.ServiceError raised by the other availability domains.
+    """
+    import oci
+
+    launch_response = None
+    errors = []
+    with ThreadPoolExecutor(max_workers=len(ad_names)) as executor:
+        futures = {executor.submit(rate_limited_launch, job, details_for_ad(ad_name), ad_policy): ad_name
+                   for ad_name in ad_names}
+        for future in as_completed(futures):
+            try:
+                response = future.result()
+            except oci.exceptions.ServiceError as srv_err:
+                errors.append(srv_err)
+                continue
+            if response.status != 200:
+                continue
+            if launch_response is None:
+                launch_response = response
+            else:
+                job.log.info("Duplicate launch succeeded in %s, terminating %s",
+                             futures[future], response.data.id)
+                try:
+                    execute_oci_command(job, job.clients.compute, "terminate_instance", response.data.id)
+                except Exception:
+                    # The kept instance is running, losing it over the duplicate would launch a third
+                    job.log.exception("Failed to terminate duplicate instance %s, terminate it manually",
+                                      response.data.id)
+
+    return launch_response, errors
+
+
+@profiled("errors")
+def handle_launch_error(job, srv_err, compartment_id, wait=True):
+    """Handle a ServiceError raised by a launch request.
+
+    Args:
+        job (LaunchJob): The job whose launch failed.
+        srv_err (oci.exceptions.ServiceError): The error raised by launch_instance.
+        compartment_id (str): The compartment ID to check for instances.
+        wait (bool, optional): Sleep before returning for temporary errors. Defaults to True.
+
+    Returns:
+        bool: True if the error is LimitExceeded and the job's instance already exists.
+
+    Raises:
+        Exception: Raises an exception if the error is not temporary.
+    """
+    if srv_err.code in ("NotAuthorizedOrNotFound", "InvalidParameter"):
+        # A cached subnet or image may have been deleted, rediscover them on the next run
+        discovery_cache.invalidate(get_discovery_cache_key(job))
+    if srv_err.code == "LimitExceeded" and job.count_existing:
+        # Our own launches with an unknown outcome are settled by replaying their retry
+        # token, so a single look for an instance created elsewhere is enough here
+        job.log.info("Encoundered LimitExceeded Error checking if instance is created" \
+                     "code :%s, message: %s, status: %s", srv_err.code, srv_err.message, srv_err.status)
+        instance_exist_flag = check_instance_state_and_write(job, compartment_id, job.settings.oci_compute_shape,
+                                                             tries=1)
+        if instance_exist_flag:
+            job.log.info("%s , stopping the job", srv_err.code)
+            return True
+        job.log.info("Didn't find an instance , proceeding with retries")
+    data = {
+        "status": srv_err.status,
+        "code": srv_err.code,
+        "message": srv_err.message,
+    }
+    handle_errors(job, "launch_instance", data, wait=wait)
+    return False
+
+
+def find_image_id(job, compartment_id):
+    """Find the newest image matching OPERATING_SYSTEM and OS_VERSION for the compute shape.
+
+    The image catalog in images_list.json is kept per region and shape, and rebuilt
+    from every page of list_images when it's older than DISCOVERY_CACHE_TTL_SECS,
+    otherwise it's used as is.
+
+    Args:
+        job (LaunchJob): The job looking for its image.
+        compartment_id (str): The compartment ID to list images in.
+
+    Returns:
+        str: The image ID.
+
+    Raises:
+        ValueError: If no image matches the operating system and version.
+    """
+    job_config = job.settings
+    # Image OCIDs differ between regions
+    catalog_key = f"{job_config.oci_region}|{job_config.oci_compute_shape}"
+    if not image_catalog.is_fresh(catalog_key, job_config.discovery_cache_ttl):
+        image_catalog.rebuild(catalog_key, iter_images(
+            lambda page: execute_oci_request(job, job.clients.compute, "list_images",
+                                             compartment_id=compartment_id,
+                                             shape=job_config.oci_compute_shape, page=page)))
+    image = image_catalog.lookup(catalog_key, job_config.operating_system, job_config.os_version)
+    if image is None:
+        raise ValueError(f"No {job_config.operating_system} {job_config.os_version} image found for "
+                         f"{job_config.oci_compute_shape}, check images_list.json for the available ones")
+    return image["id"]
+
+
+def get_discovery_cache_key(job):
+    """Build the discovery cache key for a job's configuration.
+
+    Args:
+        job (LaunchJob): The job.
+
+    Returns:
+        str: The key identifying the config profile, user, region, shape, OS and version.
+    """
+    job_config = job.settings
+    return "|".join([os.path.abspath(os.path.expanduser(job_config.oci_config_path)), job_config.oci_profile,
+                     job_config.oci_user_id, job_config.oci_region or "", job_config.oci_compute_shape,
+                     job_config.operating_system, job_config.os_version])
+
+
+def grow_instance_to_target(job, instance):
+    """Resize an A1.Flex instance launched on a smaller rung of SHAPE_LADDER to the first rung.
+
+    Out of capacity errors of the update are retried until capacity frees up, other
+    temporary errors up to OCI_MAX_RETRIES times. Resizing reboots the instance.
+
+    Args:
+        job (LaunchJob): The job that launched the instance.
+        instance (oci.core.models.Instance): The launched instance.
+    """
+    import oci
+
+    target_ocpus, target_memory = job.settings.shape_ladder[0]
+    if not job.settings.shape_grow_to_target or instance.shape != ARM_SHAPE or instance.shape_config is None \
+            or (instance.shape_config.ocpus, instance.shape_config.memory_in_gbs) >= (target_ocpus, target_memory):
+        return
+    if wait_for_instance(job, instance.id, ("RUNNING",),
+                         timeout=max(job.settings.instance_watch_timeout, 600)) is None:
+        job.setup_log.error("Instance %s isn't running, not growing it to %s OCPUs / %s GB",
+                            instance.id, target_ocpus, target_memory)
+        return
+    job.setup_log.info("Growing instance %s to %s OCPUs / %s GB", instance.id, target_ocpus, target_memory)
+    try:
+        shape_config = oci.core.models.UpdateInstanceShapeConfigDetails(ocpus=target_ocpus,
+                                                                        memory_in_gbs=target_memory)
+        execute_oci_command(job, job.clients.compute, "update_instance", instance.id,
+                            oci.core.models.UpdateInstanceDetails(shape_config=shape_config))
+    except Exception as err:
+        job.setup_log.error("Failed to grow instance %s: %s", instance.id, err)
+        return
+    send_notification(f"📈 Instance {instance.display_name} has been grown to "
+                      f"{target_ocpus:g} OCPUs / {target_memory:g} GB.")
+
+
+def grow_in_background(job, instance):
+    """Run grow_instance_to_target in its own thread, so the job ends without waiting for the resize.
+
+    The resize is cancelled on its own, once SHAPE_GROW_TIMEOUT_MINUTES have passed or
+    by stop_growing(), without cancelling the job, e.g. the rest of a fleet. Pausing
+    the job pauses it.
+
+    Args:
+        job (LaunchJob): The job that launched the instance.
+        instance (oci.core.models.Instance): The launched instance.
+    """
+    grow_job = LaunchJob(job.name, job.settings, job.clients, job.retry_scheduler, job.count_existing, job.runners)
+    grow_job.resumed = job.resumed
+    deadline = threading.Timer(job.settings.shape_grow_timeout, grow_job.cancelled.set)
+    deadline.daemon = True
+
+    def grow():
+        try:
+            grow_instance_to_target(grow_job, instance)
+        except JobCancelled:
+            job.setup_log.warning("Gave up growing instance %s", instance.id)
+        except Exception:
+            job.setup_log.exception("Failed to grow instance %s", instance.id)
+        finally:
+            deadline.cancel()
+            grow_threads.remove((thread, grow_job))
+
+    thread = threading.Thread(target=grow, name=f"grow-{job.name}")
+    grow_threads.append((thread, grow_job))
+    deadline.start()
+    thread.start()
+
+
+def stop_growing(wait):
+    """Wait for the instances being grown in the background, or give up on them.
+
+    Args:
+        wait (bool): Whether to wait until the resizes are done or their
+            SHAPE_GROW_TIMEOUT_MINUTES have passed, rather than giving up at once.
+            Interrupting the wait gives up too.
+    """
+    try:
+        for thread, grow_job in list(grow_threads):
+            if not wait:
+                grow_job.cancelled.set()
+            thread.join()
+    finally:
+        for thread, grow_job in list(grow_threads):
+            grow_job.cancelled.set()
+        for thread, grow_job in list(grow_threads):
+            thread.join(GROW_STOP_SECS)
+
+
+@profiled("discover")
+def discover(job):
+    """Look up the tenancy, availability domains, subnet and image of a job.
+
+    Args:
+        job (LaunchJob): The job.
+
+    Returns:
+        dict: The "tenancy", "availability_domains" (every AD of the tenancy),
+        "subnet_id" and "image_id".
+    """
+    job_config = job.settings
+    # Steps 1-4 return the same answers on every run, so reuse them while the cache is fresh
+    discovery_key = get_discovery_cache_key(job)
+    discovered = discovery_cache.get(discovery_key) or {}
+    cache_updated = False
+
     # Step 1 - Get TENANCY
-    user_info = execute_oci_command(iam_client, "get_user", OCI_USER_ID)
-    oci_tenancy = user_info.compartment_id
-    logging.info("OCI_TENANCY: %s", oci_tenancy)
+    oci_tenancy = discovered.get("tenancy")
+    if not oci_tenancy:
+        user_info = execute_oci_command(job, job.clients.identity, "get_user", job_config.oci_user_id)
+        oci_tenancy = discovered["tenancy"] = user_info.compartment_id
+        cache_updated = True
+    job.setup_log.info("OCI_TENANCY: %s", oci_tenancy)
 
     # Step 2 - Get AD Name
-    availability_domains = execute_oci_command(iam_client,
-                                               "list_availability_domains",
-                                               compartment_id=oci_tenancy)
-    oci_ad_name = [item.name for item in availability_domains if
-                   any(item.name.endswith(oct_ad) for oct_ad in OCT_FREE_AD.split(","))]
-    oci_ad_names = itertools.cycle(oci_ad_name)
-    logging.info("OCI_AD_NAME: %s", oci_ad_name)
+    all_ad_names = discovered.get("availability_domains")
+    if not all_ad_names:
+        availability_domains = execute_oci_command(job, job.clients.identity,
+                                                   "list_availability_domains",
+                                                   compartment_id=oci_tenancy)
+        all_ad_names = discovered["availability_domains"] = [item.name for item in availability_domains]
+        cache_updated = True
 
     # Step 3 - Get Subnet ID
-    oci_subnet_id = OCI_SUBNET_ID
+    oci_subnet_id = job_config.oci_subnet_id or discovered.get("subnet_id")
     if not oci_subnet_id:
-        subnets = execute_oci_command(network_client,
+        subnets = execute_oci_command(job, job.clients.network,
                                       "list_subnets",
                                       compartment_id=oci_tenancy)
-        oci_subnet_id = subnets[0].id
-    logging.info("OCI_SUBNET_ID: %s", oci_subnet_id)
+        oci_subnet_id = discovered["subnet_id"] = subnets[0].id
+        cache_updated = True
+    job.setup_log.info("OCI_SUBNET_ID: %s", oci_subnet_id)
 
     # Step 4 - Get Image ID of Compute Shape
-    if not OCI_IMAGE_ID:
-        images = execute_oci_command(
-            compute_client,
-            "list_images",
-            compartment_id=oci_tenancy,
-            shape=OCI_COMPUTE_SHAPE,
-        )
-        shortened_images = [{key: json.loads(str(image))[key] for key in IMAGE_LIST_KEYS
-                             } for image in images]
-        write_into_file('images_list.json', json.dumps(shortened_images, indent=2))
-        oci_image_id = next(image.id for image in images if
-                            image.operating_system == OPERATING_SYSTEM and
-                            image.operating_system_version == OS_VERSION)
-        logging.info("OCI_IMAGE_ID: %s", oci_image_id)
-    else:
-        oci_image_id = OCI_IMAGE_ID
+    oci_image_id = job_config.oci_image_id or discovered.get("image_id")
+    if not oci_image_id:
+        oci_image_id = discovered["image_id"] = find_image_id(job, oci_tenancy)
+        cache_updated = True
+    job.setup_log.info("OCI_IMAGE_ID: %s", oci_image_id)
+
+    if cache_updated:
+        discovery_cache.set(discovery_key, discovered)
+    return {"tenancy": oci_tenancy, "availability_domains": all_ad_names,
+            "subnet_id": oci_subnet_id, "image_id": oci_image_id}
+
+
+def launch_instance(job, target=None):
+    """Launches an OCI Compute instance using the specified parameters.
+
+    Args:
+        job (LaunchJob): The job describing the instance.
+        target (dict, optional): The job's tenancy, ADs, subnet and image as returned
+         by discover(). Defaults to looking them up.
 
-    assign_public_ip = ASSIGN_PUBLIC_IP.lower() in [ "true", "1", "y", "yes" ]
+    Returns:
+        oci.core.models.Instance: The instance launched by this run, or None if it
+        already existed or was found after an ambiguous error.
 
-    boot_volume_size = max(50, int(BOOT_VOLUME_SIZE))
+    Raises:
+        Exception: Raises an exception if an unexpected error occurs.
+    """
+    import oci
 
-    ssh_public_key = read_or_generate_ssh_public_key(SSH_AUTHORIZED_KEYS_FILE)
+    job_config = job.settings
+    target = target or discover(job)
+    oci_tenancy = target["tenancy"]
+    oci_subnet_id = target["subnet_id"]
+    oci_image_id = target["image_id"]
+    oci_ad_name = [name for name in target["availability_domains"] if
+                   any(name.endswith(oct_ad) for oct_ad in job_config.oct_free_ad.split(","))]
+    job.setup_log.info("OCI_AD_NAME: %s", oci_ad_name)
+
+    ssh_public_key = read_or_generate_ssh_public_key(job_config.ssh_authorized_keys_file)
 
     # Step 5 - Launch Instance if it's not already exist and running
-    instance_exist_flag = check_instance_state_and_write(oci_tenancy, OCI_COMPUTE_SHAPE, tries=1)
+    instance_exist_flag = job.count_existing and check_instance_state_and_write(
+        job, oci_tenancy, job_config.oci_compute_shape, tries=1)
 
-    if OCI_COMPUTE_SHAPE == "VM.Standard.A1.Flex":
-        shape_config = oci.core.models.LaunchInstanceShapeConfigDetails(ocpus=4, memory_in_gbs=24)
+    if job_config.oci_compute_shape == ARM_SHAPE:
+        shape_ladder = ShapeLadder(job_config.shape_ladder, job_config.shape_ladder_step_attempts,
+                                   job_config.shape_ladder_step_secs)
     else:
-        shape_config = oci.core.models.LaunchInstanceShapeConfigDetails(ocpus=1, memory_in_gbs=1)
+        shape_ladder = ShapeLadder([(1, 1)], 0, 0)
+    shape_configs = {rung: oci.core.models.LaunchInstanceShapeConfigDetails(ocpus=rung[0], memory_in_gbs=rung[1])
+                     for rung in shape_ladder.rungs}
+
+    launch_details = {}
+
+    def details_for_ad(ad_name, rung=None):
+        # Only the AD and size change between requests, so each request is built once and reused
+        key = (ad_name, rung or shape_ladder.current)
+        if key not in launch_details:
+            launch_details[key] = build_launch_instance_details(
+                job, ad_name, oci_tenancy, oci_subnet_id, oci_image_id, shape_configs[key[1]],
+                job_config.assign_public_ip, job_config.boot_volume_size, ssh_public_key)
+        return launch_details[key]
+
+    def pending_launches():
+        # Launches with an unknown outcome on any rung, the ladder may have stepped down since
+        return [(ad_name, rung) for rung, shape_config in shape_configs.items() for ad_name in oci_ad_name
+                if retry_tokens.is_pending(launch_key(job, ad_name, job_config.oci_compute_shape, shape_config))]
+
+    launched_instance = None
+    # Every runner launching this instance takes the same lease
+    lease_name = f"{oci_tenancy}|{job_config.oci_compute_shape}|{job_config.display_name}"
+    ad_shard = ad_policy = None
 
     while not instance_exist_flag:
+        # Pause before taking the lease rather than while holding it
+        checkpoint(job)
+        shard = job.runners.shard(oci_ad_name)
+        if shard != ad_shard:
+            ad_shard = shard
+            history = ad_history() if job_config.ad_selection_policy == "bandit" else None
+            ad_policy = create_ad_policy(job_config.ad_selection_policy, ad_shard, history,
+                                         job_config.ad_history_half_life)
+            if ad_shard != oci_ad_name:
+                job.setup_log.info("Launching in %s, the other ADs are left to the other runners", ad_shard)
+            concurrent_launch = job_config.concurrent_ad_launch and len(ad_shard) > 1
+            if concurrent_launch:
+                job.setup_log.info("Launching concurrently in %s availability domains", len(ad_shard))
+
+        other_instance = job.runners.marked(lease_name, job_config.instance_watch_timeout)
+        if other_instance:
+            # Another runner launched the instance, stop once it's listed
+            instance_exist_flag = any(instance.id == other_instance for instance in list_all_instances(
+                job, oci_tenancy, ("PROVISIONING", "STARTING", "RUNNING")))
+            if instance_exist_flag:
+                job.log.info("Instance %s was launched by another runner", other_instance)
+            else:
+                pause(job, LEASE_POLL_SECS, "launch_lease")
+            continue
+        if not job.runners.acquire(lease_name, job_config.launch_lease_secs):
+            # Another runner has a launch in flight
+            pause(job, LEASE_POLL_SECS, "launch_lease")
+            continue
+
         try:
-            launch_instance_response = compute_client.launch_instance(
-                launch_instance_details=oci.core.models.LaunchInstanceDetails(
-                    availability_domain=next(oci_ad_names),
-                    compartment_id=oci_tenancy,
-                    create_vnic_details=oci.core.models.CreateVnicDetails(
-                        assign_public_ip=assign_public_ip,
-                        assign_private_dns_record=True,
-                        display_name=DISPLAY_NAME,
-                        subnet_id=oci_subnet_id,
-                    ),
-                    display_name=DISPLAY_NAME,
-                    shape=OCI_COMPUTE_SHAPE,
-                    availability_config=oci.core.models.LaunchInstanceAvailabilityConfigDetails(
-                        recovery_action="RESTORE_INSTANCE"
-                    ),
-                    instance_options=oci.core.models.InstanceOptions(
-                        are_legacy_imds_endpoints_disabled=False
-                    ),
-                    shape_config=shape_config,
-                    source_details=oci.core.models.InstanceSourceViaImageDetails(
-                        source_type="image",
-                        image_id=oci_image_id,
-                        boot_volume_size_in_gbs=boot_volume_size,
-                    ),
-                    metadata={
-                        "ssh_authorized_keys": ssh_public_key},
-                )
-            )
-            if launch_instance_response.status == 200:
-                logging_step5.info(
-                    "Command: launch_instance\nOutput: %s", launch_instance_response
-                )
-                instance_exist_flag = check_instance_state_and_write(oci_tenancy, OCI_COMPUTE_SHAPE)
+            pending = pending_launches()
+            rung = shape_ladder.current
+            if concurrent_launch and not pending:
+                launch_instance_response, errors = launch_in_all_availability_domains(job, ad_shard,
+                                                                                      details_for_ad, ad_policy)
+            else:
+                errors = []
+                # A launch with an unknown outcome is settled before trying anywhere else
+                ad_name, rung = pending[0] if pending else (ad_policy.choose(), rung)
+                try:
+                    launch_instance_response = rate_limited_launch(job, details_for_ad(ad_name, rung), ad_policy)
+                    if launch_instance_response.status != 200:
+                        launch_instance_response = None
+                except oci.exceptions.ServiceError as srv_err:
+                    launch_instance_response = None
+                    errors.append(srv_err)
+            if launch_instance_response:
+                job.runners.mark(lease_name, launch_instance_response.data.id)
+        finally:
+            # A launch with an unknown outcome keeps the lease until its retry token settles it
+            if not pending_launches():
+                job.runners.release(lease_name)
+
+        if launch_instance_response:
+            job.log.info("Command: launch_instance\nOutput: instance %s in %s",
+                         launch_instance_response.data.id, launch_instance_response.data.availability_domain)
+            instance_exist_flag = check_instance_state_and_write(
+                job, oci_tenancy, job_config.oci_compute_shape, instance_id=launch_instance_response.data.id)
+            launched_instance = launch_instance_response.data
+            if not instance_exist_flag:
+                job.runners.mark(lease_name, None)
+            continue
+        if concurrent_launch and not errors:
+            # Sleep once per sweep rather than once per availability domain
+            pause(job, job.retry_scheduler.record_error(SERVER_ERROR), SERVER_ERROR)
+        for index, srv_err in enumerate(errors):
+            if srv_err.message == "Out of host capacity." and rung == shape_ladder.current:
+                shape_ladder.record_capacity_miss()
+            if handle_launch_error(job, srv_err, oci_tenancy, wait=index == len(errors) - 1):
+                instance_exist_flag = True
+                break
+
+    return launched_instance if instance_exist_flag else None
+
+
+def read_quota(job, compartment_id):
+    """Read the instances and boot volumes of a tenancy once, to track its allowance locally.
 
-        except oci.exceptions.ServiceError as srv_err:
-            if srv_err.code == "LimitExceeded":                
-                logging_step5.info("Encoundered LimitExceeded Error checking if instance is created" \
-                                   "code :%s, message: %s, status: %s", srv_err.code, srv_err.message, srv_err.status)                
-                instance_exist_flag = check_instance_state_and_write(oci_tenancy, OCI_COMPUTE_SHAPE)
-                if instance_exist_flag:
-                    logging_step5.info("%s , exiting the program", srv_err.code)
-                    sys.exit()
-                logging_step5.info("Didn't find an instance , proceeding with retries")     
-            data = {
-                "status": srv_err.status,
-                "code": srv_err.code,
-                "message": srv_err.message,
-            }
-            handle_errors("launch_instance", data, logging_step5)
+    Args:
+        job (LaunchJob): The job making the calls.
+        compartment_id (str): The compartment ID.
 
+    Returns:
+        tuple: The Quota and the list of instances.
+    """
+    instances = list_all_instances(job, compartment_id)
+    boot_volumes = []
+    page = None
+    while True:
+        response = execute_oci_request(job, job.clients.blockstorage, "list_boot_volumes",
+                                       compartment_id=compartment_id, page=page)
+        boot_volumes.extend(response.data)
+        page = response.next_page
+        if not page:
+            break
+    return Quota(instances, boot_volumes), instances
 
-if __name__ == "__main__":
-    send_discord_message("🚀 OCI Instance Creation Script: Starting up! Let's create some cloud magic!")
+
+def fleet_slot_job(job, index, shape, ocpus, memory_in_gbs):
+    """Build the job launching one slot of a job's FLEET.
+
+    Args:
+        job (LaunchJob): The job with the FLEET.
+        index (int): Position of the slot in the fleet.
+        shape (str): The slot's shape.
+        ocpus (float): OCPUs of an A1.Flex slot.
+        memory_in_gbs (float): Memory of an A1.Flex slot.
+
+    Returns:
+        LaunchJob: The slot's job, sharing the clients and retry scheduler of job.
+    """
+    overrides = {"FLEET": "", "OCI_COMPUTE_SHAPE": shape, "SHAPE_LADDER": f"{ocpus:g}/{memory_in_gbs:g}",
+                 "DISPLAY_NAME": f"{job.settings.display_name}-{index}"}
+    if shape != job.settings.oci_compute_shape:
+        # OCI_IMAGE_ID is built for the job's shape, look up the slot's own
+        overrides["OCI_IMAGE_ID"] = ""
+    slot_settings = Settings({**job.settings.env, **overrides})
+    slot_job = LaunchJob(f"{job.name}.{index}", slot_settings, job.clients, job.retry_scheduler,
+                         count_existing=False, runners=job.runners)
+    # Pausing or cancelling the job applies to its slots
+    slot_job.resumed, slot_job.cancelled = job.resumed, job.cancelled
+    return slot_job
+
+
+def launch_fleet(job):
+    """Launch the instances of a job's FLEET that don't exist yet, all at once.
+
+    The tenancy's usage is read once. Each missing slot then reserves its OCPUs,
+    memory and boot volume from the allowance left, slots that don't fit are
+    skipped, and the others are launched concurrently.
+
+    Args:
+        job (LaunchJob): The job with the FLEET.
+
+    Returns:
+        tuple: The number of slots launched, failed and skipped for lack of allowance.
+    """
+    targets = {}
+    quota = instances = None
+    for count, shape, ocpus, memory in job.settings.fleet:
+        if shape not in targets:
+            shape_job = fleet_slot_job(job, 0, shape, ocpus, memory)
+            targets[shape] = discover(shape_job)
+            if quota is None:
+                quota, instances = read_quota(shape_job, targets[shape]["tenancy"])
+    missing = missing_slots(job.settings.fleet, instances)
+    slots = []
+    for index, shape, ocpus, memory in missing:
+        slot_job = fleet_slot_job(job, index, shape, ocpus, memory)
+        usage = slot_usage(shape, ocpus, memory, slot_job.settings.boot_volume_size)
+        if quota.reserve(usage):
+            slots.append((slot_job, usage))
+        else:
+            job.setup_log.warning("Skipping %s %s: not enough allowance left %s",
+                                  slot_job.name, shape, quota.remaining)
+    skipped = len(missing) - len(slots)
+    job.setup_log.info("Fleet: launching %s instances, %s skipped, allowance left after them %s",
+                       len(slots), skipped, quota.remaining)
+    if not slots:
+        return 0, 0, skipped
+
+    def launch_slot(slot):
+        slot_job, usage = slot
+        try:
+            launch_instance(slot_job, targets[slot_job.settings.oci_compute_shape])
+        except JobCancelled:
+            quota.release(usage)
+            raise
+        except Exception:
+            slot_job.log.exception("Fleet slot %s failed", slot_job.name)
+            quota.release(usage)
+            return False
+        return True
+
+    with ThreadPoolExecutor(max_workers=len(slots), thread_name_prefix="slot") as executor:
+        launched = sum(executor.map(launch_slot, slots))
+    return launched, len(slots) - launched, skipped
+
+
+def run_job(job):
+    """Run a launch job to the end and notify about its outcome.
+
+    A failing job is reported without stopping the other jobs.
+
+    Args:
+        job (LaunchJob): The job.
+
+    Returns:
+        bool: True if the job's instance exists, or every missing instance of its FLEET
+        was launched or skipped. False if the job failed.
+    """
+    # Jobs are told apart in notifications only when there are several of them
+    prefix = "" if job.name == DEFAULT_JOB else f"[{job.name}] "
     try:
-        launch_instance()
-        send_discord_message("🎉 Success! OCI Instance has been created. Time to celebrate!")
+        if job.settings.fleet:
+            launched, failed, skipped = launch_fleet(job)
+            message = f"{prefix}🎉 Fleet: {launched} instance(s) created"
+            if failed or skipped:
+                message += f", {failed} failed, {skipped} skipped for lack of Always Free allowance"
+            send_notification(message)
+            return not failed
+        launched_instance = launch_instance(job)
+        send_notification(f"{prefix}🎉 Success! OCI Instance has been created. Time to celebrate!")
+        if launched_instance is not None and job.settings.shape_grow_to_target:
+            grow_in_background(job, launched_instance)
+    except JobCancelled:
+        job.log.info("Launch job %s cancelled", job.name)
+        return False
     except Exception as e:
-        error_message = f"😱 Oops! Something went wrong with the OCI Instance Creation Script:\n{str(e)}"
-        send_discord_message(error_message)
-        raise
+        job.log.exception("Launch job %s failed", job.name)
+        error_message = f"{prefix}😱 Oops! Something went wrong with the OCI Instance Creation Script:\n{str(e)}"
+        send_notification(error_message)
+        return False
+    return True
+
+
+def warn_memory(rss):
+    """Warn that the resident memory went above RSS_LIMIT_MB.
+
+    Args:
+        rss (int): The resident memory in bytes.
+    """
+    logging.warning("Resident memory %.0f MB is above RSS_LIMIT_MB %.0f MB", rss / 2 ** 20,
+                    settings.rss_limit_bytes / 2 ** 20)
+    send_notification(f"⚠️ The OCI Instance Creation Script uses {rss / 2 ** 20:.0f} MB of memory, "
+                      f"above RSS_LIMIT_MB")
+
+
+def run_daemon(jobs):
+    """Run the jobs, and keep running and taking changes to them until SIGINT or SIGTERM.
+
+    SIGHUP reloads oci.env and JOBS_FILE, like the control API's /reload.
+
+    Args:
+        jobs (list): The LaunchJob objects to start with.
+    """
+    daemon = Daemon(lambda: load_settings(reload=True), create_jobs, run_job, settings, transport.close)
+    daemon.start(jobs)
+    if settings.control_port:
+        token = settings.control_token or create_control_token("control_token")
+        start_control_server(daemon, settings.control_port, token)
+        logging.info("Control API listening on http://127.0.0.1:%s, with the token %s", settings.control_port,
+                     "of CONTROL_TOKEN" if settings.control_token else "written to control_token")
+
+    stop = threading.Event()
+
+    def reload():
+        try:
+            daemon.reload()
+        except ConfigError as err:
+            logging.error("Configuration not reloaded: %s", err)
+
+    signal.signal(signal.SIGINT, lambda signum, frame: stop.set())
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    signal.signal(signal.SIGHUP, lambda signum, frame: threading.Thread(target=reload, name="reload").start())
+    while not stop.wait(1):
+        pass
+    logging.info("Stopping the launch jobs")
+    daemon.stop()
+
+
+def main(argv=None):
+    """Entry point of the script.
+
+    Args:
+        argv (list, optional): Command line arguments. Defaults to sys.argv[1:].
+
+    Returns:
+        int: The exit code.
+    """
+    parser = argparse.ArgumentParser(description="Create an OCI Free Tier instance.")
+    parser.add_argument("--refresh-cache", action="store_true",
+                        help="Drop the cached tenancy, AD, subnet and image lookups before starting")
+    parser.add_argument("--check", action="store_true",
+                        help="Validate oci.env, JOBS_FILE and the OCI config file without touching the network, "
+                             "then exit")
+    parser.add_argument("--daemon", action="store_true",
+                        help="Keep running once the jobs are done, taking changes through the control API on "
+                             "CONTROL_PORT and reloading the configuration on SIGHUP")
+    args = parser.parse_args(argv)
+
+    try:
+        base_settings, job_settings = load_settings()
+    except ConfigError as e:
+        with open("ERROR_IN_CONFIG.log", "w", encoding='utf-8') as file:
+            file.write(str(e))
+        print(f"Error reading the configuration file: {e}")
+        return 2
+    if args.check:
+        print(f"Configuration OK, {len(job_settings)} launch job(s)")
+        return 0
+
+    log_pipeline = setup_logging(base_settings)
+    init_runtime(base_settings)
+    jobs = create_jobs(job_settings)
+    if args.refresh_cache:
+        discovery_cache.invalidate()
+
+    if settings.metrics_port:
+        start_http_server(metrics, settings.metrics_port)
+    if settings.metrics_file:
+        start_snapshot_writer(metrics, settings.metrics_file, settings.metrics_interval, settings.log_max_bytes,
+                              settings.log_backup_count)
+    if settings.rss_limit_bytes or settings.metrics_port or settings.metrics_file:
+        start_memory_monitor(settings.rss_limit_bytes, warn_memory, metrics)
+    if profiler.directory:
+        # Written from a thread, the signal may arrive while the main thread holds the profiler's lock
+        signal.signal(signal.SIGUSR1, lambda signum, frame: threading.Thread(
+            target=profiler.dump, name="profile-dump").start())
+        logging.info("Profiling into %s, send SIGUSR1 to write it", profiler.directory)
+
+    send_notification("🚀 OCI Instance Creation Script: Starting up! Let's create some cloud magic!")
+    try:
+        if args.daemon:
+            run_daemon(jobs)
+            succeeded = [True]
+        elif len(jobs) == 1:
+            succeeded = [run_job(jobs[0])]
+        else:
+            logging.info("Running %s launch jobs: %s", len(jobs), ", ".join(job.name for job in jobs))
+            with ThreadPoolExecutor(max_workers=len(jobs), thread_name_prefix="job") as executor:
+                succeeded = list(executor.map(run_job, jobs))
+    finally:
+        try:
+            stop_growing(wait=not args.daemon)
+        finally:
+            runner_group.leave()
+            if attempt_history is not None:
+                attempt_history.close()
+            notifier.close()
+            transport.close()
+            log_pipeline.stop()
+    return 0 if all(succeeded) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,226 @@
+import json
+import logging
+import threading
+import time
+
+from log_pipeline import rotating_file_handler
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def escape_label_value(value):
+    """str: A label value escaped for the Prometheus text exposition format."""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(labels):
+    """Render label pairs as a Prometheus label set.
+
+    Args:
+        labels (tuple): (name, value) pairs.
+
+    Returns:
+        str: The label set, e.g. ``{ad="AD-1"}``, or an empty string without labels.
+    """
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{escape_label_value(value)}"' for key, value in labels) + "}"
+
+
+class Metrics:
+    """Thread safe counters, gauges and histograms for the launch loop.
+
+    Metrics are identified by a name and keyword labels, e.g.
+    ``metrics.inc("launch_attempts_total", ad="AD-1")``.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self.started_at = time.time()
+
+    def inc(self, name, value=1, **labels):
+        """Add to a counter.
+
+        Args:
+            name (str): The metric name.
+            value (float, optional): The amount to add. Defaults to 1.
+            labels: The metric labels.
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        """Set a gauge.
+
+        Args:
+            name (str): The metric name.
+            value (float): The current value.
+            labels: The metric labels.
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.gauges[key] = value
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        """Record a value in a histogram.
+
+        Args:
+            name (str): The metric name.
+            value (float): The observed value.
+            buckets (tuple, optional): Upper bounds of the buckets. Defaults to LATENCY_BUCKETS.
+            labels: The metric labels.
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = {"buckets": buckets, "counts": [0] * len(buckets),
+                                                    "sum": 0.0, "count": 0}
+            for index, bound in enumerate(buckets):
+                if value <= bound:
+                    histogram["counts"][index] += 1
+                    break
+            histogram["sum"] += value
+            histogram["count"] += 1
+
+    def total(self, name):
+        """Sum a counter over all its labels.
+
+        Args:
+            name (str): The metric name.
+
+        Returns:
+            float: The total.
+        """
+        with self.lock:
+            return sum(value for (counter, _), value in self.counters.items() if counter == name)
+
+    def snapshot(self):
+        """Return every metric as plain data.
+
+        Returns:
+            dict: Counters, gauges and histograms keyed by name, with a list of label sets each.
+        """
+        with self.lock:
+            counters = {}
+            for (name, labels), value in self.counters.items():
+                counters.setdefault(name, []).append({"labels": dict(labels), "value": value})
+            gauges = {}
+            for (name, labels), value in self.gauges.items():
+                gauges.setdefault(name, []).append({"labels": dict(labels), "value": value})
+            histograms = {}
+            for (name, labels), histogram in self.histograms.items():
+                histograms.setdefault(name, []).append({
+                    "labels": dict(labels),
+                    "buckets": dict(zip(map(str, histogram["buckets"]), histogram["counts"])),
+                    "sum": histogram["sum"],
+                    "count": histogram["count"],
+                })
+        return {"time": time.time(), "uptime": time.time() - self.started_at,
+                "counters": counters, "gauges": gauges, "histograms": histograms}
+
+    def prometheus(self):
+        """Render every metric in the Prometheus text exposition format.
+
+        Returns:
+            str: The metrics page.
+        """
+        lines = []
+        with self.lock:
+            seen = set()
+            for (name, labels), value in sorted(self.counters.items()):
+                if name not in seen:
+                    lines.append(f"# TYPE {name} counter")
+                    seen.add(name)
+                lines.append(f"{name}{format_labels(labels)} {value}")
+            for (name, labels), value in sorted(self.gauges.items()):
+                if name not in seen:
+                    lines.append(f"# TYPE {name} gauge")
+                    seen.add(name)
+                lines.append(f"{name}{format_labels(labels)} {value}")
+            for (name, labels), histogram in sorted(self.histograms.items(), key=lambda item: item[0]):
+                if name not in seen:
+                    lines.append(f"# TYPE {name} histogram")
+                    seen.add(name)
+                cumulative = 0
+                for bound, count in zip(histogram["buckets"], histogram["counts"]):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{format_labels(labels + (('le', bound),))} {cumulative}")
+                lines.append(f"{name}_bucket{format_labels(labels + (('le', '+Inf'),))} {histogram['count']}")
+                lines.append(f"{name}_sum{format_labels(labels)} {histogram['sum']}")
+                lines.append(f"{name}_count{format_labels(labels)} {histogram['count']}")
+        return "\n".join(lines) + "\n"
+
+
+def start_http_server(metrics, port, host="127.0.0.1"):
+    """Serve the metrics on http://host:port/metrics from a background thread.
+
+    Args:
+        metrics (Metrics): The metrics to serve.
+        port (int): The port to listen on.
+        host (str, optional): The address to bind. Defaults to localhost only.
+
+    Returns:
+        ThreadingHTTPServer: The running server.
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/", "/metrics"):
+                self.send_error(404)
+                return
+            body = metrics.prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
+
+
+def start_snapshot_writer(metrics, path, interval, max_bytes=0, backup_count=0,
+                          rate_counter="launch_attempts_total"):
+    """Append a JSON line with every metric to a file every interval seconds.
+
+    Each line also carries the rate per minute of ``rate_counter`` since the previous line.
+    The file is rotated by size into gzipped backups, like the logs.
+
+    Args:
+        metrics (Metrics): The metrics to write.
+        path (str): The JSONL file.
+        interval (float): Seconds between snapshots.
+        max_bytes (int, optional): Size at which the file is rotated. Defaults to 0, never.
+        backup_count (int, optional): Number of compressed backups kept. Defaults to 0.
+        rate_counter (str, optional): Counter to report a rate for. Defaults to "launch_attempts_total".
+
+    Returns:
+        threading.Event: Set it to stop the writer.
+    """
+    stop = threading.Event()
+    handler = rotating_file_handler(path, max_bytes, backup_count, logging.Formatter("%(message)s"))
+
+    def write_snapshots():
+        previous_total, previous_time = metrics.total(rate_counter), time.monotonic()
+        while not stop.wait(interval):
+            total, now = metrics.total(rate_counter), time.monotonic()
+            snapshot = metrics.snapshot()
+            snapshot["rates"] = {f"{rate_counter}_per_minute": (total - previous_total) * 60 / (now - previous_time)}
+            previous_total, previous_time = total, now
+            # Write errors are reported by the handler on stderr, like those of the logs
+            handler.handle(logging.makeLogRecord({"msg": json.dumps(snapshot)}))
+        handler.close()
+
+    threading.Thread(target=write_snapshots, name="metrics-snapshots", daemon=True).start()
+    return stop
@@ -0,0 +1,269 @@
+import logging
+import queue
+import smtplib
+import threading
+import time
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+
+DISCORD_MAX_LENGTH = 2000
+TELEGRAM_MAX_LENGTH = 4096
+
+
+class Notification:
+    """A single message queued for delivery.
+
+    Args:
+        text (str): Plain text body, used by the chat channels.
+        subject (str, optional): Subject line, used by email.
+        html (str, optional): HTML body, used by email instead of text.
+        channels (tuple, optional): Names of the channels to deliver to. Defaults to every channel.
+    """
+
+    def __init__(self, text, subject=None, html=None, channels=None):
+        self.text = text
+        self.subject = subject
+        self.html = html
+        self.channels = channels
+
+
+def chunk_messages(texts, max_length):
+    """Join a burst of messages into as few chunks as the channel allows.
+
+    Args:
+        texts (list): The message texts.
+        max_length (int): Maximum length of a single chunk.
+
+    Returns:
+        list: The chunks to send.
+    """
+    chunks = []
+    current = ""
+    for text in texts:
+        for start in range(0, max(len(text), 1), max_length):
+            piece = text[start:start + max_length]
+            if current and len(current) + len(piece) + 2 > max_length:
+                chunks.append(current)
+                current = ""
+            current = f"{current}\n\n{piece}" if current else piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+class EmailBackend:
+    """Sends HTML email over one persistent, authenticated SMTP connection.
+
+    Args:
+        email (str): The sender's and recipient's email address.
+        password (str): The email password or app-specific password.
+        timeout (float): Socket timeout in seconds.
+        host (str, optional): SMTP server. Defaults to "smtp.gmail.com".
+        port (int, optional): SMTP port. Defaults to 587.
+    """
+
+    name = "email"
+
+    def __init__(self, email, password, timeout, host="smtp.gmail.com", port=587):
+        self.email = email
+        self.password = password
+        self.timeout = timeout
+        self.host = host
+        self.port = port
+        self.server = None
+
+    def _connection(self):
+        if self.server is not None:
+            try:
+                self.server.noop()
+                return self.server
+            except smtplib.SMTPException:
+                self.close()
+        server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        server.starttls()
+        server.login(self.email, self.password)
+        self.server = server
+        return server
+
+    def messages(self, notifications):
+        """list: One email per notification."""
+        return notifications
+
+    def send(self, notification):
+        server = self._connection()
+        message = MIMEMultipart()
+        message["Subject"] = notification.subject or "OCI INSTANCE CREATION SCRIPT"
+        message["From"] = self.email
+        message["To"] = self.email
+        message.attach(MIMEText(notification.html or notification.text, "html"))
+        try:
+            server.sendmail(self.email, self.email, message.as_string())
+        except (smtplib.SMTPException, OSError):
+            self.close()
+            raise
+
+    def close(self):
+        if self.server is not None:
+            try:
+                self.server.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+            self.server = None
+
+
+class DiscordBackend:
+    """Posts messages to a Discord webhook over a shared HTTP session.
+
+    Args:
+        webhook (str): The Discord webhook URL.
+        session (requests.Session): The pooled HTTP session.
+        timeout (float or tuple): Timeout in seconds, or (connect, read) timeouts.
+    """
+
+    name = "discord"
+
+    def __init__(self, webhook, session, timeout):
+        self.webhook = webhook
+        self.session = session
+        self.timeout = timeout
+
+    def messages(self, notifications):
+        """list: The chunks the texts of a batch fit in."""
+        return chunk_messages([n.text for n in notifications], DISCORD_MAX_LENGTH)
+
+    def send(self, content):
+        response = self.session.post(self.webhook, json={"content": content}, timeout=self.timeout)
+        response.raise_for_status()
+
+    def close(self):
+        pass
+
+
+class TelegramBackend:
+    """Sends messages through a Telegram bot over a shared HTTP session.
+
+    Args:
+        token (str): The Telegram bot token.
+        user_id (str): The chat ID to send messages to.
+        session (requests.Session): The pooled HTTP session.
+        timeout (float or tuple): Timeout in seconds, or (connect, read) timeouts.
+    """
+
+    name = "telegram"
+
+    def __init__(self, token, user_id, session, timeout):
+        self.url = f"https://api.telegram.org/bot{token}/sendMessage"
+        self.user_id = user_id
+        self.session = session
+        self.timeout = timeout
+
+    def messages(self, notifications):
+        """list: The chunks the texts of a batch fit in."""
+        return chunk_messages([n.text for n in notifications], TELEGRAM_MAX_LENGTH)
+
+    def send(self, text):
+        response = self.session.post(self.url, data={"chat_id": self.user_id, "text": text},
+                                     timeout=self.timeout)
+        response.raise_for_status()
+
+    def close(self):
+        pass
+
+
+class NotificationDispatcher:
+    """Delivers notifications from a background thread so they never block the caller.
+
+    Messages queued within ``batch_window`` seconds of each other are delivered
+    together, and every channel gets ``retries`` attempts with a doubling delay.
+    A retry only sends the messages of the batch that weren't delivered yet, and a
+    channel failing in any way is logged without stopping the other deliveries.
+
+    Args:
+        backends (list): The channel backends to deliver to.
+        retries (int, optional): Attempts per channel and batch. Defaults to 3.
+        batch_window (float, optional): Seconds to wait for more messages before
+            delivering a batch. Defaults to 2.
+    """
+
+    def __init__(self, backends, retries=3, batch_window=2.0):
+        self.backends = backends
+        self.retries = retries
+        self.batch_window = batch_window
+        self.queue = queue.Queue()
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def notify(self, text, subject=None, html=None, channels=None):
+        """Queue a notification and return immediately.
+
+        Args:
+            text (str): Plain text body.
+            subject (str, optional): Subject line for email. Defaults to None.
+            html (str, optional): HTML body for email. Defaults to None.
+            channels (tuple, optional): Channel names to deliver to. Defaults to every channel.
+        """
+        if not self.backends:
+            return
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name="notifications", daemon=True)
+                self.thread.start()
+        self.queue.put(Notification(text, subject, html, channels))
+
+    def close(self, timeout=30):
+        """Deliver whatever is still queued and close the connections.
+
+        Args:
+            timeout (float, optional): Seconds to wait for pending deliveries. Defaults to 30.
+        """
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread.join(timeout)
+        for backend in self.backends:
+            backend.close()
+
+    def _run(self):
+        while True:
+            first = self.queue.get()
+            if first is None:
+                return
+            batch = [first]
+            stop = False
+            deadline = time.monotonic() + self.batch_window
+            while (remaining := deadline - time.monotonic()) > 0:
+                try:
+                    notification = self.queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if notification is None:
+                    stop = True
+                    break
+                batch.append(notification)
+            self._deliver(batch)
+            if stop:
+                return
+
+    def _deliver(self, batch):
+        for backend in self.backends:
+            notifications = [n for n in batch if n.channels is None or backend.name in n.channels]
+            if not notifications:
+                continue
+            try:
+                messages = backend.messages(notifications)
+            except Exception:
+                logging.exception("Failed to prepare %s notification", backend.name)
+                continue
+            delivered = 0
+            for attempt in range(self.retries):
+                try:
+                    while delivered < len(messages):
+                        backend.send(messages[delivered])
+                        delivered += 1
+                    break
+                except Exception as err:
+                    # Any failure, e.g. a webhook answering an error, must not stop the thread
+                    logging.error("Failed to send %s notification (attempt %s, %s of %s sent): %s",
+                                  backend.name, attempt + 1, delivered, len(messages), err)
+                    if attempt < self.retries - 1:
+                        time.sleep(2 ** attempt)
@@ -0,0 +1,70 @@
+import threading
+
+
+class OciClients:
+    """OCI SDK config and clients, built on first use.
+
+    The OCI SDK is only imported when a client is first needed, so importing the
+    script or validating its config stays fast.
+
+    Args:
+        config_path (str): Path of the OCI config file.
+        transport (transport.Transport, optional): Shared connection pool and timeouts
+            for the clients. Defaults to the SDK's own session per client.
+        profile (str, optional): Profile of the OCI config file. Defaults to "DEFAULT".
+    """
+
+    def __init__(self, config_path, transport=None, profile="DEFAULT"):
+        self.config_path = config_path
+        self.profile = profile
+        self.transport = transport
+        self.lock = threading.Lock()
+        self._config = None
+        self._clients = {}
+
+    @property
+    def config(self):
+        """dict: The profile of the OCI config read from config_path."""
+        with self.lock:
+            if self._config is None:
+                import oci
+                self._config = oci.config.from_file(self.config_path, self.profile)
+            return self._config
+
+    def _client(self, name, factory):
+        client = self._clients.get(name)
+        if client is None:
+            config = self.config
+            with self.lock:
+                client = self._clients.get(name)
+                if client is None:
+                    if self.transport is None:
+                        client = factory(config)
+                    else:
+                        client = self.transport.attach(factory(config, **self.transport.client_kwargs()))
+                    self._clients[name] = client
+        return client
+
+    @property
+    def identity(self):
+        """oci.identity.IdentityClient: The identity client."""
+        import oci
+        return self._client("identity", oci.identity.IdentityClient)
+
+    @property
+    def network(self):
+        """oci.core.VirtualNetworkClient: The virtual network client."""
+        import oci
+        return self._client("network", oci.core.VirtualNetworkClient)
+
+    @property
+    def compute(self):
+        """oci.core.ComputeClient: The compute client."""
+        import oci
+        return self._client("compute", oci.core.ComputeClient)
+
+    @property
+    def blockstorage(self):
+        """oci.core.BlockstorageClient: The block storage client."""
+        import oci
+        return self._client("blockstorage", oci.core.BlockstorageClient)
@@ -0,0 +1,189 @@
+"""Opt-in profiling for long runs: per-phase cProfile, tracemalloc snapshots and an RSS ceiling.
+
+With PROFILE_DIR set, every phase of the launch loop (discover, launch, errors,
+watch) is profiled and memory allocations are traced. ``kill -USR1 <pid>`` then
+writes what was collected so far into a new timestamped directory of PROFILE_DIR.
+"""
+import io
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Frames kept per traced allocation, each one costs memory for every live allocation
+TRACEMALLOC_FRAMES = 5
+# Lines written to the text reports
+REPORT_LINES = 30
+# Seconds between two checks of the resident memory
+MEMORY_CHECK_SECS = 60
+
+# cProfile is process wide from Python 3.12 on, so only one thread can profile at a time
+_profile_lock = threading.Lock()
+
+
+def resident_memory():
+    """int: Resident set size of the process in bytes, or None where /proc isn't available."""
+    try:
+        with open("/proc/self/statm", encoding="utf-8") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class Profiler:
+    """Profiles the phases of the launch loop and traces memory allocations.
+
+    Each phase gets its own cProfile statistics, added up across threads and runs
+    of the phase. Only one thread is profiled at a time: a phase run while another
+    thread is being profiled is only timed. A phase entered while another one is
+    running in the same thread is counted in the outer phase. Nothing is collected
+    when directory is empty.
+
+    Args:
+        directory (str): Where dump() writes, empty to disable profiling.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.lock = threading.Lock()
+        self.stats = {}
+        # Per phase: [runs, seconds, runs profiled]
+        self.timings = {}
+        self.local = threading.local()
+        self.last_dump = None
+        if directory:
+            import tracemalloc
+
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+
+    @contextmanager
+    def phase(self, name):
+        """Profile a block as part of a phase.
+
+        Args:
+            name (str): The phase, e.g. "launch".
+        """
+        if not self.directory or getattr(self.local, "phase", None):
+            yield
+            return
+        import cProfile
+        import pstats
+
+        self.local.phase = name
+        profile = None
+        if _profile_lock.acquire(blocking=False):
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError:
+                # Another profiler, e.g. a debugger, is already active
+                _profile_lock.release()
+                profile = None
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            if profile is not None:
+                profile.disable()
+                _profile_lock.release()
+            self.local.phase = None
+            with self.lock:
+                timing = self.timings.setdefault(name, [0, 0.0, 0])
+                timing[0] += 1
+                timing[1] += elapsed
+                if profile is not None:
+                    timing[2] += 1
+                    if name in self.stats:
+                        self.stats[name].add(profile)
+                    else:
+                        self.stats[name] = pstats.Stats(profile)
+
+    def dump(self):
+        """Write the profile of every phase and a tracemalloc snapshot into a new directory.
+
+        Each phase is written as ``<phase>.pstats``, for ``python -m pstats`` or snakeviz,
+        and as ``<phase>.txt`` with the functions taking the most time, and ``phases.txt``
+        has the time spent in every phase, profiled or not. The snapshot is
+        written as ``tracemalloc.snapshot``, with the largest allocations in
+        ``tracemalloc.txt`` and the growth since the previous dump in ``tracemalloc_growth.txt``.
+
+        Returns:
+            str: The directory written, or None when profiling is disabled.
+        """
+        if not self.directory:
+            return None
+        import tracemalloc
+
+        target = os.path.join(self.directory, time.strftime("%Y%m%d-%H%M%S"))
+        os.makedirs(target, exist_ok=True)
+        with self.lock:
+            for name, stats in self.stats.items():
+                stats.dump_stats(os.path.join(target, f"{name}.pstats"))
+                report = io.StringIO()
+                stats.stream = report
+                stats.sort_stats("cumulative").print_stats(REPORT_LINES)
+                with open(os.path.join(target, f"{name}.txt"), "w", encoding="utf-8") as report_file:
+                    report_file.write(report.getvalue())
+            with open(os.path.join(target, "phases.txt"), "w", encoding="utf-8") as report_file:
+                report_file.write(f"{'phase':<12}{'runs':>10}{'seconds':>12}{'profiled':>10}\n")
+                report_file.writelines(f"{name:<12}{runs:>10}{seconds:>12.1f}{profiled:>10}\n"
+                                       for name, (runs, seconds, profiled) in sorted(self.timings.items()))
+
+        snapshot = tracemalloc.take_snapshot()
+        snapshot.dump(os.path.join(target, "tracemalloc.snapshot"))
+        current, peak = tracemalloc.get_traced_memory()
+        rss = resident_memory()
+        with open(os.path.join(target, "tracemalloc.txt"), "w", encoding="utf-8") as report_file:
+            report_file.write(f"Traced memory: {current / 2 ** 20:.1f} MB, peak {peak / 2 ** 20:.1f} MB\n")
+            if rss is not None:
+                report_file.write(f"Resident memory: {rss / 2 ** 20:.1f} MB\n")
+            report_file.writelines(f"{stat}\n" for stat in snapshot.statistics("lineno")[:REPORT_LINES])
+        if self.last_dump:
+            # The previous snapshot is read back rather than kept in memory
+            previous = tracemalloc.Snapshot.load(os.path.join(self.last_dump, "tracemalloc.snapshot"))
+            with open(os.path.join(target, "tracemalloc_growth.txt"), "w", encoding="utf-8") as report_file:
+                report_file.write(f"Growth since {self.last_dump}\n")
+                report_file.writelines(f"{stat}\n"
+                                       for stat in snapshot.compare_to(previous, "lineno")[:REPORT_LINES])
+        self.last_dump = target
+        logging.info("Profile written to %s", target)
+        return target
+
+
+def start_memory_monitor(limit_bytes, on_exceeded, metrics=None, interval=MEMORY_CHECK_SECS):
+    """Check the resident memory of the process from a background thread.
+
+    Args:
+        limit_bytes (int): Ceiling above which on_exceeded is called, 0 for none. It's
+            called again only once the memory went back below 90% of the ceiling.
+        on_exceeded (callable): Called with the resident memory in bytes.
+        metrics (metrics.Metrics, optional): Metrics to report the
+            process_resident_memory_bytes gauge to. Defaults to None.
+        interval (float, optional): Seconds between checks. Defaults to MEMORY_CHECK_SECS.
+
+    Returns:
+        threading.Event: Set it to stop the monitor.
+    """
+    stop = threading.Event()
+
+    def monitor():
+        exceeded = False
+        while True:
+            rss = resident_memory()
+            if rss is None:
+                logging.warning("Resident memory can't be read on this system, not monitoring it")
+                return
+            if metrics is not None:
+                metrics.set("process_resident_memory_bytes", rss)
+            if limit_bytes and rss > limit_bytes and not exceeded:
+                exceeded = True
+                on_exceeded(rss)
+            elif exceeded and rss < limit_bytes * 0.9:
+                exceeded = False
+            if stop.wait(interval):
+                return
+
+    threading.Thread(target=monitor, name="memory-monitor", daemon=True).start()
+    return stop
@@ -0,0 +1,84 @@
+import threading
+import time
+import uuid
+
+from json_file import read_json, write_json
+
+# OCI keeps a retry token for 24 hours, stop replaying a little before that
+TOKEN_TTL = 23 * 3600
+
+
+class RetryTokenStore:
+    """Retry tokens of launch requests whose outcome is unknown, kept across restarts.
+
+    Every launch request carries an ``opc_retry_token``. When a request fails in a
+    way that doesn't tell whether the instance was created (a 5xx other than out of
+    capacity, a timeout), its token is kept and the next request with the same key
+    reuses it. OCI then answers with the original launch if it went through,
+    instead of creating a second instance.
+
+    The file is rewritten atomically, and only when a token is kept or resolved.
+
+    Args:
+        path (str): The file the pending tokens are persisted to.
+        ttl (int, optional): Seconds a token is replayed. Defaults to TOKEN_TTL.
+    """
+
+    def __init__(self, path, ttl=TOKEN_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        now = time.time()
+        self.pending = {key: entry for key, entry in read_json(self.path).items()
+                        if now - entry.get("issued_at", 0) < self.ttl}
+
+
+    def token_for(self, key):
+        """Return the pending token of a launch request, or a new one.
+
+        Args:
+            key (str): Identifies the launch request, e.g. its AD, shape and size.
+
+        Returns:
+            str: The retry token.
+        """
+        with self.lock:
+            entry = self.pending.get(key)
+            if entry and time.time() - entry["issued_at"] < self.ttl:
+                return entry["token"]
+        return uuid.uuid4().hex
+
+    def is_pending(self, key):
+        """Whether a launch request with this key has an unknown outcome.
+
+        Args:
+            key (str): The launch request key.
+
+        Returns:
+            bool: True if its token should be replayed.
+        """
+        with self.lock:
+            return key in self.pending
+
+    def keep(self, key, token):
+        """Keep the token of a launch request whose outcome is unknown.
+
+        Args:
+            key (str): The launch request key.
+            token (str): The retry token it was sent with.
+        """
+        with self.lock:
+            if self.pending.get(key, {}).get("token") == token:
+                return
+            self.pending[key] = {"token": token, "issued_at": time.time()}
+            write_json(self.path, self.pending)
+
+    def resolve(self, key):
+        """Forget the token of a launch request once its outcome is known.
+
+        Args:
+            key (str): The launch request key.
+        """
+        with self.lock:
+            if self.pending.pop(key, None) is not None:
+                write_json(self.path, self.pending)
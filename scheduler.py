@@ -0,0 +1,267 @@
+import logging
+import random
+import threading
+import time
+
+THROTTLED = "throttled"
+OUT_OF_CAPACITY = "out_of_capacity"
+SERVER_ERROR = "server_error"
+
+
+class TokenBucket:
+    """Thread safe token bucket used to stay under the tenancy API rate limit.
+
+    Args:
+        rate_per_minute (float): Tokens added per minute. 0 disables the bucket.
+        burst (int, optional): Maximum number of tokens the bucket can hold.
+            Defaults to the number of tokens added in 10 seconds, at least 1.
+    """
+
+    def __init__(self, rate_per_minute, burst=None):
+        self.rate_per_minute = float(rate_per_minute)
+        self.burst = burst if burst else max(1, int(self.rate_per_minute / 6))
+        self.tokens = float(self.burst)
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate_per_minute / 60)
+        self.updated_at = now
+
+    def acquire(self, sleep=None):
+        """Take one token, sleeping until one is available.
+
+        Args:
+            sleep (callable, optional): Sleeps for the given seconds, e.g. a job's
+                sleep that stops once the job is cancelled. Defaults to time.sleep.
+
+        Returns:
+            float: The number of seconds spent waiting for the token.
+        """
+        sleep = sleep or time.sleep
+        if self.rate_per_minute <= 0:
+            return 0.0
+        waited = 0.0
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                delay = (1 - self.tokens) * 60 / self.rate_per_minute
+            sleep(delay)
+            waited += delay
+
+
+class CircuitBreaker:
+    """Holds back calls to a tenancy while OCI looks like it is having an incident.
+
+    After ``threshold`` server errors in a row the breaker opens and calls wait
+    ``cooldown`` seconds. The next call then goes through as a probe: a success
+    closes the breaker, another server error reopens it for twice as long, up to
+    ``max_cooldown``.
+
+    Args:
+        threshold (int): Consecutive server errors that open the breaker. 0 disables it.
+        cooldown (float): Seconds the breaker stays open the first time.
+        max_cooldown (float, optional): Ceiling for the cooldown. Defaults to 8 times cooldown.
+    """
+
+    def __init__(self, threshold, cooldown, max_cooldown=None):
+        self.threshold = int(threshold)
+        self.cooldown = float(cooldown)
+        self.max_cooldown = float(max_cooldown) if max_cooldown else self.cooldown * 8
+        self.next_cooldown = self.cooldown
+        self.failures = 0
+        self.open_until = 0.0
+        self.lock = threading.Lock()
+
+    def wait(self, sleep=None):
+        """Sleep while the breaker is open.
+
+        Args:
+            sleep (callable, optional): Sleeps for the given seconds, e.g. a job's
+                sleep that stops once the job is cancelled. Defaults to time.sleep.
+
+        Returns:
+            float: The number of seconds spent waiting.
+        """
+        sleep = sleep or time.sleep
+        waited = 0.0
+        while True:
+            with self.lock:
+                delay = self.open_until - time.monotonic()
+            if delay <= 0:
+                return waited
+            sleep(delay)
+            waited += delay
+
+    def record_success(self):
+        """Close the breaker after a call that reached a healthy service."""
+        with self.lock:
+            self.failures = 0
+            self.next_cooldown = self.cooldown
+
+    def record_failure(self):
+        """Register a server error.
+
+        Returns:
+            float: The seconds the breaker was opened for, or 0 if it stays closed.
+        """
+        with self.lock:
+            self.failures += 1
+            if not self.threshold or self.failures < self.threshold:
+                return 0.0
+            cooldown = self.next_cooldown
+            self.open_until = time.monotonic() + cooldown
+            self.next_cooldown = min(self.max_cooldown, cooldown * 2)
+            # The next call is a probe, one more failure reopens the breaker
+            self.failures = self.threshold - 1
+            return cooldown
+
+
+class RetryScheduler:
+    """Decides how long to wait after each failed OCI call.
+
+    Throttling gets jittered exponential backoff and halves the request rate, which
+    then creeps back up on every call that is not throttled. Capacity errors are
+    retried on a short, fixed cadence since that's when a slot may free up. Server
+    errors back off exponentially like throttling without touching the rate.
+    No delay ever exceeds ``max_wait``. A run of server errors also opens the
+    circuit breaker, which holds back every call until OCI recovers.
+
+    Args:
+        base_wait (float): First backoff delay for throttling and server errors.
+        capacity_wait (float): Delay between attempts on "Out of host capacity".
+        max_wait (float): Ceiling for any delay.
+        rate_limit_per_minute (float): Calls per minute allowed by the token bucket.
+            0 disables rate limiting.
+        breaker_threshold (int, optional): Consecutive server errors that open the
+            circuit breaker. Defaults to 0, which disables it.
+        breaker_cooldown (float, optional): Seconds the breaker stays open. Defaults to 300.
+    """
+
+    def __init__(self, base_wait, capacity_wait, max_wait, rate_limit_per_minute,
+                 breaker_threshold=0, breaker_cooldown=300):
+        self.base_wait = max(1.0, float(base_wait))
+        self.capacity_wait = float(capacity_wait)
+        self.max_wait = float(max_wait)
+        self.configured_rate_limit = float(rate_limit_per_minute)
+        self.rate_limit_per_minute = self.configured_rate_limit
+        self.bucket = TokenBucket(rate_limit_per_minute)
+        self.breaker = CircuitBreaker(breaker_threshold, breaker_cooldown)
+        self.streaks = {THROTTLED: 0, SERVER_ERROR: 0}
+        self.lock = threading.Lock()
+
+    def reconfigure(self, base_wait, capacity_wait, max_wait, rate_limit_per_minute,
+                    breaker_threshold=0, breaker_cooldown=300):
+        """Apply new settings, keeping the current backoff streaks.
+
+        Args:
+            base_wait (float): First backoff delay for throttling and server errors.
+            capacity_wait (float): Delay between attempts on "Out of host capacity".
+            max_wait (float): Ceiling for any delay.
+            rate_limit_per_minute (float): Calls per minute allowed by the token bucket.
+                0 disables rate limiting.
+            breaker_threshold (int, optional): Consecutive server errors that open the
+                circuit breaker. Defaults to 0, which disables it.
+            breaker_cooldown (float, optional): Seconds the breaker stays open. Defaults to 300.
+        """
+        with self.lock:
+            self.base_wait = max(1.0, float(base_wait))
+            self.capacity_wait = float(capacity_wait)
+            self.max_wait = float(max_wait)
+            self.configured_rate_limit = float(rate_limit_per_minute)
+            self.rate_limit_per_minute = self.configured_rate_limit
+            with self.bucket.lock:
+                self.bucket.rate_per_minute = self.rate_limit_per_minute
+                self.bucket.burst = max(1, int(self.rate_limit_per_minute / 6))
+                self.bucket.tokens = min(self.bucket.tokens, self.bucket.burst)
+        with self.breaker.lock:
+            self.breaker.threshold = int(breaker_threshold)
+            self.breaker.cooldown = float(breaker_cooldown)
+            self.breaker.max_cooldown = self.breaker.cooldown * 8
+            self.breaker.next_cooldown = self.breaker.cooldown
+
+    def set_share(self, fraction):
+        """Use a fraction of the configured rate limit, e.g. this runner's share of a
+        budget split with other runners.
+
+        Args:
+            fraction (float): The share, 1 for the whole rate limit.
+        """
+        with self.lock:
+            rate = self.configured_rate_limit * fraction
+            if rate == self.rate_limit_per_minute:
+                return
+            self.rate_limit_per_minute = rate
+            if self.bucket.rate_per_minute > 0:
+                with self.bucket.lock:
+                    # A larger share is taken up gradually, like after throttling
+                    self.bucket.rate_per_minute = min(self.bucket.rate_per_minute, rate)
+
+    def acquire(self, sleep=None):
+        """Wait for the rate limit budget before making an OCI call.
+
+        Args:
+            sleep (callable, optional): Sleeps for the given seconds. Defaults to time.sleep.
+
+        Returns:
+            float: The number of seconds spent waiting.
+        """
+        return self.bucket.acquire(sleep)
+
+    def record_success(self):
+        """Reset the backoff after a call that went through."""
+        self.breaker.record_success()
+        with self.lock:
+            self.streaks = {THROTTLED: 0, SERVER_ERROR: 0}
+            self._recover_rate()
+
+    def record_error(self, error_class):
+        """Register a failed call and compute the delay before the next attempt.
+
+        Args:
+            error_class (str): One of THROTTLED, OUT_OF_CAPACITY or SERVER_ERROR.
+
+        Returns:
+            float: The number of seconds to wait before retrying.
+        """
+        if error_class == SERVER_ERROR:
+            cooldown = self.breaker.record_failure()
+            if cooldown:
+                logging.warning("%s server errors in a row, holding back OCI calls for %.0f seconds",
+                                self.breaker.threshold, cooldown)
+        else:
+            # Throttling and capacity errors come from a service that is up
+            self.breaker.record_success()
+        with self.lock:
+            if error_class == OUT_OF_CAPACITY:
+                # OCI answered, so the rate is fine and earlier failures are over
+                self.streaks = {THROTTLED: 0, SERVER_ERROR: 0}
+                self._recover_rate()
+                delay = self.capacity_wait * random.uniform(0.8, 1.2)
+            else:
+                if error_class == THROTTLED:
+                    self._reduce_rate()
+                else:
+                    self._recover_rate()
+                self.streaks[error_class] += 1
+                exponent = min(self.streaks[error_class] - 1, 16)
+                ceiling = min(self.max_wait, self.base_wait * 2 ** exponent)
+                # Equal jitter keeps a floor so runners don't retry in lockstep
+                delay = ceiling / 2 + random.uniform(0, ceiling / 2)
+        return min(delay, self.max_wait)
+
+    def _reduce_rate(self):
+        if self.bucket.rate_per_minute > 0:
+            with self.bucket.lock:
+                self.bucket.rate_per_minute = max(1.0, self.bucket.rate_per_minute / 2)
+
+    def _recover_rate(self):
+        if self.bucket.rate_per_minute > 0:
+            with self.bucket.lock:
+                self.bucket.rate_per_minute = min(self.rate_limit_per_minute,
+                                                  self.bucket.rate_per_minute
+                                                  + max(1.0, self.rate_limit_per_minute / 10))
@@ -0,0 +1,221 @@
+import configparser
+import os
+
+from shape_ladder import parse_shape_ladder
+
+ARM_SHAPE = "VM.Standard.A1.Flex"
+E2_MICRO_SHAPE = "VM.Standard.E2.1.Micro"
+# Short names of the free shapes, e.g. in FLEET
+SHAPE_ALIASES = {"A1": ARM_SHAPE, "MICRO": E2_MICRO_SHAPE}
+AD_SELECTION_POLICIES = ("round_robin", "bandit")
+OCI_CONFIG_KEYS = ("user", "fingerprint", "tenancy", "region", "key_file")
+ENV_VARIABLES = (
+    "OCI_CONFIG", "OCT_FREE_AD", "DISPLAY_NAME", "REQUEST_WAIT_TIME_SECS", "CAPACITY_RETRY_SECS",
+    "MAX_WAIT_TIME_SECS", "API_RATE_LIMIT_PER_MIN", "DISCOVERY_CACHE_TTL_SECS",
+    "INSTANCE_POLL_INTERVAL_SECS", "INSTANCE_WATCH_TIMEOUT_SECS", "METRICS_PORT", "METRICS_FILE",
+    "METRICS_INTERVAL_SECS", "AD_SELECTION_POLICY", "AD_HISTORY_HALF_LIFE_HOURS", "SHAPE_LADDER",
+    "SHAPE_LADDER_STEP_ATTEMPTS", "SHAPE_LADDER_STEP_MINUTES", "SHAPE_GROW_TO_TARGET", "SHAPE_GROW_TIMEOUT_MINUTES",
+    "SSH_AUTHORIZED_KEYS_FILE", "OCI_IMAGE_ID", "OCI_COMPUTE_SHAPE", "SECOND_MICRO_INSTANCE",
+    "OCI_SUBNET_ID", "OPERATING_SYSTEM", "OS_VERSION", "ASSIGN_PUBLIC_IP", "BOOT_VOLUME_SIZE",
+    "NOTIFY_EMAIL", "EMAIL", "EMAIL_PASSWORD", "DISCORD_WEBHOOK", "TELEGRAM_TOKEN", "TELEGRAM_USER_ID",
+    "NOTIFY_TIMEOUT_SECS", "CONCURRENT_AD_LAUNCH", "HTTP_CONNECT_TIMEOUT_SECS", "HTTP_READ_TIMEOUT_SECS",
+    "DNS_CACHE_TTL_SECS", "CIRCUIT_BREAKER_THRESHOLD", "CIRCUIT_BREAKER_COOLDOWN_SECS", "OCI_MAX_RETRIES",
+    "LOG_MAX_MB", "LOG_BACKUP_COUNT", "LOG_SUMMARY_INTERVAL_SECS", "OCI_PROFILE", "JOBS_FILE",
+    "FLEET", "COORDINATION_URL", "COORDINATION_TOKEN", "RUNNER_ID", "LAUNCH_LEASE_SECS", "CONTROL_PORT",
+    "CONTROL_TOKEN", "PROFILE_DIR", "RSS_LIMIT_MB",
+)
+
+
+class ConfigError(ValueError):
+    """Raised when oci.env or the OCI config file can't be used."""
+
+
+def parse_fleet(value):
+    """Parse a fleet such as "4xA1:1/6,2xMICRO" into (count, shape, ocpus, memory_in_gbs) pieces.
+
+    A shape is a full shape name or one of SHAPE_ALIASES. A1.Flex pieces take an
+    OCPUS/MEMORY_IN_GBS size, 1/6 by default. Other shapes have a fixed size, (1, 1).
+
+    Args:
+        value (str): Comma separated COUNTxSHAPE[:OCPUS/MEMORY_IN_GBS] pieces.
+
+    Returns:
+        list: The pieces as (count, shape, ocpus, memory_in_gbs) tuples.
+
+    Raises:
+        ValueError: If a piece is malformed.
+    """
+    pieces = []
+    for piece in filter(None, (piece.strip() for piece in value.split(","))):
+        count, _, rest = piece.partition("x")
+        shape, _, size = rest.partition(":")
+        shape = SHAPE_ALIASES.get(shape.upper(), shape)
+        if not count.isdigit() or int(count) < 1 or shape not in (ARM_SHAPE, E2_MICRO_SHAPE):
+            raise ValueError(f"{piece} is not an acceptable fleet piece, expected COUNTxSHAPE[:OCPUS/MEMORY_IN_GBS]")
+        if shape != ARM_SHAPE:
+            if size:
+                raise ValueError(f"{piece}: only {ARM_SHAPE} takes a size")
+            pieces.append((int(count), shape, 1.0, 1.0))
+            continue
+        ocpus, _, memory = (size or "1/6").partition("/")
+        try:
+            ocpus, memory = float(ocpus), float(memory)
+        except ValueError:
+            raise ValueError(f"{piece}: {size} is not an acceptable size, expected OCPUS/MEMORY_IN_GBS") from None
+        if ocpus < 1 or memory <= 0:
+            raise ValueError(f"{piece}: {size} is not an acceptable size, expected OCPUS/MEMORY_IN_GBS")
+        pieces.append((int(count), shape, ocpus, memory))
+    return pieces
+
+
+class Settings:
+    """The script configuration, read from oci.env and the OCI config file.
+
+    Reading and validating it doesn't import the OCI SDK or touch the network.
+
+    Args:
+        env (dict): The environment variables, usually os.environ after loading oci.env.
+
+    Raises:
+        ConfigError: Listing every problem found in the configuration.
+    """
+
+    def __init__(self, env):
+        self.errors = []
+        self.env = env
+
+        self.oci_config = self._str("OCI_CONFIG")
+        self.oci_profile = self._str("OCI_PROFILE", "DEFAULT")
+        self.oct_free_ad = self._str("OCT_FREE_AD")
+        self.display_name = self._str("DISPLAY_NAME")
+        self.wait_time = self._int("REQUEST_WAIT_TIME_SECS", 0)
+        self.capacity_wait_time = self._int("CAPACITY_RETRY_SECS", self.wait_time)
+        self.max_wait_time = self._int("MAX_WAIT_TIME_SECS", 600)
+        self.api_rate_limit = self._int("API_RATE_LIMIT_PER_MIN", 0)
+        self.discovery_cache_ttl = self._int("DISCOVERY_CACHE_TTL_SECS", 86400)
+        self.instance_poll_interval = self._int("INSTANCE_POLL_INTERVAL_SECS", 5)
+        self.instance_watch_timeout = self._int("INSTANCE_WATCH_TIMEOUT_SECS", 180)
+        self.metrics_port = self._int("METRICS_PORT", 0)
+        self.metrics_file = self._str("METRICS_FILE")
+        self.metrics_interval = self._int("METRICS_INTERVAL_SECS", 60)
+        self.ad_selection_policy = self._str("AD_SELECTION_POLICY", "round_robin").lower()
+        self.ad_history_half_life = self._float("AD_HISTORY_HALF_LIFE_HOURS", 72) * 3600
+        self.shape_ladder = self._shape_ladder("SHAPE_LADDER", "4/24")
+        self.shape_ladder_step_attempts = self._int("SHAPE_LADDER_STEP_ATTEMPTS", 0)
+        self.shape_ladder_step_secs = self._int("SHAPE_LADDER_STEP_MINUTES", 0) * 60
+        self.shape_grow_to_target = self._bool("SHAPE_GROW_TO_TARGET")
+        self.shape_grow_timeout = self._int("SHAPE_GROW_TIMEOUT_MINUTES", 60) * 60
+        self.ssh_authorized_keys_file = self._str("SSH_AUTHORIZED_KEYS_FILE")
+        self.oci_image_id = self._str("OCI_IMAGE_ID") or None
+        self.oci_compute_shape = self._str("OCI_COMPUTE_SHAPE", ARM_SHAPE)
+        self.second_micro_instance = self._bool("SECOND_MICRO_INSTANCE")
+        self.oci_subnet_id = self._str("OCI_SUBNET_ID") or None
+        self.operating_system = self._str("OPERATING_SYSTEM")
+        self.os_version = self._str("OS_VERSION")
+        self.assign_public_ip = self._str("ASSIGN_PUBLIC_IP", "false").lower() in ["true", "1", "y", "yes"]
+        self.boot_volume_size = max(50, self._int("BOOT_VOLUME_SIZE", 50))
+        self.notify_email = self._bool("NOTIFY_EMAIL")
+        self.email = self._str("EMAIL")
+        self.email_password = self._str("EMAIL_PASSWORD")
+        self.discord_webhook = self._str("DISCORD_WEBHOOK")
+        self.telegram_token = self._str("TELEGRAM_TOKEN")
+        self.telegram_user_id = self._str("TELEGRAM_USER_ID")
+        self.notify_timeout = self._int("NOTIFY_TIMEOUT_SECS", 10)
+        self.concurrent_ad_launch = self._bool("CONCURRENT_AD_LAUNCH")
+        self.http_connect_timeout = self._float("HTTP_CONNECT_TIMEOUT_SECS", 10)
+        self.http_read_timeout = self._float("HTTP_READ_TIMEOUT_SECS", 60)
+        self.dns_cache_ttl = self._int("DNS_CACHE_TTL_SECS", 300)
+        self.circuit_breaker_threshold = self._int("CIRCUIT_BREAKER_THRESHOLD", 5)
+        self.circuit_breaker_cooldown = self._int("CIRCUIT_BREAKER_COOLDOWN_SECS", 300)
+        self.oci_max_retries = self._int("OCI_MAX_RETRIES", 10)
+        self.log_max_bytes = int(self._float("LOG_MAX_MB", 10) * 1024 * 1024)
+        self.log_backup_count = self._int("LOG_BACKUP_COUNT", 5)
+        self.log_summary_interval = self._int("LOG_SUMMARY_INTERVAL_SECS", 600)
+        self.jobs_file = self._str("JOBS_FILE")
+        self.fleet = self._fleet("FLEET")
+        self.coordination_url = self._str("COORDINATION_URL")
+        self.coordination_token = self._str("COORDINATION_TOKEN")
+        self.runner_id = self._str("RUNNER_ID")
+        self.launch_lease_secs = self._int("LAUNCH_LEASE_SECS", 120)
+        self.control_port = self._int("CONTROL_PORT", 8471)
+        self.control_token = self._str("CONTROL_TOKEN")
+        self.profile_dir = self._str("PROFILE_DIR")
+        self.rss_limit_bytes = int(self._float("RSS_LIMIT_MB", 0) * 1024 * 1024)
+
+        self.oci_config_path = self.oci_config if self.oci_config else "~/.oci/config"
+        self.oci_user_id = None
+        self.oci_tenancy_id = None
+        self.oci_region = None
+        self._validate()
+        if self.errors:
+            raise ConfigError("\n".join(self.errors))
+
+    def _str(self, name, default=""):
+        return (self.env.get(name) or default).strip()
+
+    def _bool(self, name):
+        return self._str(name, "False").lower() == "true"
+
+    def _int(self, name, default):
+        value = self._str(name)
+        try:
+            return int(value) if value else default
+        except ValueError:
+            self.errors.append(f"{name} should be a whole number, got {value!r}")
+            return default
+
+    def _float(self, name, default):
+        value = self._str(name)
+        try:
+            return float(value) if value else default
+        except ValueError:
+            self.errors.append(f"{name} should be a number, got {value!r}")
+            return default
+
+    def _shape_ladder(self, name, default):
+        try:
+            return parse_shape_ladder(self._str(name, default) or default)
+        except ValueError as err:
+            self.errors.append(f"{name}: {err}")
+            return parse_shape_ladder(default)
+
+    def _fleet(self, name):
+        try:
+            return parse_fleet(self._str(name))
+        except ValueError as err:
+            self.errors.append(f"{name}: {err}")
+            return []
+
+    def _validate(self):
+        if self.oci_compute_shape not in (ARM_SHAPE, E2_MICRO_SHAPE):
+            self.errors.append(f"{self.oci_compute_shape} is not an acceptable shape")
+        if self.ad_selection_policy not in AD_SELECTION_POLICIES:
+            self.errors.append(f"{self.ad_selection_policy} is not an acceptable AD selection policy")
+        if not self.oct_free_ad:
+            self.errors.append("OCT_FREE_AD is required")
+        if any(" " in value.strip() for name, value in self.env.items()
+               if name in ENV_VARIABLES and name not in ("OPERATING_SYSTEM", "DISPLAY_NAME")):
+            self.errors.append("oci.env has spaces in values which is not acceptable")
+
+        config = configparser.ConfigParser()
+        try:
+            if not config.read(os.path.expanduser(self.oci_config_path)):
+                self.errors.append(f"OCI config file {self.oci_config_path} can't be read")
+                return
+            profile = self.oci_profile
+            if profile != config.default_section and not config.has_section(profile):
+                self.errors.append(f"OCI config file {self.oci_config_path} has no profile {profile}")
+                return
+            missing = [key for key in OCI_CONFIG_KEYS if not config.has_option(profile, key)]
+            self.oci_user_id = config.get(profile, 'user', fallback=None)
+            self.oci_tenancy_id = config.get(profile, 'tenancy', fallback=None)
+            self.oci_region = config.get(profile, 'region', fallback=None)
+            if missing:
+                self.errors.append(f"oci_config profile {profile} is missing {', '.join(missing)}")
+            elif not os.path.isfile(os.path.expanduser(config.get(profile, 'key_file'))):
+                self.errors.append(f"key_file {config.get(profile, 'key_file')} doesn't exist")
+            if any(' ' in value for section in config.sections() for _, value in config.items(section)):
+                self.errors.append("oci_config has spaces in values which is not acceptable")
+        except configparser.Error as err:
+            self.errors.append(f"Error reading the configuration file: {err}")
+
@@ -1,11 +1,14 @@
 #!/usr/bin/env bash
 
-# Check if any log files exist
-if ls *.log >/dev/null 2>&1; then
-    # Delete existing log files
-    rm -f *.log
-    echo "Previous Log files deleted."
-fi
+# Logs are kept across runs (they rotate on their own), only the previous config error is cleared
+rm -f ERROR_IN_CONFIG.log
+
+# Start of this run, to tell whether it has written to the launch log. The log rotates by size,
+# so its modification time is compared rather than its size
+START_TIME=$(date +%s)
+launch_log_written() {
+    [ "$(stat -c %Y launch_instance.log 2>/dev/null || echo 0)" -ge "$START_TIME" ]
+}
 
 # Making environment non-interactive
 export DEBIAN_FRONTEND=noninteractive
@@ -92,6 +95,11 @@ is_script_running() {
     fi
 }
 
+# The run has started once the script is alive and has written to the launch log
+is_run_started() {
+    is_script_running && launch_log_written
+}
+
 # Check for the existence of ERROR_IN_CONFIG.log after running the Python program
 sleep 5  # Wait for a few seconds to allow the program to run and create the log file (if applicable)
 if [ -s "ERROR_IN_CONFIG.log" ]; then
@@ -100,13 +108,13 @@ if [ -s "ERROR_IN_CONFIG.log" ]; then
 elif [ -s "INSTANCE_CREATED" ]; then
     echo "Instance created or Already existing has reached Free tier limit. Check 'INSTANCE_CREATED' File"
     send_notification "🎊 Great news! An instance was created or we've hit the Free tier limit. Check the 'INSTANCE_CREATED' file for details!"
-elif [ -s "launch_instance.log" ]; then
+elif is_run_started; then
     echo "Script is running successfully"
     send_notification "👍 All systems go! The script is running smoothly."
 else
     echo "Couldn't find any logs waiting 60 secs before checking again"  
     sleep 60  # Wait for a 1 min to see if the file is populated
-    if [ -s "launch_instance.log" ]; then
+    if is_run_started; then
         echo "Script is running successfully"
         send_notification "👍 Good news! The script is up and running after a short delay."
     else
@@ -0,0 +1,71 @@
+import logging
+import time
+
+
+def parse_shape_ladder(value):
+    """Parse a ladder such as "4/24,2/12,1/6" into (ocpus, memory_in_gbs) rungs.
+
+    Args:
+        value (str): Comma separated OCPUS/MEMORY_IN_GBS pairs, largest first.
+
+    Returns:
+        list: The rungs as (ocpus, memory_in_gbs) tuples of floats.
+
+    Raises:
+        ValueError: If a rung is malformed.
+    """
+    rungs = []
+    for rung in value.split(","):
+        ocpus, _, memory = rung.strip().partition("/")
+        if not memory:
+            raise ValueError(f"{rung} is not an acceptable shape ladder rung, expected OCPUS/MEMORY_IN_GBS")
+        rungs.append((float(ocpus), float(memory)))
+    return rungs
+
+
+class ShapeLadder:
+    """Steps down to smaller shape configs when the current one keeps running out of capacity.
+
+    A rung is left after ``step_attempts`` capacity misses or ``step_secs`` seconds on it,
+    whichever comes first. A threshold of 0 disables it. The last rung is kept for good.
+
+    Args:
+        rungs (list): The (ocpus, memory_in_gbs) rungs, largest first.
+        step_attempts (int): Capacity misses before stepping down.
+        step_secs (float): Seconds on a rung before stepping down.
+    """
+
+    def __init__(self, rungs, step_attempts, step_secs):
+        self.rungs = rungs
+        self.step_attempts = step_attempts
+        self.step_secs = step_secs
+        self.index = 0
+        self.misses = 0
+        self.started_at = time.monotonic()
+
+    @property
+    def current(self):
+        """tuple: The (ocpus, memory_in_gbs) to launch with."""
+        self._step_if_due()
+        return self.rungs[self.index]
+
+    @property
+    def target(self):
+        """tuple: The (ocpus, memory_in_gbs) of the first, largest rung."""
+        return self.rungs[0]
+
+    def record_capacity_miss(self):
+        """Register a launch attempt that was out of capacity on the current rung."""
+        self.misses += 1
+        self._step_if_due()
+
+    def _step_if_due(self):
+        if self.index == len(self.rungs) - 1:
+            return
+        out_of_attempts = self.step_attempts and self.misses >= self.step_attempts
+        out_of_time = self.step_secs and time.monotonic() - self.started_at >= self.step_secs
+        if out_of_attempts or out_of_time:
+            self.index += 1
+            self.misses = 0
+            self.started_at = time.monotonic()
+            logging.info("Stepping down to %s OCPUs / %s GB", *self.rungs[self.index])
@@ -0,0 +1,29 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+# The modules are flat at the top of the repository
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+@pytest.fixture
+def oci_env(tmp_path):
+    """dict: oci.env variables that pass validation, with an OCI config and keys in tmp_path."""
+    key_file = tmp_path / "oci_api_key.pem"
+    key_file.write_text("fake key", encoding="utf-8")
+    oci_config = tmp_path / "oci_config"
+    oci_config.write_text("[DEFAULT]\nuser=ocid1.user.oc1..test\nfingerprint=00:00\n"
+                          "tenancy=ocid1.tenancy.oc1..test\nregion=test-region-1\n"
+                          f"key_file={key_file}\n", encoding="utf-8")
+    ssh_key = tmp_path / "id_rsa.pub"
+    ssh_key.write_text("ssh-rsa AAAAtest tests", encoding="utf-8")
+    return {
+        "OCI_CONFIG": str(oci_config),
+        "SSH_AUTHORIZED_KEYS_FILE": str(ssh_key),
+        "OCT_FREE_AD": "AD-1",
+        "DISPLAY_NAME": "test-instance",
+        "OCI_COMPUTE_SHAPE": "VM.Standard.A1.Flex",
+        "OPERATING_SYSTEM": "Canonical Ubuntu",
+        "OS_VERSION": "22.04",
+    }
@@ -0,0 +1,90 @@
+import time
+
+import pytest
+
+from coordination import LeaseTable, RunnerGroup, is_loopback, serve
+
+
+@pytest.fixture
+def table(tmp_path):
+    return LeaseTable(str(tmp_path / "coordination.db"), runner_ttl=0.2)
+
+
+def test_lease_is_exclusive_until_it_expires(table):
+    assert table.acquire("launch", "runner-1", 0.1)
+    assert table.acquire("launch", "runner-1", 0.1)
+    assert not table.acquire("launch", "runner-2", 0.1)
+
+    time.sleep(0.15)
+
+    assert table.acquire("launch", "runner-2", 0.1)
+    assert not table.acquire("launch", "runner-1", 0.1)
+
+
+def test_released_lease_can_be_taken(table):
+    table.acquire("launch", "runner-1", 60)
+    table.release("launch", "runner-2")
+    assert not table.acquire("launch", "runner-2", 60)
+
+    table.release("launch", "runner-1")
+
+    assert table.acquire("launch", "runner-2", 60)
+
+
+def test_leave_drops_the_runner_and_its_leases(table):
+    table.heartbeat("runner-1")
+    table.acquire("launch", "runner-1", 60)
+
+    table.leave("runner-1")
+
+    assert table.heartbeat("runner-2") == ["runner-2"]
+    assert table.acquire("launch", "runner-2", 60)
+
+
+def test_silent_runners_expire(table):
+    table.heartbeat("runner-1")
+    assert table.heartbeat("runner-2") == ["runner-1", "runner-2"]
+
+    time.sleep(0.25)
+
+    assert table.heartbeat("runner-2") == ["runner-2"]
+
+
+def test_marks_expire_after_max_age(table):
+    table.mark("launch", "ocid1.instance")
+    assert table.marked("launch", 60) == "ocid1.instance"
+
+    time.sleep(0.05)
+
+    assert table.marked("launch", 0.01) is None
+    table.mark("launch", None)
+    assert table.marked("launch", 60) is None
+
+
+def test_heartbeat_thread_keeps_a_sleeping_runner_counted(table):
+    group = RunnerGroup(table, "runner-1", heartbeat_interval=0.05)
+    group.start()
+    try:
+        time.sleep(0.4)
+        # runner-1 never read its membership, only the thread kept it alive
+        assert table.heartbeat("runner-2") == ["runner-1", "runner-2"]
+    finally:
+        group.leave()
+
+    assert table.heartbeat("runner-2") == ["runner-2"]
+
+
+def test_membership_splits_availability_domains(table):
+    first, second = RunnerGroup(table, "runner-1"), RunnerGroup(table, "runner-2")
+    first.membership()
+
+    assert second.shard(["AD-1", "AD-2", "AD-3"]) == ["AD-2"]
+    assert second.share() == 0.5
+
+
+def test_lease_server_needs_a_token_beyond_localhost(table):
+    assert is_loopback("127.0.0.1") and is_loopback("::1") and is_loopback("localhost")
+    assert not is_loopback("0.0.0.0")
+
+    with pytest.raises(ValueError):
+        serve(table, 0, "0.0.0.0")
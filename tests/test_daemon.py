@@ -0,0 +1,172 @@
+import json
+import os
+import stat
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+
+import main
+from daemon import Daemon, create_control_token, start_control_server
+from settings import ConfigError
+
+
+class FakeJob:
+    def __init__(self, name, settings):
+        self.name = name
+        self.settings = settings
+        self.resumed = threading.Event()
+        self.resumed.set()
+        self.cancelled = threading.Event()
+
+
+def create_jobs(job_settings, reconfigure=False):
+    return [FakeJob(name, job_config) for name, job_config in job_settings]
+
+
+def run_job(job):
+    job.cancelled.wait(5)
+    return False
+
+
+def replacement_of(daemon, old_job):
+    """FakeJob: The job started in place of old_job once it has stopped."""
+    daemon.jobs[old_job.name].thread.join(5)
+    return daemon.jobs[old_job.name].job
+
+
+@pytest.fixture
+def env_file(tmp_path, monkeypatch, oci_env):
+    """Write oci.env and load it like main.py does, restoring os.environ afterwards."""
+    path = tmp_path / "oci.env"
+
+    def write(**changes):
+        values = {**oci_env, **changes}
+        path.write_text("".join(f"{name}={value}\n" for name, value in values.items() if value is not None),
+                        encoding="utf-8")
+
+    write()
+    for name in oci_env:
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.delenv("JOBS_FILE", raising=False)
+    monkeypatch.setattr(main, "startup_environ", {})
+    write.path = str(path)
+    return write
+
+
+@pytest.fixture
+def daemon(env_file):
+    base_settings, job_settings = main.load_settings(env_file.path)
+    running = Daemon(lambda: main.load_settings(env_file.path, reload=True), create_jobs, run_job, base_settings)
+    running.start(create_jobs(job_settings))
+    yield running
+    running.stop(timeout=5)
+
+
+def test_reload_without_changes_keeps_the_job(daemon):
+    result = daemon.reload()
+
+    assert result["unchanged"] == ["default"]
+    assert result["restarted"] == []
+
+
+@pytest.mark.parametrize("name, value", [("OCT_FREE_AD", "AD-2"), ("DISPLAY_NAME", "renamed"),
+                                         ("OCI_COMPUTE_SHAPE", "VM.Standard.E2.1.Micro")])
+def test_reload_restarts_the_default_job_when_oci_env_changes(daemon, env_file, name, value):
+    old_job = daemon.jobs["default"].job
+    env_file(**{name: value})
+
+    result = daemon.reload()
+
+    assert result["restarted"] == ["default"]
+    assert getattr(replacement_of(daemon, old_job).settings, name.lower()) == value
+
+
+def test_reload_drops_variables_removed_from_oci_env(daemon, env_file):
+    old_job = daemon.jobs["default"].job
+    env_file(DISPLAY_NAME=None)
+
+    assert daemon.reload()["restarted"] == ["default"]
+    assert replacement_of(daemon, old_job).settings.display_name == ""
+
+
+def test_failed_reload_changes_nothing(daemon, env_file):
+    environ = dict(os.environ)
+    env_file(OCI_COMPUTE_SHAPE="VM.Unknown")
+
+    with pytest.raises(ConfigError):
+        daemon.reload()
+
+    assert dict(os.environ) == environ
+    assert daemon.jobs["default"].state == "running"
+
+
+def test_stop_closes_what_the_jobs_shared(env_file):
+    base_settings, job_settings = main.load_settings(env_file.path)
+    closed = threading.Event()
+    running = Daemon(lambda: main.load_settings(env_file.path, reload=True), create_jobs, run_job, base_settings,
+                     closed.set)
+    running.start(create_jobs(job_settings))
+
+    running.stop(timeout=5)
+
+    assert closed.is_set()
+    assert not running.jobs["default"].thread.is_alive()
+
+
+@pytest.fixture
+def control_url(daemon):
+    server = start_control_server(daemon, 0, "secret")
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def request(url, method="GET", body=None, headers=None):
+    """tuple: The status and JSON answer of a control API request."""
+    data = body.encode("utf-8") if body is not None else None
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, data, headers or {}, method=method)) as response:
+            return response.status, json.load(response)
+    except urllib.error.HTTPError as err:
+        return err.code, json.load(err)
+
+
+AUTHORIZED = {"Authorization": "Bearer secret"}
+
+
+def test_control_api_answers_with_the_token(control_url):
+    status, answer = request(f"{control_url}/status", headers=AUTHORIZED)
+
+    assert status == 200
+    assert answer["jobs"]["default"]["state"] == "running"
+
+
+@pytest.mark.parametrize("headers", [{}, {"Authorization": "Bearer wrong"}])
+def test_control_api_refuses_a_missing_or_wrong_token(control_url, headers):
+    assert request(f"{control_url}/status", headers=headers)[0] == 401
+
+
+def test_control_api_refuses_requests_from_web_pages(daemon, control_url):
+    headers = {**AUTHORIZED, "Origin": "https://example.com"}
+
+    assert request(f"{control_url}/pause", "POST", headers=headers)[0] == 403
+    assert not daemon.paused
+
+
+def test_control_api_refuses_a_body_that_isnt_json(daemon, control_url):
+    headers = {**AUTHORIZED, "Content-Type": "text/plain"}
+
+    assert request(f"{control_url}/pause", "POST", '{"job": "default"}', headers)[0] == 415
+    assert request(f"{control_url}/pause", "POST", '{"job": "default"}',
+                   {**AUTHORIZED, "Content-Type": "application/json"})[0] == 200
+
+
+def test_control_token_file_is_private(tmp_path):
+    path = tmp_path / "control_token"
+
+    token = create_control_token(str(path))
+
+    assert path.read_text(encoding="utf-8").strip() == token
+    assert stat.S_IMODE(path.stat().st_mode) == 0o600
@@ -0,0 +1,57 @@
+from types import SimpleNamespace
+
+import pytest
+
+from fleet import Quota, missing_slots, slot_usage
+from settings import ARM_SHAPE, E2_MICRO_SHAPE, parse_fleet
+
+
+def instance(shape, ocpus=1, memory=1, state="RUNNING"):
+    return SimpleNamespace(shape=shape, lifecycle_state=state,
+                           shape_config=SimpleNamespace(ocpus=ocpus, memory_in_gbs=memory))
+
+
+def test_parse_fleet_reads_counts_shapes_and_sizes():
+    assert parse_fleet("4xA1:1/6, 2xMICRO,1xA1") == [(4, ARM_SHAPE, 1.0, 6.0), (2, E2_MICRO_SHAPE, 1.0, 1.0),
+                                                     (1, ARM_SHAPE, 1.0, 6.0)]
+    assert parse_fleet("") == []
+
+
+@pytest.mark.parametrize("value", ["0xA1", "xA1", "2xBIG", "1xMICRO:1/1", "1xA1:one/6", "1xA1:0/6", "1xA1:1/0"])
+def test_parse_fleet_refuses_malformed_pieces(value):
+    with pytest.raises(ValueError):
+        parse_fleet(value)
+
+
+def test_quota_counts_live_instances_and_boot_volumes():
+    volumes = [SimpleNamespace(size_in_gbs=50, lifecycle_state="AVAILABLE"),
+               SimpleNamespace(size_in_gbs=100, lifecycle_state="TERMINATED")]
+    quota = Quota([instance(ARM_SHAPE, 2, 12), instance(E2_MICRO_SHAPE), instance(ARM_SHAPE, 2, 12, "TERMINATED")],
+                  volumes)
+
+    assert quota.remaining == {"a1_ocpus": 2, "a1_memory_gbs": 12, "micro_instances": 1, "boot_volume_gbs": 150}
+
+
+def test_quota_reserves_only_what_fits_and_takes_back_releases():
+    quota = Quota([], [])
+    slot = slot_usage(ARM_SHAPE, 2, 12, 50)
+
+    assert quota.reserve(slot)
+    assert quota.reserve(slot)
+    assert not quota.reserve(slot_usage(ARM_SHAPE, 1, 6, 50))
+    assert quota.reserve(slot_usage(E2_MICRO_SHAPE, 1, 1, 50))
+    # The boot volumes are at 150 of 200 GB now
+    assert not quota.reserve(slot_usage(E2_MICRO_SHAPE, 1, 1, 51))
+
+    quota.release(slot)
+    assert quota.remaining["a1_ocpus"] == 2
+    assert quota.reserve(slot_usage(ARM_SHAPE, 1, 6, 0))
+
+
+def test_existing_instances_fill_one_matching_slot_each():
+    fleet = [(2, ARM_SHAPE, 1.0, 6.0), (1, ARM_SHAPE, 2.0, 12.0), (2, E2_MICRO_SHAPE, 1.0, 1.0)]
+    instances = [instance(ARM_SHAPE, 1.0, 6.0), instance(ARM_SHAPE, 2.0, 12.0, "TERMINATED"),
+                 instance(E2_MICRO_SHAPE), instance(ARM_SHAPE, 4.0, 24.0)]
+
+    assert missing_slots(fleet, instances) == [(2, ARM_SHAPE, 1.0, 6.0), (3, ARM_SHAPE, 2.0, 12.0),
+                                               (5, E2_MICRO_SHAPE, 1.0, 1.0)]
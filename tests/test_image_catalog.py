@@ -0,0 +1,45 @@
+import datetime
+from types import SimpleNamespace
+
+from image_catalog import ImageCatalog, iter_images
+
+
+def image(image_id, os_version="22.04", day=1, state="AVAILABLE", operating_system="Canonical Ubuntu"):
+    return SimpleNamespace(id=image_id, display_name=image_id, lifecycle_state=state,
+                           operating_system=operating_system, operating_system_version=os_version,
+                           size_in_mbs=50000, time_created=datetime.datetime(2024, 1, day))
+
+
+def test_newest_available_image_of_every_version_is_kept(tmp_path):
+    catalog = ImageCatalog(str(tmp_path / "images_list.json"))
+
+    catalog.rebuild("A1", [image("old", day=1), image("newest", day=9), image("deleted", day=20, state="DELETED"),
+                           image("newer", day=5), image("noble", "24.04", day=2)])
+
+    assert catalog.lookup("A1", "Canonical Ubuntu", "22.04")["id"] == "newest"
+    assert catalog.lookup("A1", "Canonical Ubuntu", "24.04")["id"] == "noble"
+    assert catalog.lookup("A1", "Canonical Ubuntu", "20.04") is None
+    assert catalog.lookup("E2", "Canonical Ubuntu", "22.04") is None
+
+
+def test_index_is_reloaded_from_disk_and_expires(tmp_path, monkeypatch):
+    path = str(tmp_path / "images_list.json")
+    ImageCatalog(path).rebuild("A1", [image("newest")])
+    catalog = ImageCatalog(path)
+
+    assert catalog.lookup("A1", "Canonical Ubuntu", "22.04")["time_created"] == "2024-01-01T00:00:00"
+    assert catalog.is_fresh("A1", 3600)
+    assert not catalog.is_fresh("E2", 3600)
+    built_at = catalog.shapes["A1"]["built_at"]
+    monkeypatch.setattr("image_catalog.time.time", lambda: built_at + 3601)
+    assert not catalog.is_fresh("A1", 3600)
+
+
+def test_images_are_listed_across_pages():
+    pages = {None: (["a", "b"], "2"), "2": (["c"], None)}
+
+    def fetch_page(page):
+        data, next_page = pages[page]
+        return SimpleNamespace(data=data, next_page=next_page)
+
+    assert list(iter_images(fetch_page)) == ["a", "b", "c"]
@@ -0,0 +1,24 @@
+import os
+
+from json_file import read_json, write_json
+
+
+def test_written_object_is_read_back_without_temporary_files(tmp_path):
+    path = tmp_path / "store.json"
+
+    write_json(str(path), {"b": 1, "a": [2]}, sort_keys=True)
+    write_json(str(path), {"c": {"d": None}})
+
+    assert read_json(str(path)) == {"c": {"d": None}}
+    assert os.listdir(tmp_path) == ["store.json"]
+
+
+def test_missing_corrupt_or_non_object_files_read_as_empty(tmp_path):
+    corrupt = tmp_path / "corrupt.json"
+    corrupt.write_text('{"half": ', encoding="utf-8")
+    listed = tmp_path / "list.json"
+    listed.write_text("[1, 2]", encoding="utf-8")
+
+    assert read_json(str(tmp_path / "missing.json")) == {}
+    assert read_json(str(corrupt)) == {}
+    assert read_json(str(listed)) == {}
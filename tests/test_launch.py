@@ -0,0 +1,63 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import main
+from jobs import LaunchJob
+
+
+def launched(instance_id):
+    return SimpleNamespace(status=200, data=SimpleNamespace(id=instance_id))
+
+
+def test_failing_to_terminate_a_duplicate_keeps_the_first_launch(monkeypatch):
+    monkeypatch.setattr(main, "rate_limited_launch", lambda job, details, ad_policy: launched(details))
+    terminated = []
+
+    def terminate(job, client, method, instance_id):
+        terminated.append(instance_id)
+        raise RuntimeError("terminate_instance failed")
+
+    monkeypatch.setattr(main, "execute_oci_command", terminate)
+    job = LaunchJob("sweep", None, SimpleNamespace(compute=None), None)
+
+    response, errors = main.launch_in_all_availability_domains(job, ["AD-1", "AD-2", "AD-3"], lambda ad: ad)
+
+    assert response is not None
+    assert errors == []
+    # Every AD is attempted, and every launch but the kept one is terminated
+    assert sorted(terminated + [response.data.id]) == ["AD-1", "AD-2", "AD-3"]
+
+
+def grow_forever(job, instance):
+    """Stands in for a resize retrying capacity errors that never clear."""
+    while True:
+        job.sleep(0.05)
+        job.checkpoint()
+
+
+@pytest.fixture
+def growing(monkeypatch):
+    monkeypatch.setattr(main, "grow_instance_to_target", grow_forever)
+    job = LaunchJob("grow", SimpleNamespace(shape_grow_timeout=0.5), None, None)
+    main.grow_in_background(job, SimpleNamespace(id="instance"))
+    return job
+
+
+def test_a_resize_gives_up_after_its_timeout(growing):
+    started = time.monotonic()
+    main.stop_growing(wait=True)
+
+    assert 0.4 < time.monotonic() - started < 5
+    assert main.grow_threads == []
+    # Only the resize is cancelled, not the job, e.g. the rest of its fleet
+    assert not growing.cancelled.is_set()
+
+
+def test_stopping_without_waiting_gives_up_at_once(growing):
+    started = time.monotonic()
+    main.stop_growing(wait=False)
+
+    assert time.monotonic() - started < 0.4
+    assert main.grow_threads == []
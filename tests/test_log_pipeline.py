@@ -0,0 +1,93 @@
+import json
+import logging
+
+import pytest
+
+from log_pipeline import CollapsingHandler, LogPipeline
+
+
+def read_lines(path):
+    with open(path, encoding="utf-8") as log_file:
+        return [json.loads(line) for line in log_file]
+
+
+@pytest.fixture
+def pipeline(tmp_path):
+    running = LogPipeline(str(tmp_path / "info.log"), str(tmp_path / "launch.log"), "launch", 0, 0, 600)
+    running.start()
+    yield running
+    running.stop()
+
+
+def test_exceptions_are_written_apart_from_the_message(pipeline, tmp_path):
+    try:
+        raise RuntimeError("boom")
+    except RuntimeError:
+        logging.getLogger("launch.job").exception("Launch of %s failed", "job", extra={"ad": "AD-1"})
+    pipeline.stop()
+
+    entry, = read_lines(tmp_path / "launch.log")
+    assert entry["message"] == "Launch of job failed"
+    assert entry["ad"] == "AD-1"
+    assert entry["exception"].startswith("Traceback")
+    assert "RuntimeError: boom" in entry["exception"]
+
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+def record(created, key="capacity", name="launch.job", msg="Out of capacity"):
+    return logging.makeLogRecord({"name": name, "msg": msg, "levelno": logging.INFO, "levelname": "INFO",
+                                  "created": created, "collapse_key": key})
+
+
+@pytest.fixture
+def collapsed():
+    target = ListHandler()
+    return CollapsingHandler([target], interval=60), target.records
+
+
+def test_repeated_records_are_summarized_every_interval(collapsed):
+    collapser, forwarded = collapsed
+    for created in range(0, 100, 10):
+        collapser.handle(record(created))
+
+    assert [r.getMessage() for r in forwarded] == ["Out of capacity", "capacity repeated 6 times over 60 seconds"]
+    assert forwarded[1].collapsed == 6
+
+
+def test_a_different_record_ends_the_run_with_a_summary(collapsed):
+    collapser, forwarded = collapsed
+    for created in range(3):
+        collapser.handle(record(created))
+    collapser.handle(record(5, key=None, msg="Launched"))
+
+    assert [r.getMessage() for r in forwarded] == ["Out of capacity", "capacity repeated 2 times over 2 seconds",
+                                                   "Launched"]
+
+
+def test_loggers_are_collapsed_separately(collapsed):
+    collapser, forwarded = collapsed
+    for created in range(3):
+        collapser.handle(record(created, name="launch.a"))
+        collapser.handle(record(created, name="launch.b"))
+
+    assert [r.name for r in forwarded] == ["launch.a", "launch.b"]
+
+
+def test_flush_writes_the_pending_summaries(collapsed):
+    collapser, forwarded = collapsed
+    for created in range(4):
+        collapser.handle(record(created))
+
+    collapser.flush()
+
+    assert forwarded[-1].getMessage() == "capacity repeated 3 times over 3 seconds"
+    collapser.handle(record(10))
+    assert forwarded[-1].getMessage() == "Out of capacity"
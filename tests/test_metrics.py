@@ -0,0 +1,30 @@
+import json
+import time
+
+from metrics import Metrics, start_snapshot_writer
+
+
+def test_prometheus_escapes_label_values():
+    metrics = Metrics()
+    metrics.inc("oci_calls_total", outcome='say "hi"\\now\n')
+
+    assert 'oci_calls_total{outcome="say \\"hi\\"\\\\now\\n"} 1' in metrics.prometheus()
+
+
+def test_snapshots_are_rotated(tmp_path):
+    metrics = Metrics()
+    metrics.inc("launch_attempts_total")
+    path = tmp_path / "metrics.jsonl"
+
+    stop = start_snapshot_writer(metrics, str(path), 0.01, max_bytes=2000, backup_count=2)
+    deadline = time.monotonic() + 5
+    while not (tmp_path / "metrics.jsonl.2.gz").exists() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    stop.set()
+    # Let the writer finish the snapshot in progress
+    time.sleep(0.1)
+
+    assert sorted(file.name for file in tmp_path.iterdir()) == ["metrics.jsonl", "metrics.jsonl.1.gz",
+                                                                 "metrics.jsonl.2.gz"]
+    assert path.stat().st_size <= 2000
+    assert json.loads(path.read_text(encoding="utf-8").splitlines()[0])["counters"]["launch_attempts_total"]
@@ -0,0 +1,54 @@
+import time
+
+import pytest
+
+from notifications import Notification, NotificationDispatcher
+
+
+class FlakyBackend:
+    """Fails once on each text of fail_on, with an error a webhook payload could raise."""
+
+    name = "chat"
+
+    def __init__(self, fail_on=()):
+        self.fail_on = list(fail_on)
+        self.sent = []
+
+    def messages(self, notifications):
+        return [n.text for n in notifications]
+
+    def send(self, text):
+        if text in self.fail_on:
+            self.fail_on.remove(text)
+            raise ValueError(f"can't send {text}")
+        self.sent.append(text)
+
+    def close(self):
+        pass
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr("notifications.time.sleep", lambda seconds: None)
+
+
+def test_retry_only_sends_what_was_not_delivered():
+    backend = FlakyBackend(fail_on=["second"])
+
+    NotificationDispatcher([backend])._deliver([Notification("first"), Notification("second")])
+
+    assert backend.sent == ["first", "second"]
+
+
+def test_unexpected_errors_keep_the_dispatcher_running():
+    backend = FlakyBackend(fail_on=["lost"] * 3)
+    dispatcher = NotificationDispatcher([backend], batch_window=0)
+
+    dispatcher.notify("lost")
+    deadline = time.monotonic() + 5
+    while backend.fail_on and time.monotonic() < deadline:
+        pass
+    dispatcher.notify("delivered")
+    dispatcher.close()
+
+    assert backend.sent == ["delivered"]
@@ -0,0 +1,51 @@
+import threading
+import tracemalloc
+
+import pytest
+
+from profiling import Profiler
+
+
+@pytest.fixture
+def profiler(tmp_path):
+    running = Profiler(str(tmp_path))
+    yield running
+    tracemalloc.stop()
+
+
+def test_concurrent_phases_profile_one_thread_and_time_the_other(profiler, tmp_path):
+    entered = threading.Event()
+    release = threading.Event()
+    errors = []
+
+    def first():
+        try:
+            with profiler.phase("launch"):
+                entered.set()
+                release.wait(5)
+        except Exception as err:
+            errors.append(err)
+
+    thread = threading.Thread(target=first)
+    thread.start()
+    entered.wait(5)
+    with profiler.phase("launch"):
+        pass
+    release.set()
+    thread.join(5)
+
+    assert errors == []
+    runs, seconds, profiled = profiler.timings["launch"]
+    assert (runs, profiled) == (2, 1)
+    target = profiler.dump()
+    assert (tmp_path / target / "launch.pstats").exists()
+    assert "launch" in (tmp_path / target / "phases.txt").read_text(encoding="utf-8")
+
+
+def test_profiler_is_free_again_after_a_phase(profiler):
+    with profiler.phase("discover"):
+        pass
+    with profiler.phase("discover"):
+        pass
+
+    assert profiler.timings["discover"] == [2, pytest.approx(0, abs=1), 2]
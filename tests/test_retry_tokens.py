@@ -0,0 +1,65 @@
+import shutil
+from pathlib import Path
+
+import pytest
+
+import fake_oci
+import main
+from jobs import DEFAULT_JOB
+from retry_tokens import RetryTokenStore
+from settings import Settings
+
+
+def test_token_is_replayed_until_resolved(tmp_path):
+    store = RetryTokenStore(str(tmp_path / "launch_tokens.json"))
+    token = store.token_for("job|AD-1|shape|4|24")
+    store.keep("job|AD-1|shape|4|24", token)
+
+    assert store.token_for("job|AD-1|shape|4|24") == token
+    assert store.token_for("job|AD-1|shape|2|12") != token
+    assert RetryTokenStore(str(tmp_path / "launch_tokens.json")).is_pending("job|AD-1|shape|4|24")
+
+    store.resolve("job|AD-1|shape|4|24")
+
+    assert not store.is_pending("job|AD-1|shape|4|24")
+    assert store.token_for("job|AD-1|shape|4|24") != token
+
+
+def test_expired_tokens_are_dropped(tmp_path):
+    store = RetryTokenStore(str(tmp_path / "launch_tokens.json"))
+    store.keep("key", "token")
+
+    assert not RetryTokenStore(str(tmp_path / "launch_tokens.json"), ttl=0).is_pending("key")
+
+
+@pytest.fixture
+def fake_tenancy(tmp_path, monkeypatch):
+    """fake_oci.FakeTenancy: A tenancy with capacity whose launches all answer 504 although they went through."""
+    monkeypatch.chdir(tmp_path)
+    shutil.copy(Path(main.__file__).with_name("email_content.html"), tmp_path)
+    model = fake_oci.CapacityModel({"AD-1": 1.0}, rate_limit_per_min=0, server_error_rate=0,
+                                   ambiguous_success_rate=1.0, horizon=24 * 3600, seed=0)
+    clock = fake_oci.SimulatedClock()
+    tenancy = fake_oci.FakeTenancy(model, clock)
+    yield tenancy
+    fake_oci.SimulatedClock.uninstall()
+    # init_runtime() set these up process wide, don't leave its DNS cache to the other tests
+    main.notifier.close()
+    main.runner_group.leave()
+    main.transport.close()
+
+
+def test_ambiguous_launch_is_replayed_after_the_ladder_stepped_down(oci_env, fake_tenancy):
+    job_config = Settings({**oci_env, "SHAPE_LADDER": "4/24,2/12", "SHAPE_LADDER_STEP_MINUTES": "1",
+                           "REQUEST_WAIT_TIME_SECS": "240"})
+    main.init_runtime(job_config)
+    job, = main.create_jobs([(DEFAULT_JOB, job_config)], fake_oci.FakeClients(fake_tenancy))
+    fake_tenancy.clock.install()
+
+    instance = main.launch_instance(job)
+
+    # The 504 backoff outlasts the rung, but the 4 OCPU launch is settled rather than a 2 OCPU one sent
+    assert instance is not None
+    assert instance.shape_config.ocpus == 4
+    assert len(fake_tenancy.instances) == 1
+    assert not main.retry_tokens.pending
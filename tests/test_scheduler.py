@@ -0,0 +1,155 @@
+import random
+import threading
+import time
+
+import pytest
+
+import main
+import scheduler as scheduler_module
+from jobs import JobCancelled, LaunchJob
+from scheduler import OUT_OF_CAPACITY, SERVER_ERROR, THROTTLED, CircuitBreaker, RetryScheduler
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(scheduler_module.time, "monotonic", fake.monotonic)
+    monkeypatch.setattr(scheduler_module.time, "sleep", fake.sleep)
+    return fake
+
+
+@pytest.fixture
+def scheduler():
+    random.seed(0)
+    return RetryScheduler(base_wait=10, capacity_wait=30, max_wait=120, rate_limit_per_minute=60)
+
+
+def test_backoff_doubles_with_equal_jitter_up_to_max_wait(scheduler):
+    for attempt in range(8):
+        ceiling = min(120, 10 * 2 ** attempt)
+        delay = scheduler.record_error(THROTTLED)
+        assert ceiling / 2 <= delay <= ceiling
+
+
+def test_success_resets_the_backoff(scheduler):
+    for _ in range(5):
+        scheduler.record_error(SERVER_ERROR)
+    scheduler.record_success()
+
+    assert scheduler.record_error(SERVER_ERROR) <= 10
+
+
+def test_capacity_errors_retry_on_a_jittered_fixed_cadence(scheduler):
+    for _ in range(20):
+        assert 24 <= scheduler.record_error(OUT_OF_CAPACITY) <= 36
+
+
+def test_throttling_halves_the_rate_and_other_calls_recover_it(scheduler):
+    scheduler.record_error(THROTTLED)
+    scheduler.record_error(THROTTLED)
+    assert scheduler.bucket.rate_per_minute == 15
+
+    scheduler.record_success()
+    assert scheduler.bucket.rate_per_minute == 21
+    for _ in range(10):
+        scheduler.record_success()
+    assert scheduler.bucket.rate_per_minute == 60
+
+
+def test_server_errors_leave_the_rate_alone(scheduler):
+    for _ in range(3):
+        scheduler.record_error(SERVER_ERROR)
+
+    assert scheduler.bucket.rate_per_minute == 60
+
+
+def test_reconfigure_keeps_the_streak_under_the_new_ceiling(scheduler):
+    for _ in range(3):
+        scheduler.record_error(THROTTLED)
+
+    scheduler.reconfigure(base_wait=10, capacity_wait=30, max_wait=20, rate_limit_per_minute=120)
+
+    assert 10 <= scheduler.record_error(THROTTLED) <= 20
+    assert scheduler.configured_rate_limit == 120
+    assert scheduler.bucket.burst == 20
+
+
+def test_a_larger_share_is_taken_up_gradually(scheduler):
+    scheduler.set_share(0.5)
+    assert scheduler.bucket.rate_per_minute == 30
+
+    scheduler.set_share(1)
+    assert scheduler.bucket.rate_per_minute == 30
+    scheduler.record_success()
+    assert scheduler.bucket.rate_per_minute == 36
+
+
+def test_breaker_opens_after_threshold_server_errors(clock):
+    breaker = CircuitBreaker(threshold=3, cooldown=60)
+
+    assert breaker.record_failure() == 0
+    assert breaker.record_failure() == 0
+    assert breaker.wait() == 0
+    assert breaker.record_failure() == 60
+    assert breaker.wait() == 60
+    assert breaker.wait() == 0
+
+
+def test_failed_probe_doubles_the_cooldown_up_to_the_maximum(clock):
+    breaker = CircuitBreaker(threshold=2, cooldown=60, max_cooldown=200)
+    breaker.record_failure()
+
+    assert [breaker.record_failure() for _ in range(4)] == [60, 120, 200, 200]
+
+
+def test_successful_probe_closes_the_breaker(clock):
+    breaker = CircuitBreaker(threshold=2, cooldown=60)
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.wait()
+
+    breaker.record_success()
+
+    assert breaker.record_failure() == 0
+    assert breaker.record_failure() == 60
+
+
+def test_disabled_breaker_never_opens(clock):
+    breaker = CircuitBreaker(threshold=0, cooldown=60)
+
+    assert [breaker.record_failure() for _ in range(10)] == [0] * 10
+
+
+def test_capacity_errors_close_the_schedulers_breaker(clock):
+    retry_scheduler = RetryScheduler(10, 30, 120, 0, breaker_threshold=2, breaker_cooldown=60)
+    retry_scheduler.record_error(SERVER_ERROR)
+    retry_scheduler.record_error(OUT_OF_CAPACITY)
+    retry_scheduler.record_error(SERVER_ERROR)
+
+    assert retry_scheduler.breaker.wait() == 0
+    retry_scheduler.record_error(SERVER_ERROR)
+    assert retry_scheduler.breaker.wait() == 60
+
+
+def test_cancelling_a_job_ends_its_breaker_cooldown():
+    retry_scheduler = RetryScheduler(10, 30, 120, 0, breaker_threshold=1, breaker_cooldown=30)
+    retry_scheduler.record_error(SERVER_ERROR)
+    job = LaunchJob("cancelled", None, None, retry_scheduler)
+    threading.Timer(0.3, job.cancelled.set).start()
+
+    started = time.monotonic()
+    with pytest.raises(JobCancelled):
+        main.acquire_rate_limit(job)
+
+    assert time.monotonic() - started < 5
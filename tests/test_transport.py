@@ -0,0 +1,17 @@
+import socket
+
+import transport
+from transport import Transport, install_dns_cache
+
+
+def test_close_restores_the_system_resolver():
+    shared = Transport(1, 1)
+    install_dns_cache(60)
+    session = shared.http_session
+    assert socket.getaddrinfo is transport.cached_getaddrinfo
+
+    shared.close()
+
+    assert socket.getaddrinfo is transport._system_getaddrinfo
+    assert shared.http_session is not session
+    shared.close()
@@ -0,0 +1,124 @@
+import socket
+import threading
+import time
+
+_system_getaddrinfo = socket.getaddrinfo
+_dns_cache = {}
+_dns_lock = threading.Lock()
+_dns_ttl = 0.0
+
+
+def cached_getaddrinfo(host, port, family=0, type=0, proto=0, flags=0):
+    """socket.getaddrinfo with the answers kept for the DNS cache TTL.
+
+    Failed lookups are not cached.
+    """
+    key = (host, port, family, type, proto, flags)
+    now = time.monotonic()
+    with _dns_lock:
+        entry = _dns_cache.get(key)
+    if entry and entry[0] > now:
+        return entry[1]
+    addresses = _system_getaddrinfo(host, port, family, type, proto, flags)
+    with _dns_lock:
+        _dns_cache[key] = (now + _dns_ttl, addresses)
+    return addresses
+
+
+def install_dns_cache(ttl):
+    """Cache DNS answers process wide for ttl seconds.
+
+    Every launch attempt otherwise resolves the OCI endpoint again before reusing
+    a pooled connection. 0 restores the system resolver.
+
+    Args:
+        ttl (float): Seconds to keep an answer.
+    """
+    global _dns_ttl
+    with _dns_lock:
+        _dns_ttl = float(ttl)
+        _dns_cache.clear()
+    socket.getaddrinfo = cached_getaddrinfo if ttl > 0 else _system_getaddrinfo
+
+
+class Transport:
+    """Shared HTTP connections and timeouts for every outbound call.
+
+    The OCI clients share one keep-alive pool, so TLS sessions are reused across
+    launch attempts instead of renegotiated per client, and the notification
+    webhooks share another. Sessions are built on first use.
+
+    Args:
+        connect_timeout (float): Seconds to wait for a connection.
+        read_timeout (float): Seconds to wait for a response.
+        pool_size (int, optional): Connections kept alive per host. Defaults to 10.
+    """
+
+    def __init__(self, connect_timeout, read_timeout, pool_size=10):
+        self.timeout = (connect_timeout, read_timeout)
+        self.pool_size = pool_size
+        self.lock = threading.Lock()
+        self._oci_session = None
+        self._http_session = None
+
+    @property
+    def oci_session(self):
+        """requests.Session: The session mounted with the OCI SDK's HTTPS adapter."""
+        with self.lock:
+            if self._oci_session is None:
+                import requests
+                from oci.base_client import OCIHTTPAdapter
+
+                self._oci_session = requests.Session()
+                self._oci_session.mount("https://", OCIHTTPAdapter(pool_connections=self.pool_size,
+                                                                   pool_maxsize=self.pool_size))
+            return self._oci_session
+
+    @property
+    def http_session(self):
+        """requests.Session: The session used by the Discord and Telegram webhooks."""
+        with self.lock:
+            if self._http_session is None:
+                import requests
+
+                self._http_session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(pool_connections=self.pool_size,
+                                                        pool_maxsize=self.pool_size)
+                self._http_session.mount("https://", adapter)
+            return self._http_session
+
+    def client_kwargs(self):
+        """Keyword arguments for an OCI client constructor.
+
+        Retries are left to the RetryScheduler so the SDK doesn't retry on its own.
+
+        Returns:
+            dict: The timeout and retry_strategy arguments.
+        """
+        import oci
+
+        return {"timeout": self.timeout, "retry_strategy": oci.retry.NoneRetryStrategy()}
+
+    def attach(self, client):
+        """Route an OCI client through the shared connection pool.
+
+        Args:
+            client: An OCI service client.
+
+        Returns:
+            The client.
+        """
+        client.base_client.session = self.oci_session
+        return client
+
+    def close(self):
+        """Close every pooled connection and restore the system resolver.
+
+        Safe to call more than once, the sessions are built again if used afterwards.
+        """
+        with self.lock:
+            for session in (self._oci_session, self._http_session):
+                if session is not None:
+                    session.close()
+            self._oci_session = self._http_session = None
+        install_dns_cache(0)